@@ -0,0 +1,3 @@
+"""
+Benchmarks for sgl. See run.py, or run "python -m benchmarks --help".
+"""
@@ -0,0 +1,79 @@
+"""
+Seeded generators of synthetic rules, groups and directories. Every generator takes a
+random.Random, so the same seed always produces the same workload.
+"""
+import random
+from typing import List
+
+from sgl.condition import Condition
+from sgl.principal import Principal
+from sgl.rule import Rule
+
+
+def role_names(count: int) -> List[str]:
+    return [f"role{i}" for i in range(count)]
+
+
+def _role(rand: random.Random, roles: List[str]) -> str:
+    # A few roles are much more popular than the rest, as in real directories.
+    return roles[min(int(rand.expovariate(1.0 / max(len(roles) / 4, 1))), len(roles) - 1)]
+
+
+def quorum_condition(rand: random.Random, roles: List[str], leaves: int = 3, max_n: int = 3) -> Condition:
+    """
+    A multi-signature rule: an "all" of role quorums, such as 2 managers and 1 auditor.
+    """
+    return Condition(all=[Condition(roles=_role(rand, roles), n=rand.randint(1, max_n)) for i in range(leaves)])
+
+
+def wide_any_condition(rand: random.Random, roles: List[str], width: int = 20) -> Condition:
+    """
+    An "any" over many alternatives, some of which need more than one holder.
+    """
+    children = []
+    for i in range(width):
+        if rand.random() < 0.2:
+            children.append(Condition(id=f"user{rand.randrange(1000)}"))
+        else:
+            children.append(Condition(roles=_role(rand, roles), n=rand.randint(1, 2)))
+    return Condition(any=children, n=rand.randint(1, 2))
+
+
+def deep_condition(rand: random.Random, roles: List[str], depth: int = 4, fanout: int = 3) -> Condition:
+    """
+    Alternating levels of "all" and "any", down to role and id leaves.
+    """
+    if depth == 0:
+        if rand.random() < 0.1:
+            return Condition(id=f"user{rand.randrange(1000)}")
+        return Condition(roles=_role(rand, roles), n=rand.randint(1, 2))
+    children = [deep_condition(rand, roles, depth - 1, fanout) for i in range(rand.randint(2, fanout))]
+    if depth % 2:
+        return Condition(any=children)
+    return Condition(all=children)
+
+
+SHAPES = {
+    "quorum": quorum_condition,
+    "wide_any": wide_any_condition,
+    "deep": deep_condition,
+}
+
+
+def make_rules(rand: random.Random, count: int, roles: List[str], shapes: List[str] = None) -> List[Rule]:
+    shapes = shapes or sorted(SHAPES)
+    privs = [f"priv{i}" for i in range(max(count // 4, 1))]
+    return [Rule([rand.choice(privs)], SHAPES[rand.choice(shapes)](rand, roles)) for i in range(count)]
+
+
+def make_principal(rand: random.Random, roles: List[str], number: int) -> Principal:
+    held = {_role(rand, roles) for i in range(rand.randint(1, 3))}
+    return Principal(id=f"user{number}", roles=sorted(held))
+
+
+def make_directory(rand: random.Random, size: int, roles: List[str]) -> List[Principal]:
+    return [make_principal(rand, roles, i) for i in range(size)]
+
+
+def make_group(rand: random.Random, size: int, directory: List[Principal]) -> List[Principal]:
+    return rand.sample(directory, min(size, len(directory)))
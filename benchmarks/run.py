@@ -0,0 +1,198 @@
+"""
+Measure evaluation, parsing and serialization across scales, and emit the results as JSON.
+
+    python -m benchmarks --output before.json
+    ... change something ...
+    python -m benchmarks --output after.json
+    python -m benchmarks --compare before.json after.json
+
+Every result is keyed by benchmark name and parameters, and reports microseconds per operation
+(the best and the median of several repeats), so runs of different versions can be compared.
+"""
+import argparse
+import json
+import platform
+import random
+import statistics
+import sys
+import time
+from typing import Callable, List
+
+from sgl.api import satisfies, satisfies_many
+from sgl.binary import encode, decode
+from sgl.budget import Budget, BudgetExceeded
+from sgl.bulk import load_rules
+from sgl.condition import Condition
+from sgl.rule import Rule
+
+from .generators import SHAPES, role_names, make_rules, make_directory, make_group
+
+
+def _version() -> str:
+    try:
+        from importlib.metadata import version
+        return version("sgl")
+    except Exception:
+        return "unknown"
+
+
+def measure(fn: Callable[[], int], repeat: int = 5) -> dict:
+    """
+    Call fn repeat times. fn returns how many operations it did; report microseconds per operation.
+    """
+    per_op = []
+    for i in range(repeat):
+        started = time.perf_counter()
+        ops = fn()
+        per_op.append((time.perf_counter() - started) / max(ops, 1) * 1e6)
+    return {"best_us": min(per_op), "median_us": statistics.median(per_op)}
+
+
+def bench_satisfies(rand: random.Random, sizes: List[int], rules_per_shape: int, repeat: int,
+                    seconds: float) -> List[dict]:
+    """
+    Time satisfies() for each rule shape, in both modes, as groups grow. Checks that exhaust a
+    Budget of seconds are counted rather than allowed to stall the run.
+    """
+    roles = role_names(8)
+    directory = make_directory(rand, max(sizes) * 4, roles)
+    results = []
+    for shape in sorted(SHAPES):
+        rules = make_rules(rand, rules_per_shape, roles, [shape])
+        for size in sizes:
+            groups = [make_group(rand, size, directory) for i in range(4)]
+            for disjoint in [True, False]:
+                exceeded = 0
+
+                def run():
+                    nonlocal exceeded
+                    for group in groups:
+                        for rule in rules:
+                            try:
+                                satisfies(group, rule, disjoint, budget=Budget(seconds=seconds))
+                            except BudgetExceeded:
+                                exceeded += 1
+                    return len(groups) * len(rules)
+                result = measure(run, repeat)
+                result.update(benchmark="satisfies", shape=shape, group_size=size, disjoint=disjoint,
+                              exceeded=exceeded)
+                results.append(result)
+    return results
+
+
+def bench_batch(rand: random.Random, size: int, count: int, repeat: int) -> List[dict]:
+    """
+    Compare satisfies_many() with a loop over satisfies() for the same pairs.
+    """
+    roles = role_names(8)
+    directory = make_directory(rand, size * 4, roles)
+    rules = make_rules(rand, count, roles, ["quorum", "wide_any"])
+    groups = [make_group(rand, size, directory) for i in range(8)]
+    pairs = [(group, rule) for group in groups for rule in rules]
+
+    def loop():
+        for group, rule in pairs:
+            satisfies(group, rule)
+        return len(pairs)
+
+    def batch():
+        satisfies_many(pairs)
+        return len(pairs)
+    return [dict(measure(loop, repeat), benchmark="satisfies_loop", group_size=size, pairs=len(pairs)),
+            dict(measure(batch, repeat), benchmark="satisfies_many", group_size=size, pairs=len(pairs))]
+
+
+def bench_codec(rand: random.Random, counts: List[int], repeat: int) -> List[dict]:
+    """
+    Time parsing and serialization of rule sets of increasing size.
+    """
+    roles = role_names(16)
+    results = []
+    for count in counts:
+        rules = make_rules(rand, count, roles)
+        dicts = [rule.to_dict() for rule in rules]
+        conditions = [d["when"] for d in dicts]
+        texts = [json.dumps(c) for c in conditions]
+        rule_texts = [json.dumps(x) for x in dicts]
+        blob = encode(rules)
+        cases = {
+            "condition_from_dict": lambda: [Condition.from_dict(x) for x in conditions],
+            "condition_from_json": lambda: [Condition.from_json(x) for x in texts],
+            "rule_from_dict": lambda: [Rule.from_dict(x) for x in dicts],
+            "rule_from_json": lambda: [Rule.from_json(x) for x in rule_texts],
+            "rule_from_binary": lambda: decode(blob),
+            "rule_bulk_load": lambda: load_rules(dicts),
+            "rule_to_dict": lambda: [x.to_dict() for x in rules],
+            "rule_to_json": lambda: [x.to_json() for x in rules],
+            "rule_to_binary": lambda: encode(rules),
+        }
+        for name, fn in cases.items():
+            # Every case handles count rules, whether one at a time or as a whole document.
+            result = measure(lambda: fn() and count, repeat)
+            result.update(benchmark=name, rules=count)
+            if name == "rule_from_json":
+                result.update(payload_bytes=sum(len(x) for x in rule_texts))
+            elif name == "rule_from_binary":
+                result.update(payload_bytes=len(blob))
+            results.append(result)
+    return results
+
+
+def run(seed: int = 0, quick: bool = False) -> dict:
+    rand = random.Random(seed)
+    repeat = 3 if quick else 5
+    sizes = [2, 4, 8] if quick else [2, 4, 8, 16, 32, 64]
+    results = []
+    results += bench_satisfies(rand, sizes, 2 if quick else 10, repeat, 0.5 if quick else 2.0)
+    results += bench_batch(rand, 8 if quick else 32, 4 if quick else 25, repeat)
+    results += bench_codec(rand, [10] if quick else [100, 1000, 10000], repeat)
+    return {
+        "meta": {"sgl_version": _version(), "python": platform.python_version(),
+                 "implementation": platform.python_implementation(), "platform": platform.platform(),
+                 "seed": seed, "quick": quick, "timestamp": time.time()},
+        "results": results,
+    }
+
+
+def _key(result: dict) -> tuple:
+    return tuple(sorted((k, v) for k, v in result.items() if not k.endswith("_us") and k != "exceeded"))
+
+
+def compare(before: dict, after: dict) -> List[dict]:
+    """
+    Pair up results from two runs and report the ratio of their median times (above 1 is slower).
+    """
+    old = {_key(x): x for x in before["results"]}
+    answer = []
+    for result in after["results"]:
+        previous = old.get(_key(result))
+        if previous and previous["median_us"]:
+            row = {k: v for k, v in _key(result)}
+            row.update(before_us=previous["median_us"], after_us=result["median_us"],
+                       ratio=result["median_us"] / previous["median_us"])
+            answer.append(row)
+    return answer
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--quick", action="store_true", help="small scales, for a smoke test")
+    parser.add_argument("--output", help="write results here instead of to stdout")
+    parser.add_argument("--compare", nargs=2, metavar=("BEFORE", "AFTER"), help="compare two result files")
+    args = parser.parse_args(argv)
+    if args.compare:
+        with open(args.compare[0]) as f:
+            before = json.load(f)
+        with open(args.compare[1]) as f:
+            after = json.load(f)
+        answer = compare(before, after)
+    else:
+        answer = run(args.seed, args.quick)
+    text = json.dumps(answer, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+    else:
+        sys.stdout.write(text + "\n")
@@ -38,6 +38,9 @@ setup(
     packages=["sgl"],
     #include_package_data=True,      -- write a MANIFEST.in with glob patterns if uncommented
     install_requires=[],
+    extras_require={
+        "vectorized": ["numpy"],
+    },
     entry_points={
         "console_scripts": [
             "realpython=reader.__main__:main",
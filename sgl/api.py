@@ -1,10 +1,17 @@
+import hashlib
+import itertools
 import json
-from typing import Sequence, Union, List, Set
+import threading
+import time
+from array import array
+from collections import OrderedDict, deque
+from typing import Dict, Iterable, Iterator, Sequence, Tuple, Union, List, Set
 
 from .dbc import *
 from .principal import Principal
 from .rule import Rule
 from .condition import Condition
+from . import instrument as _instrument
 
 
 class CustomJSONEncoder(json.JSONEncoder):
@@ -14,26 +21,122 @@ class CustomJSONEncoder(json.JSONEncoder):
         return json.JSONEncoder.default(self, o)
 
 
-def _unique_combinations(items, n):
-    if n == 0:
-        yield []
-    else:
-        for i in range(len(items)):
-            for cc in _unique_combinations(items[i + 1:], n - 1):
-                yield [items[i]] + cc
+def _popcount(mask: int) -> int:
+    return bin(mask).count("1")
+
+
+if hasattr(int, "bit_count"):
+    _popcount = int.bit_count
+
+
+def _comb(n: int, k: int) -> int:
+    """
+    The number of ways to choose k of n things, like math.comb() (which is new in python 3.8). We
+    use this one everywhere, so budgets and estimates come out the same on every python.
+    """
+    if k < 0 or k > n:
+        return 0
+    k = min(k, n - k)
+    answer = 1
+    for i in range(1, k + 1):
+        answer = answer * (n - k + i) // i
+    return answer
 
 
-def _flatten_to_single_set(list_of_sets: List[set]) -> set:
-    flat = set()
-    for subset in list_of_sets:
-        flat = flat.union(subset)
+def _bits(mask: int) -> List[int]:
+    """
+    Split a bitmask into a list of single-bit masks, lowest bit first.
+    """
+    answer = []
+    while mask:
+        low = mask & -mask
+        answer.append(low)
+        mask ^= low
+    return answer
+
+
+def _union(masks) -> int:
+    flat = 0
+    for mask in masks:
+        flat |= mask
     return flat
 
 
+class _GroupIndex:
+    """
+    Map a group to bit positions once, so subsets of it can be carried around as int bitmasks.
+    Union, difference and disjointness of subsets then become single integer operations. Masks
+    of the members that have each id and each role are built on first use, in one pass; the mask
+    for a condition on a custom property is built the first time that condition asks for it.
+    """
+    __slots__ = ['group', 'members', 'full', '_by_id', '_by_role', '_by_prop']
+
+    def __init__(self, group: Set[Principal], canonical=False):
+        self.group = group
+        # A canonical order makes masks mean the same thing whenever we see the same group again.
+        self.members = sorted(group, key=Principal.key) if canonical else list(group)
+        self.full = (1 << len(self.members)) - 1
+        self._by_id = self._by_role = self._by_prop = None
+
+    def ids(self) -> dict:
+        if self._by_id is None:
+            by_id = {}
+            for i, p in enumerate(self.members):
+                if p.id:
+                    by_id[p.id] = by_id.get(p.id, 0) | (1 << i)
+            self._by_id = by_id
+        return self._by_id
+
+    def roles(self) -> dict:
+        if self._by_role is None:
+            by_role = {}
+            for i, p in enumerate(self.members):
+                if p.roles:
+                    bit = 1 << i
+                    for role in p.roles:
+                        by_role[role] = by_role.get(role, 0) | bit
+            self._by_role = by_role
+        return self._by_role
+
+    def id_mask(self, id: str) -> int:
+        return self.ids().get(id, 0)
+
+    def role_mask(self, role: str) -> int:
+        return self.roles().get(role, 0)
+
+    def prop_mask(self, c: Condition) -> int:
+        by_prop = self._by_prop
+        if by_prop is None:
+            by_prop = self._by_prop = {}
+        mask = by_prop.get(c)
+        if mask is None:
+            test = c.test()
+            mask = 0
+            for i, p in enumerate(self.members):
+                if test(p):
+                    mask |= 1 << i
+            by_prop[c] = mask
+        return mask
+
+    def leaf_mask(self, c: Condition) -> int:
+        """
+        Return the mask of the members that satisfy an id, roles or custom property leaf.
+        """
+        if c.id:
+            return self.ids().get(c.id, 0)
+        if c.roles:
+            return self.roles().get(c.roles, 0)
+        return self.prop_mask(c)
+
+    def to_set(self, mask: int) -> Set[Principal]:
+        members = self.members
+        return {members[bit.bit_length() - 1] for bit in _bits(mask)}
+
+
 def _get_min_group_size(cond):
     if cond.id:
         return 1
-    elif cond.roles:
+    elif cond.roles or cond.prop:
         return cond.n
     elif cond.any:
         n = 1000000000
@@ -49,7 +152,84 @@ def _get_min_group_size(cond):
         return n
 
 
-def _get_matching_minimal_subsets(group: Set[Principal], c: Condition) -> List[Set[Principal]]:
+class SubsetMemo:
+    """
+    A bounded, thread-safe memo of disjoint-search subproblems that can be shared across calls to
+    satisfies(). Entries are keyed by the group's fingerprint, the structure of the subcondition and
+    the part of the group that remains, so they stay valid no matter which Condition objects are
+    used to ask the question. The least recently used entries are dropped first.
+    """
+
+    def __init__(self, maxsize: int = 10000):
+        precondition(isinstance(maxsize, int) and maxsize > 0, '"maxsize" must be a positive integer.')
+        self.maxsize = maxsize
+        self.hits = self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+class _Search:
+    """
+    State for one disjoint search: the indexed group, memos of the subproblems already solved
+    (or already known to be solvable) during this search, optionally a SubsetMemo shared with
+    other searches, optionally a Budget (see sgl.budget) that the search is charged against, and
+    optionally the SearchStats (see sgl.instrument) it reports to.
+    """
+    __slots__ = ['index', 'memo', 'found', 'shared', 'budget', 'stats', 'fingerprint', '_rest_sizes']
+
+    def __init__(self, index: _GroupIndex, shared: SubsetMemo = None, budget=None, stats=None):
+        self.index = index
+        self.memo = {}
+        self.found = {}
+        self.shared = shared
+        self.budget = budget
+        self.stats = stats
+        self.fingerprint = _group_digest(index.group) if shared is not None else None
+        self._rest_sizes = {}
+
+    def rest_min_size(self, c: Condition, start: int) -> int:
+        """
+        Return the minimum group size needed to satisfy c.all[start:].
+        """
+        sizes = self._rest_sizes.get(id(c))
+        if sizes is None:
+            sizes = [0] * (len(c.all) + 1)
+            for i in range(len(c.all) - 1, -1, -1):
+                sizes[i] = sizes[i + 1] + _get_min_group_size(c.all[i])
+            self._rest_sizes[id(c)] = sizes
+        return sizes[start]
+
+    def shared_key(self, c: Condition, start: int, group: int, exists=False) -> tuple:
+        # Conditions hash and compare by structure, so equivalent subconditions share entries.
+        return (self.fingerprint, c, start, group, exists)
+
+
+def _get_matching_minimal_subsets(group: Set[Principal], c: Condition,
+                                  memo: SubsetMemo = None) -> List[Set[Principal]]:
     """
     Return a list of all minimal subsets of the group that match a condition. "Minimal" means that
     any group members unnecessary to the match have been stripped out, though some matches may take
@@ -61,49 +241,89 @@ def _get_matching_minimal_subsets(group: Set[Principal], c: Condition) -> List[S
     items in the outer container. (The uniqueness is already enforced by our algorithm; we don't
     need the set datatype to do it for us as well.)
     """
+    index = _GroupIndex(group, canonical=memo is not None)
+    search = _Search(index, memo)
+    return [index.to_set(mask) for mask in _get_matching_minimal_masks(search, index.full, c)]
+
+
+def _get_matching_minimal_masks(search: _Search, group: int, c: Condition, start: int = 0) -> List[int]:
+    """
+    The workhorse behind _get_matching_minimal_subsets. The group and the subsets we return are
+    bitmasks over search.index.members, so we never allocate sets of Principal objects while
+    searching. When c is an "all", only the subconditions from c.all[start] onward are considered;
+    this lets us recurse over the rest of an "all" without building new Condition objects.
+
+    Results are memoized per (subcondition, start, remaining group), because the same subproblem
+    comes up again and again when an "all" has several ways to satisfy its early subconditions.
+    The lists we return may be shared through the memo, so callers must not modify them.
+    """
+    memo_key = (id(c), start, group)
+    stats = search.stats
+    answer = search.memo.get(memo_key)
+    if answer is not None:
+        if stats is not None:
+            stats.memo_hits += 1
+        return answer
+    shared = search.shared
+    if shared is not None:
+        shared_key = search.shared_key(c, start, group)
+        answer = shared.get(shared_key)
+        if answer is not None and stats is not None:
+            stats.memo_hits += 1
+    if answer is None:
+        if stats is not None:
+            stats.enter()
+            answer = _search_minimal_masks(search, group, c, start)
+            stats.leave()
+        else:
+            answer = _search_minimal_masks(search, group, c, start)
+        if shared is not None:
+            shared.put(shared_key, answer)
+    search.memo[memo_key] = answer
+    return answer
+
+
+def _search_minimal_masks(search: _Search, group: int, c: Condition, start: int) -> List[int]:
+    index = search.index
+    budget = search.budget
+    if budget is not None:
+        budget.spend()
+    stats = search.stats
+    if stats is not None:
+        stats.nodes += 1
     answer = []
     if group and c:
         if c.id:
-            for p in group:
-                if p.id == c.id:
-                    answer.append({p})
-        elif c.roles:
-            with_role = []
-            for p in group:
-                if p.roles and (c.roles in p.roles):
-                    with_role.append(p)
-            answer = [set(uc) for uc in _unique_combinations(with_role, c.n)]
+            answer = _bits(index.id_mask(c.id) & group)
+        elif c.roles or c.prop:
+            with_role = _bits(index.leaf_mask(c) & group)
+            if budget is not None:
+                # Charge for the combinations before generating them, so a huge one fails fast.
+                budget.spend(_comb(len(with_role), c.n))
+            # Bits in with_role don't overlap, so summing a combination is the same as OR-ing it.
+            answer = [sum(combo) for combo in itertools.combinations(with_role, c.n)]
+            if stats is not None:
+                stats.combinations += len(answer)
         else:
             if c.any:
                 matches = []
                 for subcondition in c.any:
-                    subsets = _get_matching_minimal_subsets(group, subcondition)
+                    subsets = _get_matching_minimal_masks(search, group, subcondition)
                     if subsets:
-                        subset_for_this_criterion = _flatten_to_single_set(subsets)
-                        matches.append(subset_for_this_criterion)
+                        matches.append(_union(subsets))
                 if matches:
                     if c.n == 1:
                         answer = matches
                     else:
-                        # Some of the logic that builds sets can't use lists or sets as
-                        # elements, because they are unhashable. Create a wrapper class to
-                        # work around this.
-                        class HashableSet:
-                            def __init__(self, set):
-                                self.set = set
-                            def __hash__(self):
-                                return id(self)
-                        list_of_lists_of_hashable_set = _unique_combinations(
-                                [HashableSet(m) for m in matches], c.n)
-                        if list_of_lists_of_hashable_set:
-                            # We have to merge the inner lists of sets, so we end up with
-                            # a single list of sets.
-                            for what_should_be_flat_list in list_of_lists_of_hashable_set:
-                                list_of_sets = [item.set for item in what_should_be_flat_list]
-                                answer.append(_flatten_to_single_set(list_of_sets))
+                        if budget is not None:
+                            budget.spend(_comb(len(matches), c.n))
+                        # Each combination of n matches is merged into a single subset.
+                        answer = [_union(combo) for combo in itertools.combinations(matches, c.n)]
+                        if stats is not None:
+                            stats.combinations += len(answer)
 
             elif c.all:
-                first_subcondition = c.all[0]
+                first_subcondition = c.all[start]
                 # The computation that follows is expensive -- up to factorial with the number of condition inside
                 # the tree beneath the "all" expression, and possibly a few levels of recursion. Do some simple
                 # optimizations. These may not actually speed up the code that much, most of the time. However,
@@ -111,45 +331,48 @@ def _get_matching_minimal_subsets(group: Set[Principal], c: Condition) -> List[S
                 # be useful in debugging regardless.
 
                 # Recurse to figure out all the ways we can satisfy this first subcondition.
-                subsets = _get_matching_minimal_subsets(group, first_subcondition)
+                subsets = _get_matching_minimal_masks(search, group, first_subcondition)
 
                 # Optimization 1: skip rest of algorithm if we only have a list of 1.
-                if len(c.all) == 1:
+                if len(c.all) - start == 1:
                     return subsets
 
                 # Did we have any success on the first subcondition?
                 if subsets:
-                    # Build a new Condition that represents all the subconditions besides the first subcondition.
-                    rest_of_subconditions = Condition(all=c.all[1:]) if len(c.all) > 2 else c.all[1]
+                    # The rest of the subconditions are c.all[start + 1:].
+                    rest = start + 1
 
                     # Optimization 2: figure out the minimum group size we need for the rest of the subconditions.
                     # Use that to skip any calculations that are doomed to failure. Part 1:
-                    min_group_remainder_size = _get_min_group_size(rest_of_subconditions)
-                    group_len = len(group)
+                    min_group_remainder_size = search.rest_min_size(c, rest)
+                    group_len = _popcount(group)
 
                     # Try each subset to see if there's a way that, using this particular subset
                     # to satisfy the first subcondition, the rest of the subconditions can be satisfied
                     # with the remainder of the group. We have to try each subset, because some of them
                     # might overlap while others do not.
                     for subset in subsets:
+                        if budget is not None:
+                            budget.spend()
 
                         # Optimization 2, part 2
-                        if group_len - len(subset) < min_group_remainder_size:
+                        if group_len - _popcount(subset) < min_group_remainder_size:
+                            if stats is not None:
+                                stats.pruned += 1
                             continue
 
                         # Who's left if we use this subset to satisfy the first subcondition?
-                        group_remainder = group - subset
+                        group_remainder = group & ~subset
                         # This test is probably redundant, since Optimization 2 should have eliminated
                         # empty groups. But we include it just to make the code robust.
                         if group_remainder:
                             # Okay, this is where we recurse instead of writing another inner loop.
                             # If this recursive call succeeds, then we've found a solution.
-                            subsets_for_remainder = _get_matching_minimal_subsets(group_remainder, rest_of_subconditions)
+                            subsets_for_remainder = _get_matching_minimal_masks(search, group_remainder, c, rest)
                             if subsets_for_remainder:
                                 # All of the subsets that satisfy the remainder need to be augmented by the subset
                                 # that satisfies the first subcondition.
-                                solution = [x.union(subset) for x in subsets_for_remainder]
-                                answer.append(_flatten_to_single_set(solution))
+                                answer.append(_union(subsets_for_remainder) | subset)
             else:
                 # This is a bit of an anomaly. None of conditions are set, so we don't have anything
                 # to evaluate. This shouldn't happen -- the constructor of Condition disallows it. But
@@ -158,11 +381,245 @@ def _get_matching_minimal_subsets(group: Set[Principal], c: Condition) -> List[S
 
     # We might have changed answer since we set its default value, or we might have let it
     # as an empty list. Either way, that's the correct answer if we get to this line.
+    if stats is not None:
+        stats.subsets += len(answer)
     return answer
 
 
-def satisfies(group: Union[Principal, Sequence[Principal], dict],
-              condition: Union[Rule, Condition, dict], disjoint=True) -> bool:
+def _iter_matching_minimal_masks(search: _Search, group: int, c: Condition, start: int = 0) -> Iterator[int]:
+    """
+    Yield the same subsets as _get_matching_minimal_masks, in the same order, but one at a time.
+    Combinations of role holders and the subsets of an "all" are only worked out as the caller asks
+    for them, so a caller that stops early doesn't pay for the rest. (Each subset of an "all" still
+    needs the complete list of subsets for the remainder, which comes from the memo.)
+    """
+    cached = search.memo.get((id(c), start, group))
+    if cached is not None:
+        yield from cached
+    elif group and c:
+        index = search.index
+        budget = search.budget
+        if budget is not None:
+            budget.spend()
+        stats = search.stats
+        if stats is not None:
+            stats.nodes += 1
+        if c.id:
+            yield from _bits(index.id_mask(c.id) & group)
+        elif c.roles or c.prop:
+            for combo in itertools.combinations(_bits(index.leaf_mask(c) & group), c.n):
+                if budget is not None:
+                    budget.spend()
+                if stats is not None:
+                    stats.combinations += 1
+                yield sum(combo)
+        elif c.any:
+            matches = []
+            for subcondition in c.any:
+                merged = _union(_iter_matching_minimal_masks(search, group, subcondition))
+                if merged:
+                    matches.append(merged)
+            if c.n == 1:
+                yield from matches
+            else:
+                for combo in itertools.combinations(matches, c.n):
+                    yield _union(combo)
+        elif c.all:
+            if len(c.all) - start == 1:
+                yield from _iter_matching_minimal_masks(search, group, c.all[start])
+                return
+            rest = start + 1
+            min_group_remainder_size = search.rest_min_size(c, rest)
+            group_len = _popcount(group)
+            for subset in _iter_matching_minimal_masks(search, group, c.all[start]):
+                if budget is not None:
+                    budget.spend()
+                if group_len - _popcount(subset) < min_group_remainder_size:
+                    if stats is not None:
+                        stats.pruned += 1
+                    continue
+                group_remainder = group & ~subset
+                if group_remainder:
+                    subsets_for_remainder = _get_matching_minimal_masks(search, group_remainder, c, rest)
+                    if subsets_for_remainder:
+                        yield _union(subsets_for_remainder) | subset
+
+
+def _has_matching_minimal_mask(search: _Search, group: int, c: Condition, start: int = 0) -> bool:
+    """
+    Tell whether _get_matching_minimal_masks would return anything, without building its answer.
+    For an "all", this stops at the first subset of the first subcondition that leaves enough of
+    the group to satisfy the rest -- and for the rest, it again only needs one witness.
+    """
+    if not group:
+        return False
+    memo_key = (id(c), start, group)
+    stats = search.stats
+    cached = search.memo.get(memo_key)
+    if cached is None:
+        cached = search.found.get(memo_key)
+    if cached is not None:
+        if stats is not None:
+            stats.memo_hits += 1
+        return bool(cached)
+    shared = search.shared
+    if shared is not None:
+        shared_key = search.shared_key(c, start, group, exists=True)
+        found = shared.get(shared_key)
+        if found is not None:
+            if stats is not None:
+                stats.memo_hits += 1
+            search.found[memo_key] = found
+            return found
+    index = search.index
+    if search.budget is not None:
+        search.budget.spend()
+    if stats is not None:
+        stats.nodes += 1
+        stats.enter()
+    found = False
+    if c.id:
+        found = bool(index.id_mask(c.id) & group)
+    elif c.roles or c.prop:
+        found = _popcount(index.leaf_mask(c) & group) >= c.n
+    elif c.any:
+        needed = c.n
+        for subcondition in c.any:
+            if _has_matching_minimal_mask(search, group, subcondition):
+                needed -= 1
+                if needed == 0:
+                    found = True
+                    break
+    elif c.all:
+        if len(c.all) - start == 1:
+            found = _has_matching_minimal_mask(search, group, c.all[start])
+        else:
+            rest = start + 1
+            min_group_remainder_size = search.rest_min_size(c, rest)
+            group_len = _popcount(group)
+            for subset in _iter_matching_minimal_masks(search, group, c.all[start]):
+                if group_len - _popcount(subset) < min_group_remainder_size:
+                    if stats is not None:
+                        stats.pruned += 1
+                    continue
+                group_remainder = group & ~subset
+                if group_remainder and _has_matching_minimal_mask(search, group_remainder, c, rest):
+                    found = True
+                    break
+    if stats is not None:
+        stats.leave()
+    search.found[memo_key] = found
+    if shared is not None:
+        shared.put(shared_key, found)
+    return found
+
+
+def _is_leaf(c: Condition) -> bool:
+    return bool(c.id or c.roles or c.prop)
+
+
+def _can_match(c: Condition) -> bool:
+    """
+    Tell whether a disjoint "all" can be decided by bipartite matching instead of by enumerating
+    minimal subsets. This is true when every subcondition is a leaf -- the shape of
+    typical multi-signature rules. Such a condition is satisfied exactly when each leaf can be given
+    its own n principals without any principal serving two leaves.
+    """
+    return bool(c.all) and all(_is_leaf(x) for x in c.all)
+
+
+def _estimate_cost(c: Condition) -> int:
+    """
+    Rough relative cost of evaluating a condition. It only has to put rules and subconditions in a
+    sensible order: leaves are cheap, and a disjoint "all" that can't be solved by matching needs
+    a combinatorial search.
+    """
+    if _is_leaf(c):
+        return 1
+    children = c.any or c.all
+    cost = 1 + sum(_estimate_cost(x) for x in children)
+    if c.all and not _can_match(c):
+        cost *= len(children) + 1
+    return cost
+
+
+def _augment(start: int, candidates: List[List[int]], owner: List[int]) -> bool:
+    """
+    Look for an augmenting path that gives leaf "start" one more principal, reassigning principals
+    between other leaves if necessary. This is a breadth-first search over the residual graph of
+    the flow network source -> leaf -> principal -> sink, so it doesn't recurse no matter how many
+    slots we are filling.
+    """
+    reached_by = {}
+    entered_via = {}
+    seen = {start}
+    queue = deque([start])
+    while queue:
+        leaf = queue.popleft()
+        for j in candidates[leaf]:
+            if j in reached_by:
+                continue
+            reached_by[j] = leaf
+            holder = owner[j]
+            if holder == -1:
+                # Found a free principal. Walk back along the path, shifting each principal
+                # to the leaf that reached it.
+                while True:
+                    leaf = reached_by[j]
+                    owner[j] = leaf
+                    if leaf == start:
+                        return True
+                    j = entered_via[leaf]
+            if holder not in seen:
+                seen.add(holder)
+                entered_via[holder] = j
+                queue.append(holder)
+    return False
+
+
+def _leaf_demands(c: Condition) -> List[tuple]:
+    """
+    Describe the leaves of a matchable "all" (see _can_match) as (leaf, n) tuples, where n is the
+    number of distinct principals the leaf needs.
+    """
+    return [(leaf, 1 if leaf.id else leaf.n) for leaf in c.all]
+
+
+def _match_demands(index: _GroupIndex, demands: List[tuple]) -> bool:
+    """
+    Compute a maximum b-matching between leaf demands (see _leaf_demands) and the members of an
+    indexed group. Each demand needs n slots filled; each principal can fill one slot. This is
+    polynomial in the size of the group and the number of slots, whereas
+    _get_matching_minimal_subsets grows combinatorially with both.
+    """
+    adjacency = []
+    slots = 0
+    for leaf, n in demands:
+        mask = index.leaf_mask(leaf)
+        # Cheap rejections before we build a matching.
+        if _popcount(mask) < n:
+            return False
+        slots += n
+        if slots > len(index.members):
+            return False
+        adjacency.append([bit.bit_length() - 1 for bit in _bits(mask)])
+    owner = [-1] * len(index.members)
+    for leaf, (condition, n) in enumerate(demands):
+        for _ in range(n):
+            if not _augment(leaf, adjacency, owner):
+                return False
+    return True
+
+
+def _satisfies_by_matching(group: Set[Principal], c: Condition) -> bool:
+    """
+    Decide a disjoint "all" whose subconditions are all leaves (see _can_match) by matching leaves
+    to principals, instead of by enumerating minimal subsets.
+    """
+    return _match_demands(_GroupIndex(group), _leaf_demands(c))
+
+
+def _normalize_group(group: Union[Principal, Sequence[Principal], dict]) -> Set[Principal]:
     precondition(group, '"group" cannot be empty.')
     if isinstance(group, dict):
         group = [Principal.from_dict(group)]
@@ -170,7 +627,10 @@ def satisfies(group: Union[Principal, Sequence[Principal], dict],
         group = [group]
     else:
         precondition_nonempty_sequence_of_x(group, "group", Principal)
-    group = set(group)
+    return set(group)
+
+
+def _normalize_condition(condition: Union[Rule, Condition, dict]) -> Condition:
     if isinstance(condition, dict):
         precondition(condition, '"condition" cannot be empty.')
         # Get a Condition object that we can test against.
@@ -178,22 +638,325 @@ def satisfies(group: Union[Principal, Sequence[Principal], dict],
         # Does the dict contain a Rule?
         if to:
             # If yes, just convert the .when property from it into a Condition.
-            condition = Condition.from_dict(to)
-        else:
-            # If not, convert the whole dict into a Condition.
-            condition = Condition.from_dict(condition)
+            return Condition.from_dict(to)
+        # If not, convert the whole dict into a Condition.
+        return Condition.from_dict(condition)
     elif isinstance(condition, Rule):
-        condition = condition.when
+        return condition.when
     elif isinstance(condition, Condition):
-        pass
-    else:
-        raise PreconditionViolation('"condition" must be a Rule, Condition, or non-empty dict.')
+        return condition
+    raise PreconditionViolation('"condition" must be a Rule, Condition, or non-empty dict.')
+
+
+# The fields _canonical_condition_dict understands. Any other field ("op", a custom property, or
+# something from a future version) sends the dict to Condition.from_dict.
+_CANONICAL_FIELDS = frozenset(["id", "roles", "all", "any", "n"])
+
+
+def _canonical_condition_dict(value) -> tuple:
+    """
+    Return the same thing as Condition.from_dict(value).key(), without building Condition
+    objects. Anything that isn't plainly valid is handed to Condition.from_dict, which either
+    raises the appropriate PreconditionViolation or tells us what the dict really means.
+    """
+    if isinstance(value, dict) and value.keys() <= _CANONICAL_FIELDS:
+        specified = [k for k in ("id", "roles", "all", "any") if value.get(k)]
+        if len(specified) == 1:
+            n = value.get("n")
+            which = specified[0]
+            x = value[which]
+            if which == "id":
+                if isinstance(x, str):
+                    return ("id", x)
+            elif which == "roles":
+                if n is None:
+                    n = 1
+                integral = isinstance(n, int) or (isinstance(n, float) and n.is_integer())
+                if integral and n > 0 and isinstance(x, str):
+                    return ("roles", x, int(n))
+            elif isinstance(x, (list, tuple)):
+                children = tuple(_canonical_condition_dict(child) for child in x)
+                if which == "all":
+                    return ("all", children)
+                if n is None or isinstance(n, int):
+                    return ("any", n if (n and n > 1) else 1, children)
+    return Condition.from_dict(value).key()
+
+
+def _digest(value) -> bytes:
+    text = json.dumps(value, separators=(",", ":"))
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=16).digest()
+
+
+def condition_digest(condition: Union[Rule, Condition, dict]) -> bytes:
+    """
+    Return a stable digest of a condition's canonical structure. Equivalent conditions have the
+    same digest whether they are given as Rule, Condition or dict objects, and across processes.
+    """
+    if isinstance(condition, dict):
+        precondition(condition, '"condition" cannot be empty.')
+        to = condition.get("when")
+        return _digest(_canonical_condition_dict(to if to else condition))
+    return _digest(_normalize_condition(condition).key())
+
+
+def group_digest(group: Union[Principal, Sequence[Principal], dict]) -> bytes:
+    """
+    Return a stable digest of the ids, roles and custom properties of a group's members.
+    """
+    return _group_digest(_normalize_group(group))
+
+
+def _group_digest(group: Set[Principal]) -> bytes:
+    return _digest(sorted(p.key() for p in group))
+
+
+class DecisionCache:
+    """
+    An opt-in cache of satisfies() decisions, keyed by condition_digest() and group_digest(). It
+    holds at most maxsize decisions, dropping the least recently used first; if ttl is given,
+    decisions also expire that many seconds after they were made. All methods are thread-safe.
+
+    When a policy changes, call invalidate() with the old rule or condition to drop every decision
+    made with it.
+    """
+
+    def __init__(self, maxsize: int = 100000, ttl: float = None, clock=time.monotonic):
+        precondition(isinstance(maxsize, int) and maxsize > 0, '"maxsize" must be a positive integer.')
+        precondition(ttl is None or ttl > 0, '"ttl" must be a positive number of seconds.')
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._entries = OrderedDict()
+        self._by_condition = {}
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.expirations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _drop(self, key):
+        del self._entries[key]
+        keys = self._by_condition[key[0]]
+        keys.discard(key)
+        if not keys:
+            del self._by_condition[key[0]]
+
+    def get(self, key: tuple):
+        """
+        Return the cached decision for a (condition digest, group digest, disjoint) key, or None.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                decision, expires = entry
+                if expires is None or expires > self._clock():
+                    self.hits += 1
+                    self._entries.move_to_end(key)
+                    return decision
+                self._drop(key)
+                self.expirations += 1
+            self.misses += 1
+            return None
+
+    def put(self, key: tuple, decision: bool):
+        with self._lock:
+            expires = None if self.ttl is None else self._clock() + self.ttl
+            self._entries[key] = (decision, expires)
+            self._entries.move_to_end(key)
+            self._by_condition.setdefault(key[0], set()).add(key)
+            while len(self._entries) > self.maxsize:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, condition: Union[Rule, Condition, dict, bytes]) -> int:
+        """
+        Drop every decision made with a condition (or with a digest from condition_digest()).
+        Return the number of decisions dropped.
+        """
+        digest = condition if isinstance(condition, bytes) else condition_digest(condition)
+        with self._lock:
+            keys = list(self._by_condition.get(digest, ()))
+            for key in keys:
+                self._drop(key)
+            return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_condition.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"size": len(self._entries), "maxsize": self.maxsize, "hits": self.hits,
+                    "misses": self.misses, "evictions": self.evictions, "expirations": self.expirations}
+
+
+def satisfies(group: Union[Principal, Sequence[Principal], dict],
+              condition: Union[Rule, Condition, dict], disjoint=True, memo: SubsetMemo = None,
+              cache: DecisionCache = None, budget=None) -> bool:
+    """
+    Tell whether a group satisfies a condition. If memo is given, subproblems of the disjoint
+    search are remembered there and reused by later calls that share it. If cache is given, the
+    decision is looked up there first, and remembered there afterwards. If budget (an
+    sgl.budget.Budget) is given, the disjoint search raises BudgetExceeded when it runs out.
+    """
+    instrumentation = _instrument.active
+    if instrumentation is not None:
+        rule = condition if isinstance(condition, Rule) else None
+        return instrumentation.measure(rule, _satisfies, group, condition, disjoint, memo, cache, budget)
+    return _satisfies(group, condition, disjoint, memo, cache, budget)
+
+
+def _satisfies(group, condition, disjoint, memo, cache, budget, stats=None) -> bool:
+    group = _normalize_group(group)
+    if cache is not None:
+        key = (condition_digest(condition), _group_digest(group), bool(disjoint))
+        decision = cache.get(key)
+        if decision is None:
+            decision = _check_satisfies(group, _normalize_condition(condition), disjoint, memo, budget, stats)
+            cache.put(key, decision)
+        return decision
+    condition = _normalize_condition(condition)
     # Now that we've checked all preconditions, call the internal function that does all the
     # work and that is recursive.
-    return _check_satisfies(group, condition, disjoint)
+    return _check_satisfies(group, condition, disjoint, memo, budget, stats)
+
+
+def satisfies_many(pairs: Iterable[tuple], disjoint=True) -> array:
+    """
+    Answer many satisfies() questions at once. pairs is a sequence of (group, condition) tuples, in
+    any of the forms satisfies() accepts. Each distinct group and condition object is normalized
+    only once, each condition is compiled only once, and each group is indexed only once no matter
+    how many conditions it is checked against. Return an array of 1 (satisfied) and 0 (not),
+    in the same order as pairs.
+    """
+    pairs = list(pairs)
+    groups = {}
+    conditions = {}
+    results = array("B", bytes(len(pairs)))
+    for i, (group, condition) in enumerate(pairs):
+        index = groups.get(id(group))
+        if index is None:
+            index = groups[id(group)] = _GroupIndex(_normalize_group(group))
+        compiled = conditions.get(id(condition))
+        if compiled is None:
+            compiled = conditions[id(condition)] = _normalize_condition(condition).compile()
+        if compiled.evaluate_index(index, disjoint):
+            results[i] = 1
+    return results
+
+
+def evaluate_matrix(groups: Sequence, conditions: Sequence, disjoint=True) -> List[array]:
+    """
+    Check every group against every condition. Return one array per group, holding 1 or 0 for
+    each condition in order. See satisfies_many().
+    """
+    compiled = [_normalize_condition(condition).compile() for condition in conditions]
+    answer = []
+    for group in groups:
+        index = _GroupIndex(_normalize_group(group))
+        answer.append(array("B", [1 if x.evaluate_index(index, disjoint) else 0 for x in compiled]))
+    return answer
+
+
+class _SharedEvaluation:
+    """
+    Evaluate many conditions against one indexed group, treating their trees as one DAG: each
+    distinct subcondition (by structure, not identity) is decided at most once, and every disjoint
+    search shares one _Search.
+    """
+    __slots__ = ['index', 'search', 'overlapping', 'disjoint']
+
+    def __init__(self, index: _GroupIndex):
+        self.index = index
+        self.search = _Search(index)
+        self.overlapping = {}
+        self.disjoint = {}
+
+    def check(self, c: Condition, disjoint) -> bool:
+        if not (disjoint and c.all):
+            return self.check_overlapping(c)
+        result = self.disjoint.get(c)
+        if result is None:
+            if _can_match(c):
+                result = _match_demands(self.index, _leaf_demands(c))
+            else:
+                result = _has_matching_minimal_mask(self.search, self.index.full, c)
+            self.disjoint[c] = result
+        return result
+
+    def check_overlapping(self, c: Condition) -> bool:
+        result = self.overlapping.get(c)
+        if result is None:
+            index = self.index
+            if c.id:
+                result = c.id in index.ids()
+            elif c.roles or c.prop:
+                result = _popcount(index.leaf_mask(c)) >= c.n
+            elif c.any:
+                needed = c.n
+                for x in c.any:
+                    if self.check_overlapping(x):
+                        needed -= 1
+                        if needed == 0:
+                            break
+                result = needed == 0
+            else:
+                result = all(self.check_overlapping(x) for x in c.all)
+            self.overlapping[c] = result
+        return result
+
+
+def effective_privileges(group: Union[Principal, Sequence[Principal], dict],
+                         rules: Iterable[Union[Rule, dict]], disjoint=True) -> Tuple[Set[str], Dict[str, Rule]]:
+    """
+    Work out every privilege a group holds under a collection of rules. Return the set of
+    privileges, and a dict that maps each one to the first rule (in the order given) that grants it.
+
+    The group is indexed once, and subconditions that several rules have in common are decided once.
+    A rule is only evaluated if it would grant something not already granted.
+    """
+    shared = _SharedEvaluation(_GroupIndex(_normalize_group(group)))
+    granted_by = {}
+    for rule in rules:
+        if isinstance(rule, dict):
+            rule = Rule.from_dict(rule)
+        precondition(isinstance(rule, Rule), '"rules" must contain Rule objects or dicts.')
+        if all(priv in granted_by for priv in rule.privs):
+            continue
+        if shared.check(rule.when, disjoint):
+            for priv in rule.privs:
+                granted_by.setdefault(priv, rule)
+    return set(granted_by), granted_by
+
+
+def iter_minimal_subsets(group: Union[Principal, Sequence[Principal], dict],
+                         condition: Union[Rule, Condition, dict], memo: SubsetMemo = None) -> Iterator[Set[Principal]]:
+    """
+    Yield the minimal subsets of a group that satisfy a condition, as used by disjoint evaluation.
+    Subsets are worked out lazily, so stopping after the first few is much cheaper than asking for
+    all of them.
+    """
+    group = _normalize_group(group)
+    condition = _normalize_condition(condition)
+    index = _GroupIndex(group, canonical=memo is not None)
+    for mask in _iter_matching_minimal_masks(_Search(index, memo), index.full, condition):
+        yield index.to_set(mask)
+
+
+def minimal_subsets(group: Union[Principal, Sequence[Principal], dict],
+                    condition: Union[Rule, Condition, dict], memo: SubsetMemo = None) -> List[Set[Principal]]:
+    """
+    Return every minimal subset of a group that satisfies a condition. See iter_minimal_subsets.
+    """
+    return _get_matching_minimal_subsets(_normalize_group(group), _normalize_condition(condition), memo)
 
 
-def _check_satisfies(group: Set[Principal], c: Condition, disjoint) -> bool:
+def _check_satisfies(group: Set[Principal], c: Condition, disjoint, memo: SubsetMemo = None, budget=None,
+                     stats=None) -> bool:
+    if stats is not None:
+        stats.nodes += 1
     # If the condition calls for us to match by id, do so. Note that we do
     # NOT need to also match by other characteristics; although a Principal can
     # have both an id and roles, condition cannot use both at the same time.
@@ -210,13 +973,22 @@ def _check_satisfies(group: Set[Principal], c: Condition, disjoint) -> bool:
                 n -= 1
                 if n == 0:
                     return True
+    # A condition on a custom property works like roles, with a test of each principal.
+    elif c.prop:
+        n = c.n
+        test = c.test()
+        for p in group:
+            if test(p):
+                n -= 1
+                if n == 0:
+                    return True
     # If we are looking for a match against any one of several conditions,
     # test each condition individually, and return true if we find the right
     # number of matches.
     elif c.any:
         n = c.n if c.n else 1
         for condition in c.any:
-            if _check_satisfies(group, condition, None):
+            if _check_satisfies(group, condition, None, stats=stats):
                 n -= 1
                 if n == 0:
                     return True
@@ -226,14 +998,20 @@ def _check_satisfies(group: Set[Principal], c: Condition, disjoint) -> bool:
         # the actual subsets of the group that satisfy subsets of the c,
         # before we can return True or False.
         if disjoint:
-            disjoint_subsets = _get_matching_minimal_subsets(group, c)
-            return bool(disjoint_subsets)
+            # Conditions that are just a list of leaves can be solved as a matching
+            # problem in polynomial time. Anything more complex needs the full enumeration.
+            if _can_match(c):
+                if stats is not None:
+                    stats.nodes += len(c.all)
+                return _satisfies_by_matching(group, c)
+            index = _GroupIndex(group, canonical=memo is not None)
+            return _has_matching_minimal_mask(_Search(index, memo, budget, stats), index.full, c)
 
         # This is much easier. Just see if all c are satisfied without checking to
         # see if the subsets of group that satisfies each are disjoint.
         else:
             for c in c.all:
-                if not _check_satisfies(group, c, False):
+                if not _check_satisfies(group, c, False, stats=stats):
                     return False
             return True
     return False
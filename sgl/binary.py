@@ -0,0 +1,391 @@
+"""
+A compact binary rendering of conditions, rules and principals, and of lists of them.
+
+    magic      b"SGLb"
+    version    varint
+    kind       one byte: C, R or P for a single condition, rule or principal; c, r or p for a list
+    strings    varint count, then each string as a varint length and UTF-8 bytes
+    body       the value; a list is a varint count followed by its items
+
+Every id, role and privilege is written once, in the string table, and referred to by its index
+everywhere else. Integers are unsigned LEB128 varints. A condition starts with a tag byte:
+
+    0  id          string
+    1  roles       string (n is 1)
+    2  roles, n    string, n
+    3  all         count, conditions
+    4  any         count, conditions (n is 1)
+    5  any, n      n, count, conditions
+    6  property    name string, op (its position in sgl.properties.OPERATORS), value, n
+
+A rule is a count and that many privilege strings, followed by its condition. A principal is its id
+as a string index plus one (0 for no id), a count and that many role strings, and a count and that
+many custom properties, each a name string and a value.
+
+A property value is a type byte followed by its data: 0 null, 1 false, 2 true, 3 an integer
+(zigzag-encoded varint), 4 a float (8 bytes, little-endian), 5 a string, 6 an array (count, values).
+
+Decoding reads bytes, a bytearray or a memoryview (of an mmap, say) and builds objects directly,
+without an intermediate dict.
+"""
+import struct
+import sys
+from typing import List, Union
+
+from .dbc import *
+from .bulk import _without_gc
+from .condition import Condition
+from .principal import Principal, _shared_role_set
+from .properties import OPERATORS, normalize_condition
+from .rule import Rule
+
+MAGIC = b"SGLb"
+VERSION = 1
+
+_ID, _ROLES, _ROLES_N, _ALL, _ANY, _ANY_N, _PROP = range(7)
+_NULL, _FALSE, _TRUE, _INT, _FLOAT, _STR, _ARRAY = range(7)
+_DOUBLE = struct.Struct("<d")
+
+_KINDS = {Condition: ord("C"), Rule: ord("R"), Principal: ord("P")}
+
+
+def _write_varint(out: bytearray, n: int):
+    while n >= 0x80:
+        out.append((n & 0x7f) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+class _Encoder:
+    __slots__ = ['out', 'strings']
+
+    def __init__(self):
+        self.out = bytearray()
+        self.strings = {}
+
+    def string(self, s: str):
+        strings = self.strings
+        i = strings.get(s)
+        if i is None:
+            i = strings[s] = len(strings)
+        _write_varint(self.out, i)
+
+    def value(self, value):
+        out = self.out
+        if value is None:
+            out.append(_NULL)
+        elif value is True or value is False:
+            out.append(_TRUE if value else _FALSE)
+        elif isinstance(value, int):
+            out.append(_INT)
+            _write_varint(out, value * 2 if value >= 0 else -value * 2 - 1)
+        elif isinstance(value, float):
+            out.append(_FLOAT)
+            out += _DOUBLE.pack(value)
+        elif isinstance(value, str):
+            out.append(_STR)
+            self.string(value)
+        else:
+            out.append(_ARRAY)
+            _write_varint(out, len(value))
+            for x in value:
+                self.value(x)
+
+    def condition(self, c: Condition):
+        out = self.out
+        if c.prop:
+            out.append(_PROP)
+            self.string(c.prop)
+            out.append(OPERATORS.index(c.op))
+            self.value(c.value)
+            _write_varint(out, c.n)
+        elif c.id:
+            out.append(_ID)
+            self.string(c.id)
+        elif c.roles:
+            precondition(type(c.roles) is str, "only conditions on a single role can be encoded.")
+            if c.n == 1:
+                out.append(_ROLES)
+                self.string(c.roles)
+            else:
+                out.append(_ROLES_N)
+                self.string(c.roles)
+                _write_varint(out, c.n)
+        else:
+            if c.all:
+                children = c.all
+                out.append(_ALL)
+            elif c.n == 1:
+                children = c.any
+                out.append(_ANY)
+            else:
+                children = c.any
+                out.append(_ANY_N)
+                _write_varint(out, c.n)
+            _write_varint(out, len(children))
+            for child in children:
+                self.condition(child)
+
+    def rule(self, rule: Rule):
+        _write_varint(self.out, len(rule.privs))
+        for priv in rule.privs:
+            self.string(priv)
+        self.condition(rule.when)
+
+    def principal(self, p: Principal):
+        if p.id:
+            strings = self.strings
+            i = strings.get(p.id)
+            if i is None:
+                i = strings[p.id] = len(strings)
+            _write_varint(self.out, i + 1)
+        else:
+            self.out.append(0)
+        roles = sorted(p.roles) if p.roles else ()
+        _write_varint(self.out, len(roles))
+        for role in roles:
+            self.string(role)
+        props = p.props
+        _write_varint(self.out, len(props))
+        for name, value in props.items():
+            self.string(name)
+            self.value(value)
+
+    def finish(self, kind: int) -> bytes:
+        head = bytearray(MAGIC)
+        _write_varint(head, VERSION)
+        head.append(kind)
+        _write_varint(head, len(self.strings))
+        for s in self.strings:
+            data = s.encode("utf-8")
+            _write_varint(head, len(data))
+            head += data
+        return bytes(head + self.out)
+
+
+def encode(value: Union[Condition, Rule, Principal, List]) -> bytes:
+    """
+    Render a Condition, Rule or Principal, or a list of any one of them, in binary.
+    """
+    encoder = _Encoder()
+    if isinstance(value, (list, tuple)):
+        cls = value[0].__class__ if value else Rule
+        precondition(cls in _KINDS and all(x.__class__ is cls for x in value),
+                     "a list must hold only conditions, only rules or only principals.")
+        write = getattr(encoder, cls.__name__.lower())
+        _write_varint(encoder.out, len(value))
+        for x in value:
+            write(x)
+        return encoder.finish(_KINDS[cls] | 0x20)
+    cls = value.__class__
+    precondition(cls in _KINDS, '"value" must be a Condition, Rule or Principal, or a list of them.')
+    getattr(encoder, cls.__name__.lower())(value)
+    return encoder.finish(_KINDS[cls])
+
+
+def decode(data: Union[bytes, bytearray, memoryview]):
+    """
+    Build the Condition, Rule, Principal or list that encode() rendered as data. Raise
+    PreconditionViolation if data is not a valid rendering.
+    """
+    try:
+        with _without_gc():
+            value, kind = _decode(data)
+    except (IndexError, ValueError, RecursionError, struct.error) as e:
+        raise PreconditionViolation(f"invalid binary rendering: {e}")
+    return value
+
+
+def decode_as(data, cls, many: bool = False):
+    """
+    Like decode(), but insist that data holds a cls (or, if many, a list of them).
+    """
+    try:
+        with _without_gc():
+            value, kind = _decode(data)
+    except (IndexError, ValueError, RecursionError, struct.error) as e:
+        raise PreconditionViolation(f"invalid binary rendering: {e}")
+    expected = _KINDS[cls] | (0x20 if many else 0)
+    if kind != expected and not (many and value == []):
+        raise PreconditionViolation(f"expected a binary rendering of {'a list of ' if many else 'a '}"
+                                    f"{cls.__name__}, not of kind {chr(kind)!r}.")
+    return value
+
+
+def _decode(data):
+    if isinstance(data, memoryview) and data.format != "B":
+        data = data.cast("B")
+    end = len(data)
+    pos = 0
+    if bytes(data[:4]) != MAGIC:
+        raise ValueError("bad magic number")
+
+    # The readers below keep their position in pos and work on data directly, since they run once
+    # for every node of every value.
+    def varint():
+        nonlocal pos
+        b = data[pos]
+        pos += 1
+        if b < 0x80:
+            return b
+        n = b & 0x7f
+        shift = 7
+        while True:
+            b = data[pos]
+            pos += 1
+            n |= (b & 0x7f) << shift
+            if b < 0x80:
+                return n
+            shift += 7
+
+    pos = 4
+    version = varint()
+    if version != VERSION:
+        raise ValueError(f"unsupported version {version}")
+    kind = data[pos]
+    pos += 1
+    intern = sys.intern
+    strings = []
+    for i in range(varint()):
+        length = varint()
+        if pos + length > end:
+            raise ValueError("truncated string table")
+        strings.append(intern(str(data[pos:pos + length], "utf-8")))
+        pos += length
+
+    new = Condition.__new__
+
+    def name():
+        s = strings[varint()]
+        if not s:
+            raise ValueError("empty name")
+        return s
+
+    def value():
+        nonlocal pos
+        tag = data[pos]
+        pos += 1
+        if tag == _STR:
+            return strings[varint()]
+        if tag == _INT:
+            n = varint()
+            return -(n + 1) // 2 if n & 1 else n // 2
+        if tag == _NULL:
+            return None
+        if tag == _FALSE or tag == _TRUE:
+            return tag == _TRUE
+        if tag == _FLOAT:
+            x = _DOUBLE.unpack_from(data, pos)[0]
+            pos += 8
+            return x
+        if tag == _ARRAY:
+            return [value() for i in range(varint())]
+        raise ValueError(f"unknown value tag {tag}")
+
+    # Leaves repeat throughout a rule set, and conditions are never modified once built, so each
+    # distinct leaf is built once and shared.
+    leaves = {}
+
+    def condition():
+        nonlocal pos
+        tag = data[pos]
+        pos += 1
+        if tag <= _ROLES_N:
+            i = varint()
+            n = varint() if tag == _ROLES_N else 1
+            key = (tag, i, n)
+            c = leaves.get(key)
+            if c is not None:
+                return c
+            s = strings[i]
+            if not (s and n):
+                raise ValueError("empty name or zero n")
+        c = new(Condition)
+        c.id = c.n = c.roles = c.all = c.any = None
+        c.prop = c.value = c.op = None
+        c._key = c._hash = c._test = None
+        if tag == _ID:
+            c.id = s
+            leaves[key] = c
+        elif tag <= _ROLES_N:
+            c.roles = s
+            c.n = n
+            leaves[key] = c
+        elif tag == _ALL:
+            c.all = children()
+        elif tag == _ANY:
+            c.n = 1
+            c.any = children()
+        elif tag == _ANY_N:
+            n = varint()
+            c.n = n if n > 1 else 1
+            c.any = children()
+        elif tag == _PROP:
+            prop = name()
+            op = OPERATORS[data[pos]]
+            pos += 1
+            # The value goes through the same checks as in the constructor, which also puts it
+            # in canonical form.
+            c.prop = prop
+            c.value, c.op = normalize_condition(prop, value(), op)
+            c.n = varint()
+            if not c.n:
+                raise ValueError("n must be positive")
+        else:
+            raise ValueError(f"unknown condition tag {tag}")
+        return c
+
+    def children():
+        count = varint()
+        if not count:
+            raise ValueError("an empty list of subconditions")
+        return tuple([condition() for i in range(count)])
+
+    def rule():
+        r = Rule.__new__(Rule)
+        count = varint()
+        if not count:
+            raise ValueError("a rule must grant something")
+        r.privs = tuple(sorted(set([name() for i in range(count)])))
+        r._hash = None
+        r.when = condition()
+        return r
+
+    # Principals in a directory repeat a few combinations of roles; build each one's set once.
+    role_sets = {}
+
+    def principal():
+        p = Principal.__new__(Principal)
+        p._key = p._layout = p._values = None
+        i = varint()
+        p.id = strings[i - 1] or None if i else None
+        count = varint()
+        if count:
+            key = tuple([varint() for i in range(count)])
+            roles = role_sets.get(key)
+            if roles is None:
+                roles = role_sets[key] = _shared_role_set([strings[i] for i in key])
+            p.roles = roles
+        else:
+            p.roles = None
+        count = varint()
+        if count:
+            props = {}
+            for i in range(count):
+                prop = name()
+                props[prop] = value()
+            p._set_props(props)
+        elif not (p.id or p.roles):
+            raise ValueError("a principal needs an id, roles or properties")
+        return p
+
+    read = {ord("C"): condition, ord("R"): rule, ord("P"): principal}.get(kind & ~0x20)
+    if read is None:
+        raise ValueError(f"unknown kind {kind}")
+    if kind & 0x20:
+        answer = [read() for i in range(varint())]
+    else:
+        answer = read()
+    if pos != end:
+        raise ValueError("trailing data")
+    return answer, kind
@@ -0,0 +1,138 @@
+import time
+from typing import Union
+
+from .dbc import *
+from .rule import Rule
+from .condition import Condition
+from .api import _normalize_condition, _get_min_group_size, _can_match, _comb
+
+
+class BudgetExceeded(BaseException):
+    """
+    Raised when an evaluation runs out of the Budget it was given. The decision is unknown, not
+    false: callers that have to answer anyway should treat it as a denial.
+    """
+    def __init__(self, msg, steps: int = 0):
+        BaseException.__init__(self, msg)
+        self.steps = steps
+
+
+class Budget:
+    """
+    A limit on how much work disjoint evaluation may do, in search steps, in seconds, or both.
+    A step is one subproblem visited or one candidate subset generated. Steps accumulate across
+    every evaluation the budget is passed to, so use a fresh Budget per request.
+    """
+    __slots__ = ['max_steps', 'deadline', 'steps', '_clock', '_next_check']
+
+    # Reading the clock costs more than counting a step, so we only look at it this often.
+    CLOCK_INTERVAL = 64
+
+    def __init__(self, max_steps: int = None, seconds: float = None, clock=time.monotonic):
+        precondition(max_steps is None or (isinstance(max_steps, int) and max_steps > 0),
+                     '"max_steps" must be a positive integer.')
+        precondition(seconds is None or seconds > 0, '"seconds" must be positive.')
+        self.max_steps = max_steps
+        self.deadline = clock() + seconds if seconds is not None else None
+        self.steps = 0
+        self._clock = clock
+        self._next_check = self.CLOCK_INTERVAL
+
+    def spend(self, steps: int = 1):
+        """
+        Charge steps to the budget. Raise BudgetExceeded if that exhausts it.
+        """
+        self.steps += steps
+        if self.max_steps is not None and self.steps > self.max_steps:
+            raise BudgetExceeded(f"evaluation took more than {self.max_steps} steps.", self.steps)
+        if self.deadline is not None and self.steps >= self._next_check:
+            self._next_check = self.steps + self.CLOCK_INTERVAL
+            if self._clock() > self.deadline:
+                raise BudgetExceeded("evaluation ran out of time.", self.steps)
+
+
+def _count(c: Condition, group_size: int) -> int:
+    """
+    The most minimal subsets the disjoint search can find for c in a group of group_size.
+    """
+    if c.id:
+        # Several principals may share an id.
+        return group_size
+    if c.roles or c.prop:
+        return _comb(group_size, c.n)
+    if c.any:
+        return _comb(len(c.any), c.n)
+    # An "all" yields at most one subset for each way to satisfy its first subcondition.
+    return _count(c.all[0], group_size)
+
+
+def _remainder(first: Condition, group_size: int) -> int:
+    # Each way to satisfy the first subcondition of an "all" leaves at most this many members.
+    return group_size - _get_min_group_size(first)
+
+
+def _cost(c: Condition, group_size: int, start: int = 0) -> int:
+    """
+    Worst-case steps the search for all of c's minimal subsets (or those of c.all[start:]) takes
+    in a group of group_size, assuming every member could satisfy every leaf and nothing is
+    memoized. Enumerating them one at a time never takes more.
+    """
+    if group_size <= 0:
+        return 1
+    if c.id:
+        return 1
+    if c.roles or c.prop:
+        return 1 + _comb(group_size, c.n)
+    if c.any:
+        return 1 + sum(_cost(x, group_size) for x in c.any) + _comb(len(c.any), c.n)
+    first = c.all[start]
+    cost = 1 + _cost(first, group_size)
+    if start + 1 < len(c.all):
+        # One step for each way to satisfy the first subcondition, and a search of the rest.
+        cost += _count(first, group_size) * (1 + _cost(c, _remainder(first, group_size), start + 1))
+    return cost
+
+
+def _exists_cost(c: Condition, group_size: int, start: int = 0) -> int:
+    """
+    Like _cost(), for the search that only looks for one minimal subset, which is what satisfies()
+    does. It enumerates the ways to satisfy the first subcondition of an "all", and looks for a
+    way to satisfy the rest after each one.
+    """
+    if group_size <= 0:
+        return 0
+    if c.id or c.roles or c.prop:
+        return 1
+    if c.any:
+        return 1 + sum(_exists_cost(x, group_size) for x in c.any)
+    first = c.all[start]
+    if start + 1 == len(c.all):
+        return 1 + _exists_cost(first, group_size)
+    return 1 + _cost(first, group_size) + _count(first, group_size) * _exists_cost(
+        c, _remainder(first, group_size), start + 1)
+
+
+def _size(c: Condition) -> int:
+    if c.id or c.roles or c.prop:
+        return 1
+    return 1 + sum(_size(x) for x in c.all or c.any)
+
+
+def estimate_cost(condition: Union[Rule, Condition, dict], group_size: int, disjoint=True) -> int:
+    """
+    Predict the worst-case number of steps (see Budget) that satisfies() can take to evaluate a
+    condition for a group of group_size principals. This is an upper bound: it assumes every
+    principal holds every role and id the condition mentions, and ignores memoization, so a Budget
+    of this many steps never runs out. Compare it to a limit when rules are uploaded to reject
+    those that can't be evaluated in bounded time.
+    """
+    c = _normalize_condition(condition)
+    precondition(isinstance(group_size, int) and group_size >= 0, '"group_size" must be a non-negative integer.')
+    if not (disjoint and c.all):
+        # Overlapping evaluation visits each node once, counting members at the leaves.
+        return _size(c) * max(group_size, 1)
+    if _can_match(c):
+        # One augmenting path search per slot, each over at most every leaf and member.
+        slots = sum(x.n or 1 for x in c.all)
+        return slots * (len(c.all) + group_size) + 1
+    return max(_exists_cost(c, group_size), 1)
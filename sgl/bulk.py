@@ -0,0 +1,231 @@
+"""
+Fast loading of large documents of rules, conditions and principals. The whole document is
+validated in one pass over the plain JSON data first -- so a bad document is rejected before
+anything is built -- and then every object is built by the trusted path of from_dict(), which
+skips the checks the constructors would otherwise repeat for every object and every child.
+"""
+import contextlib
+import gc
+import json
+from typing import Iterable, List, Union
+
+from .dbc import *
+from .principal import Principal, _extra_fields, _shared_role_set
+from .properties import CONDITION_FIELDS, normalize_condition
+from .rule import Rule
+from .condition import Condition
+
+
+@contextlib.contextmanager
+def _without_gc():
+    """
+    Building a large document allocates millions of objects and no garbage, but the allocations
+    alone keep triggering the cyclic garbage collector, which then walks everything built so far.
+    Suspend it while we build.
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def _fail(path: str, msg: str):
+    raise PreconditionViolation(f"{path}: {msg}")
+
+
+def _check_strs(value, path: str, name: str):
+    if isinstance(value, str) or not isinstance(value, (list, tuple)) or not value:
+        _fail(path, f'"{name}" must be a non-empty list of str.')
+    for item in value:
+        if not isinstance(item, str):
+            _fail(path, f'"{name}" must be a non-empty list of str, not one containing {item.__class__.__name__}.')
+
+
+def _condition_ok(value) -> bool:
+    """
+    Quickly tell whether a condition dict and its subconditions are valid. Only when one isn't do
+    we pay for _check_condition, which works out where the problem is.
+    """
+    stack = [value]
+    pop = stack.pop
+    push = stack.extend
+    while stack:
+        value = pop()
+        if type(value) is not dict:
+            return False
+        get = value.get
+        id = get("id")
+        roles = get("roles")
+        all = get("all")
+        any = get("any")
+        if (id or roles or all or any) and "op" in value:
+            return False
+        if id:
+            if roles or all or any or type(id) is not str:
+                return False
+        elif roles:
+            if all or any or type(roles) is not str:
+                return False
+            n = get("n")
+            if n is not None and not (type(n) is int and n > 0):
+                return False
+        elif all:
+            if any or type(all) is not list:
+                return False
+            push(all)
+        elif any:
+            n = get("n")
+            if type(any) is not list or (n is not None and type(n) is not int):
+                return False
+            push(any)
+        else:
+            # Conditions on custom properties take the slow path.
+            return False
+    return True
+
+
+def _check_n(n, path: str):
+    if isinstance(n, float) and not n.is_integer():
+        _fail(path, '"n" must be castable to int without losing precision.')
+    if n is not None and not (isinstance(n, (int, float)) and n > 0):
+        _fail(path, '"n" must be a positive integer.')
+
+
+def _check_condition(value, path: str):
+    if not isinstance(value, dict):
+        _fail(path, "a condition must be a dict.")
+    specified = [name for name in ["id", "roles", "all", "any"] if value.get(name)]
+    n = value.get("n")
+    if not specified:
+        props = [k for k in value if k not in CONDITION_FIELDS]
+        if len(props) != 1:
+            _fail(path, 'a condition must have one of "id", "roles", "all" or "any", or name one custom property.')
+        try:
+            normalize_condition(props[0], value[props[0]], value.get("op"))
+        except PreconditionViolation as e:
+            _fail(path, str(e))
+        _check_n(n, path)
+        return
+    if len(specified) != 1:
+        _fail(path, 'the "id", "roles", "all", and "any" fields are mutually exclusive, and one must be specified.')
+    if "op" in value:
+        _fail(path, '"op" only applies to custom properties.')
+    which = specified[0]
+    if which == "id":
+        if not isinstance(value["id"], str):
+            _fail(path, '"id" must be a str.')
+    elif which == "roles":
+        if not isinstance(value["roles"], str):
+            _fail(path, '"roles" must be a str.')
+        _check_n(n, path)
+    else:
+        children = value[which]
+        if not isinstance(children, (list, tuple)):
+            _fail(path, f'"{which}" must be a non-empty list of conditions.')
+        if which == "any" and n is not None and not isinstance(n, (int, float)):
+            _fail(path, '"n" must be a number.')
+        for i, child in enumerate(children):
+            _check_condition(child, f"{path}.{which}[{i}]")
+
+
+def validate_condition(value, path: str = "condition"):
+    """
+    Check that value is a dict the Condition constructor would accept, along with all of its
+    subconditions. Raise PreconditionViolation, naming the offending part, if it isn't.
+    """
+    if not _condition_ok(value):
+        # The quick check is stricter about types than it needs to be (it wants an int n, where
+        # a float like 2.0 is allowed), so this may find nothing wrong after all.
+        _check_condition(value, path)
+
+
+def validate_rule(value, path: str = "rule"):
+    if not isinstance(value, dict):
+        _fail(path, "a rule must be a dict.")
+    _check_strs(value.get("grant"), path, "grant")
+    validate_condition(value.get("when"), path + ".when")
+
+
+def validate_principal(value, path: str = "principal"):
+    if type(value) is dict:
+        # Fast path for the common, valid case.
+        id = value.get("id")
+        roles = value.get("roles")
+        if (id or roles) and (not id or type(id) is str) and (
+                not roles or (type(roles) is list and all(type(role) is str for role in roles))) and (
+                len(value) == ("id" in value) + ("roles" in value)):
+            return
+    if not isinstance(value, dict):
+        _fail(path, "a principal must be a dict.")
+    id = value.get("id")
+    roles = value.get("roles")
+    props = _extra_fields(value)
+    if not (id or roles or props):
+        _fail(path, 'either "id", "roles" or a custom property must have a meaningful value.')
+    if id and not isinstance(id, str):
+        _fail(path, '"id" must be a str.')
+    if roles:
+        _check_strs(roles, path, "roles")
+
+
+def _document(values: Union[str, Iterable[dict]]) -> List[dict]:
+    if isinstance(values, str):
+        values = json.loads(values)
+    precondition(isinstance(values, (list, tuple)), 'the document must be a JSON array or a sequence of dicts.')
+    return values
+
+
+def load_conditions(values: Union[str, Iterable[dict]]) -> List[Condition]:
+    """
+    Validate a JSON array (as text, or already parsed) of conditions, then build them all.
+    """
+    values = _document(values)
+    for i, value in enumerate(values):
+        validate_condition(value, f"[{i}]")
+    with _without_gc():
+        return [Condition.from_dict(value, trusted=True) for value in values]
+
+
+def load_rules(values: Union[str, Iterable[dict]]) -> List[Rule]:
+    """
+    Validate a JSON array (as text, or already parsed) of rules, then build them all.
+    """
+    values = _document(values)
+    for i, value in enumerate(values):
+        validate_rule(value, f"[{i}]")
+    with _without_gc():
+        return [Rule.from_dict(value, trusted=True) for value in values]
+
+
+def load_principals(values: Union[str, Iterable[dict]]) -> List[Principal]:
+    """
+    Validate a JSON array (as text, or already parsed) of principals, then build them all.
+    """
+    values = _document(values)
+    for i, value in enumerate(values):
+        validate_principal(value, f"[{i}]")
+    # Directories repeat the same few lists of roles over and over; build each role set once.
+    role_sets = {}
+    answer = []
+    with _without_gc():
+        for value in values:
+            p = Principal.__new__(Principal)
+            p._key = p._layout = p._values = None
+            p.id = value.get("id") or None
+            roles = value.get("roles")
+            if roles:
+                key = tuple(roles)
+                shared = role_sets.get(key)
+                if shared is None:
+                    shared = role_sets[key] = _shared_role_set(roles)
+                p.roles = shared
+            else:
+                p.roles = None
+            props = _extra_fields(value)
+            if props:
+                p._set_props(props)
+            answer.append(p)
+    return answer
@@ -0,0 +1,166 @@
+import asyncio
+import itertools
+import json
+from typing import Sequence, Union
+
+from .dbc import *
+from .principal import Principal
+from .rule import Rule
+from .condition import Condition
+
+
+# _running_loop() is new in python 3.7.
+_running_loop = getattr(asyncio, "get_running_loop", asyncio.get_event_loop)
+
+
+def _group_dicts(group) -> Union[dict, list]:
+    if isinstance(group, Principal):
+        return group.to_dict()
+    if isinstance(group, dict):
+        return group
+    return [p.to_dict() if isinstance(p, Principal) else p for p in group]
+
+
+def _condition_dict(condition) -> dict:
+    if isinstance(condition, (Rule, Condition)):
+        return condition.to_dict()
+    return condition
+
+
+class _Connection:
+    """
+    One connection to the server. Requests are pipelined: each is written as soon as it is made,
+    and a reader task hands responses back to whoever is waiting for their id.
+    """
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, timeout: float = None):
+        self.reader = reader
+        self.writer = writer
+        self.timeout = timeout
+        self.waiting = {}
+        self.task = asyncio.ensure_future(self._read())
+
+    async def _read(self):
+        error = ConnectionError("connection closed by the server.")
+        try:
+            while True:
+                line = await self.reader.readline()
+                if not line:
+                    break
+                response = json.loads(line)
+                id = response.get("id")
+                if id is None:
+                    # The server couldn't tell which request this is about (say, one too long to
+                    # read), so it may be any of them.
+                    futures = list(self.waiting.values())
+                    self.waiting.clear()
+                else:
+                    futures = [self.waiting.pop(id, None)]
+                for future in futures:
+                    if future is not None and not future.done():
+                        future.set_result(response)
+        except Exception as e:
+            error = e
+        finally:
+            for future in self.waiting.values():
+                if not future.done():
+                    future.set_exception(error)
+            self.waiting.clear()
+
+    async def send(self, request: dict) -> dict:
+        future = _running_loop().create_future()
+        self.waiting[request["id"]] = future
+        self.writer.write(json.dumps(request, separators=(",", ":")).encode("utf-8") + b"\n")
+        await self.writer.drain()
+        try:
+            return await asyncio.wait_for(future, self.timeout)
+        finally:
+            self.waiting.pop(request["id"], None)
+
+    async def close(self):
+        self.writer.close()
+        if hasattr(self.writer, "wait_closed"):
+            # New in python 3.7.
+            await self.writer.wait_closed()
+        self.task.cancel()
+        try:
+            await self.task
+        except asyncio.CancelledError:
+            pass
+
+
+class AuthorizationClient:
+    """
+    Asyncio client for AuthorizationServer. It keeps a pool of up to pool_size connections,
+    opened as they are needed, and spreads requests across them in turn. Pass either the path
+    of a unix socket or a host and port. A request that isn't answered within timeout seconds
+    (None to wait forever) raises asyncio.TimeoutError.
+    """
+
+    def __init__(self, path: str = None, host: str = "127.0.0.1", port: int = None, pool_size: int = 4,
+                 timeout: float = 30.0):
+        precondition(path or port, 'either "path" or "port" is required.')
+        precondition(isinstance(pool_size, int) and pool_size > 0, '"pool_size" must be a positive integer.')
+        precondition(timeout is None or timeout > 0, '"timeout" must be positive, or None.')
+        self.timeout = timeout
+        self.path = path
+        self.host = host
+        self.port = port
+        self.pool_size = pool_size
+        self._pool = []
+        self._next = itertools.count()
+        self._ids = itertools.count(1)
+        self._lock = None
+
+    async def _open(self) -> _Connection:
+        if self.path:
+            reader, writer = await asyncio.open_unix_connection(self.path)
+        else:
+            reader, writer = await asyncio.open_connection(self.host, self.port)
+        return _Connection(reader, writer, self.timeout)
+
+    async def _connection(self) -> _Connection:
+        if self._lock is None:
+            self._lock = asyncio.Lock()
+        async with self._lock:
+            # Drop connections the server has closed.
+            self._pool = [x for x in self._pool if not x.task.done()]
+            if len(self._pool) < self.pool_size:
+                self._pool.append(await self._open())
+                return self._pool[-1]
+            return self._pool[next(self._next) % len(self._pool)]
+
+    async def request(self, request: dict) -> dict:
+        """
+        Send a raw request (without an id; one is assigned) and return the raw response. Raise
+        PreconditionViolation if the server reports an error, and asyncio.TimeoutError if it doesn't
+        answer in time. An error the server can't tie to a request (such as one too long to read)
+        fails every request waiting on the same connection.
+        """
+        request = dict(request, id=next(self._ids))
+        response = await (await self._connection()).send(request)
+        precondition("error" not in response, response.get("error"))
+        return response
+
+    async def authorize(self, group: Union[Principal, Sequence[Principal], dict], priv: str,
+                        ruleset: str = None, disjoint=True) -> bool:
+        request = {"group": _group_dicts(group), "priv": priv, "disjoint": disjoint}
+        if ruleset is not None:
+            request["ruleset"] = ruleset
+        return (await self.request(request))["granted"]
+
+    async def satisfies(self, group: Union[Principal, Sequence[Principal], dict],
+                        condition: Union[Rule, Condition, dict], disjoint=True) -> bool:
+        request = {"group": _group_dicts(group), "condition": _condition_dict(condition), "disjoint": disjoint}
+        return (await self.request(request))["result"]
+
+    async def close(self):
+        pool, self._pool = self._pool, []
+        for connection in pool:
+            await connection.close()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
@@ -0,0 +1,138 @@
+from typing import Callable, List, Sequence, Union
+
+from .dbc import *
+from .principal import Principal
+from .rule import Rule
+from .condition import Condition
+from . import instrument as _instrument
+from .api import SubsetMemo, _normalize_group, _GroupIndex, _Search, _popcount, _can_match, _leaf_demands, \
+    _match_demands, _has_matching_minimal_mask
+
+
+def _compile_id(id: str) -> Callable:
+    return lambda index: id in index.ids()
+
+
+def _compile_roles(role: str, n: int) -> Callable:
+    if n == 1:
+        return lambda index: role in index.roles()
+    return lambda index: _popcount(index.role_mask(role)) >= n
+
+
+def _compile_prop(c: Condition) -> Callable:
+    # The operator was resolved into test when the condition was first compiled.
+    test = c.test()
+    if c.n == 1:
+        return lambda index: any(map(test, index.members))
+    n = c.n
+    return lambda index: _popcount(index.prop_mask(c)) >= n
+
+
+def _compile_any(children: List[Callable], n: int) -> Callable:
+    if n == 1:
+        return lambda index: any(child(index) for child in children)
+
+    def check(index):
+        needed = n
+        for child in children:
+            if child(index):
+                needed -= 1
+                if needed == 0:
+                    return True
+        return False
+    return check
+
+
+def _compile_all(children: List[Callable]) -> Callable:
+    return lambda index: all(child(index) for child in children)
+
+
+def _compile_overlapping(c: Condition) -> Callable:
+    """
+    Build a closure equivalent to _check_satisfies(group, c, False). Subconditions of "any" are
+    always evaluated this way, even when the caller asks for disjoint evaluation.
+    """
+    if c.id:
+        return _compile_id(c.id)
+    if c.roles:
+        return _compile_roles(c.roles, c.n)
+    if c.prop:
+        return _compile_prop(c)
+    if c.any:
+        return _compile_any([_compile_overlapping(x) for x in c.any], c.n if c.n else 1)
+    return _compile_all([_compile_overlapping(x) for x in c.all])
+
+
+def _compile_disjoint(c: Condition) -> Callable:
+    """
+    Build a closure equivalent to _check_satisfies(group, c, True). Only a top-level "all" behaves
+    differently from overlapping evaluation; for it, we choose the matching engine or the full
+    enumeration now rather than on every call.
+    """
+    if not c.all:
+        overlapping = _compile_overlapping(c)
+        return lambda index, memo, stats: overlapping(index)
+    if _can_match(c):
+        demands = _leaf_demands(c)
+        return lambda index, memo, stats: _match_demands(index, demands)
+    return lambda index, memo, stats: _has_matching_minimal_mask(_Search(index, memo, stats=stats), index.full, c)
+
+
+class CompiledCondition:
+    """
+    A reusable, immutable predicate built from a Condition. Branch dispatch is resolved once at
+    compile time, so evaluation only runs the checks the condition actually needs. Conditions are
+    expected not to change once they have been compiled.
+    """
+    __slots__ = ['condition', '_disjoint', '_overlapping']
+
+    def __init__(self, condition: Condition):
+        precondition(isinstance(condition, Condition), '"condition" must be a Condition.')
+        object.__setattr__(self, 'condition', condition)
+        object.__setattr__(self, '_disjoint', _compile_disjoint(condition))
+        object.__setattr__(self, '_overlapping', _compile_overlapping(condition))
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{self.__class__.__name__} is immutable.")
+
+    def __call__(self, group: Union[Principal, Sequence[Principal], dict], disjoint=True,
+                 memo: SubsetMemo = None) -> bool:
+        return self.evaluate(_normalize_group(group), disjoint, memo)
+
+    def evaluate(self, group: set, disjoint=True, memo: SubsetMemo = None) -> bool:
+        """
+        Like calling the predicate, but skips normalization of the group. The group must already
+        be a non-empty set of Principal objects.
+        """
+        if disjoint:
+            index = _GroupIndex(group, canonical=memo is not None)
+        else:
+            index = _GroupIndex(group)
+        return self.evaluate_index(index, disjoint, memo)
+
+    def evaluate_index(self, index: _GroupIndex, disjoint=True, memo: SubsetMemo = None) -> bool:
+        """
+        Evaluate against a group that has already been indexed, so several predicates can share
+        the work of indexing the same group.
+        """
+        instrumentation = _instrument.active
+        if instrumentation is not None:
+            return instrumentation.measure(getattr(self, 'rule', None), self._evaluate, index, disjoint, memo)
+        return self._disjoint(index, memo, None) if disjoint else self._overlapping(index)
+
+    def _evaluate(self, index: _GroupIndex, disjoint, memo, stats) -> bool:
+        stats.nodes += 1
+        return self._disjoint(index, memo, stats) if disjoint else self._overlapping(index)
+
+
+class CompiledRule(CompiledCondition):
+    """
+    A CompiledCondition that remembers the privileges granted by the Rule it was built from.
+    """
+    __slots__ = ['rule', 'privs']
+
+    def __init__(self, rule: Rule):
+        precondition(isinstance(rule, Rule), '"rule" must be a Rule.')
+        CompiledCondition.__init__(self, rule.when)
+        object.__setattr__(self, 'rule', rule)
+        object.__setattr__(self, 'privs', tuple(rule.privs))
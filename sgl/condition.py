@@ -1,37 +1,59 @@
 import json
 import math
-from typing import Sequence
+import sys
+from typing import Callable, Sequence
 
 from .dbc import *
+from .properties import CONDITION_FIELDS, compile_test, default_op, normalize_condition, value_key
+
+
+def _check_n(n) -> int:
+    if isinstance(n, float):
+        precondition(n <= math.floor(n) and n >= math.ceil(n),
+                     '"n" must be castable to int without losing precision.')
+        n = int(n)
+    elif n is None:
+        n = 1
+    precondition(isinstance(n, int) and n > 0, '"n" must be a positive integer.')
+    return n
 
 
 class Condition:
+    """
+    A test that a group either satisfies or doesn't. Exactly one of id, roles, all, any or prop is
+    given. A prop condition tests a custom property of principals: at least n of them must have a
+    value for prop that passes op with value (see docs/custom-properties.md).
+    """
+    __slots__ = ['id', 'n', 'roles', 'all', 'any', 'prop', 'value', 'op', '_key', '_hash', '_test']
+
     def __init__(self, id: str = None, n: int = None, roles: str = None,
-                 all: Sequence['Condition'] = None, any: Sequence['Condition'] = None):
-        specified = [True for x in [id, roles, all, any] if bool(x)]
+                 all: Sequence['Condition'] = None, any: Sequence['Condition'] = None,
+                 prop: str = None, value=None, op: str = None):
+        specified = [True for x in [id, roles, all, any, prop] if bool(x)]
         precondition(len(specified) == 1,
-                     'the "id", "roles", "all", and "any" parameters are mutually exclusive, and one must be specified.')
+                     'the "id", "roles", "all", "any" and "prop" parameters are mutually exclusive, and one must be specified.')
         self.id = self.n = self.roles = self.all = self.any = None
+        self.prop = self.value = self.op = None
+        self._key = self._hash = self._test = None
+        precondition(op is None or prop, '"op" only applies to custom properties.')
         if id:
             precondition_is_str(id, "id")
-            self.id = id
+            self.id = sys.intern(id)
         elif roles:
-            self.roles = roles
-            if isinstance(n, float):
-                precondition(n <= math.floor(n) and n >= math.ceil(n),
-                             '"n" must be castable to int without losing precision.')
-                n = int(n)
-            elif n is None:
-                n = 1
-            precondition(isinstance(n, int) and n > 0, '"n" must be a positive integer.')
-            self.n = n
+            self.roles = sys.intern(roles) if type(roles) is str else roles
+            self.n = _check_n(n)
+        elif prop:
+            precondition_is_str(prop, "prop")
+            self.prop = sys.intern(prop)
+            self.value, self.op = normalize_condition(prop, value, op)
+            self.n = _check_n(n)
         elif all:
             precondition_nonempty_sequence_of_x(all, "all", Condition)
-            self.all = all
+            self.all = tuple(all)
         else: #if any:
             precondition_nonempty_sequence_of_x(any, "any", Condition)
             self.n = n if (n and n > 1) else 1
-            self.any = any
+            self.any = tuple(any)
 
     def __str__(self):
         return self.to_json()
@@ -46,6 +68,13 @@ class Condition:
                 return {"n": self.n, "roles": self.roles}
         if self.all:
             return {"all": [x.to_dict() for x in self.all]}
+        if self.prop:
+            answer = {self.prop: list(self.value) if isinstance(self.value, tuple) else self.value}
+            if self.op != default_op(self.value):
+                answer["op"] = self.op
+            if self.n > 1:
+                answer["n"] = self.n
+            return answer
 
         if self.n > 1:
             return {"any": [x.to_dict() for x in self.any], "n": self.n}
@@ -56,7 +85,13 @@ class Condition:
         return json.dumps(self.to_dict())
 
     @classmethod
-    def from_dict(cls, value: dict) -> 'Condition':
+    def from_dict(cls, value: dict, trusted=False) -> 'Condition':
+        """
+        Build a Condition from its dict form. If trusted, the dict is assumed to be valid already
+        (see sgl.bulk), and none of the usual checks are made.
+        """
+        if trusted:
+            return cls._from_trusted_dict(value)
         precondition(isinstance(value, dict), '"value" must be a dict')
         all = value.get('all')
         if all:
@@ -64,16 +99,126 @@ class Condition:
         any = value.get('any')
         if any:
             any = [Condition.from_dict(x) for x in any]
-        return Condition(value.get('id'), value.get('n'), value.get('roles'), all, any)
+        id = value.get('id')
+        roles = value.get('roles')
+        if not (id or roles or all or any):
+            # Otherwise, the condition is on a custom property, named by the one field left over.
+            props = [k for k in value if k not in CONDITION_FIELDS]
+            precondition(len(props) == 1, 'a condition on a custom property must name exactly one property.')
+            return Condition(n=value.get('n'), prop=props[0], value=value[props[0]], op=value.get('op'))
+        return Condition(id, value.get('n'), roles, all, any, op=value.get('op'))
+
+    @classmethod
+    def _from_trusted_dict(cls, value: dict) -> 'Condition':
+        # Same normalization as __init__, without validation.
+        c = cls.__new__(cls)
+        c.id = c.n = c.roles = c.all = c.any = None
+        c.prop = c.value = c.op = None
+        c._key = c._hash = c._test = None
+        id = value.get('id')
+        if id:
+            c.id = sys.intern(id)
+            return c
+        roles = value.get('roles')
+        if roles:
+            c.roles = sys.intern(roles) if type(roles) is str else roles
+            n = value.get('n')
+            c.n = 1 if n is None else int(n)
+            return c
+        all = value.get('all')
+        if all:
+            c.all = tuple([cls._from_trusted_dict(x) for x in all])
+            return c
+        any = value.get('any')
+        if any:
+            n = value.get('n')
+            c.n = n if (n and n > 1) else 1
+            c.any = tuple([cls._from_trusted_dict(x) for x in any])
+            return c
+        prop = next(k for k in value if k not in CONDITION_FIELDS)
+        c.prop = sys.intern(prop)
+        c.value, c.op = normalize_condition(prop, value[prop], value.get('op'))
+        n = value.get('n')
+        c.n = 1 if n is None else int(n)
+        return c
 
     @classmethod
-    def from_json(cls, json_text: str) -> 'Condition':
+    def from_json(cls, json_text: str, trusted=False) -> 'Condition':
         precondition(json_text, '"json_text" must be non-empty.')
         precondition_is_str(json_text, "json_text")
-        return Condition.from_dict(json.loads(json_text))
+        return Condition.from_dict(json.loads(json_text), trusted)
+
+    def to_binary(self) -> bytes:
+        """
+        Return the compact binary rendering of this condition. See sgl.binary.
+        """
+        from .binary import encode
+        return encode(self)
+
+    @classmethod
+    def from_binary(cls, data) -> 'Condition':
+        from .binary import decode_as
+        return decode_as(data, Condition)
+
+    def test(self) -> Callable[['Principal'], bool]:
+        """
+        For a condition on a custom property, return a function that tells whether one principal
+        passes it. The operator is resolved into the function once, and the function is cached.
+        """
+        test = self._test
+        if test is None:
+            precondition(self.prop, "only a condition on a custom property has a test.")
+            test = self._test = compile_test(self.prop, self.op, self.value)
+        return test
+
+    def compile(self) -> 'CompiledCondition':
+        """
+        Return a reusable predicate that evaluates this condition without re-interpreting it on
+        every call. See sgl.compiled.
+        """
+        from .compiled import CompiledCondition
+        return CompiledCondition(self)
+
+    def key(self) -> tuple:
+        """
+        Return a canonical, hashable description of this condition's structure. The key and the
+        hash are computed once and cached, so a condition must not be modified after it has been
+        used as a dict key or compared.
+        """
+        key = self._key
+        if key is None:
+            if self.id:
+                key = ("id", self.id)
+            elif self.roles:
+                key = ("roles", self.roles, self.n)
+            elif self.prop:
+                key = ("prop", self.prop, self.op, value_key(self.value), self.n)
+            elif self.any:
+                key = ("any", self.n, tuple(x.key() for x in self.any))
+            else:
+                key = ("all", tuple(x.key() for x in self.all))
+            self._key = key
+        return key
+
+    def __hash__(self):
+        h = self._hash
+        if h is None:
+            # Combine the cached hashes of subconditions rather than rehashing the whole key.
+            if self.any:
+                h = hash(("any", self.n, tuple(hash(x) for x in self.any)))
+            elif self.all:
+                h = hash(("all", tuple(hash(x) for x in self.all)))
+            else:
+                h = hash(self.key())
+            self._hash = h
+        return h
 
     def __eq__(self, other):
+        if self is other:
+            return True
         if isinstance(other, Condition):
-            return self.__dict__ == other.__dict__
+            if hash(self) != hash(other):
+                return False
+            return self.key() == other.key()
         return NotImplemented
 
@@ -0,0 +1,213 @@
+from collections import Counter
+from typing import List, Sequence, Union
+
+from .dbc import *
+from .principal import Principal
+from .rule import Rule
+from .condition import Condition
+from .api import _normalize_condition, _can_match, _is_leaf, _augment
+
+
+def _serves(p: Principal, leaf: Condition) -> bool:
+    if leaf.id:
+        return p.id == leaf.id
+    if leaf.prop:
+        return leaf.test()(p)
+    return bool(p.roles) and leaf.roles in p.roles
+
+
+def _deficit(leaf: Condition, have: int) -> Condition:
+    """
+    Describe what a leaf still lacks: the leaf itself for an id, or the number of holders of a
+    role (or of principals passing a custom property test) still needed.
+    """
+    if leaf.id:
+        return leaf
+    if leaf.prop:
+        return Condition(prop=leaf.prop, value=leaf.value, op=leaf.op, n=leaf.n - have)
+    return Condition(roles=leaf.roles, n=leaf.n - have)
+
+
+def _prop_leaves(c: Condition):
+    if c.prop:
+        yield c
+    elif c.all or c.any:
+        for x in c.all or c.any:
+            yield from _prop_leaves(x)
+
+
+class GroupEvaluator:
+    """
+    Track whether a group that changes one member at a time satisfies a condition, without
+    re-evaluating the whole group after every change.
+
+    A disjoint "all" of leaves -- the shape of typical multi-signature rules -- keeps a maximum
+    matching of principals to leaves (see _match_demands). Adding or removing a principal changes
+    the size of a maximum matching by at most one, so a single augmenting path search brings it up
+    to date. Conditions whose result only depends on how many members hold each id and role, or
+    pass each custom property test (leaves, "any", and overlapping evaluation) keep those counts.
+    Any other condition is re-evaluated from scratch, lazily, when its result is asked for.
+    """
+
+    def __init__(self, condition: Union[Rule, Condition, dict], disjoint=True,
+                 group: Sequence[Principal] = None):
+        self.condition = _normalize_condition(condition)
+        self.disjoint = disjoint
+        c = self.condition
+        if _is_leaf(c):
+            self._leaves = [c]
+        elif disjoint and _can_match(c):
+            self._leaves = list(c.all)
+        else:
+            self._leaves = None
+        self._slots = {}
+        self._free = []
+        self._owner = []
+        self._candidates = [[] for leaf in self._leaves] if self._leaves else None
+        self._filled = [0] * len(self._leaves) if self._leaves else None
+        self._needs = [leaf.n or 1 for leaf in self._leaves] if self._leaves else None
+        self._ids = Counter()
+        self._roles = Counter()
+        self._props = Counter()
+        self._prop_leaves = list(dict.fromkeys(_prop_leaves(c)))
+        self._result = None
+        # Only a disjoint "all" that can't be matched needs the full search.
+        self._compiled = c.compile() if self._leaves is None and disjoint and c.all else None
+        if group:
+            for p in group:
+                self.add(p)
+
+    def __len__(self):
+        return len(self._slots)
+
+    def __contains__(self, p: Principal):
+        return p in self._slots
+
+    @property
+    def group(self) -> List[Principal]:
+        return list(self._slots)
+
+    def add(self, p: Union[Principal, dict]) -> bool:
+        """
+        Add a principal to the group (if it isn't already a member) and tell whether the group now
+        satisfies the condition.
+        """
+        if isinstance(p, dict):
+            p = Principal.from_dict(p)
+        precondition(isinstance(p, Principal), '"p" must be a Principal or dict.')
+        if p in self._slots:
+            return self.satisfied
+        if self._free:
+            slot = self._free.pop()
+        else:
+            slot = len(self._owner)
+            self._owner.append(-1)
+        self._slots[p] = slot
+        self._count(p, 1)
+        if self._leaves:
+            for i, leaf in enumerate(self._leaves):
+                if _serves(p, leaf):
+                    self._candidates[i].append(slot)
+            self._rematch()
+        else:
+            self._result = None
+        return self.satisfied
+
+    def remove(self, p: Principal) -> bool:
+        """
+        Remove a member from the group and tell whether the group still satisfies the condition.
+        """
+        slot = self._slots.pop(p, None)
+        precondition(slot is not None, '"p" is not a member of the group.')
+        self._count(p, -1)
+        if self._leaves:
+            for candidates in self._candidates:
+                if slot in candidates:
+                    candidates.remove(slot)
+            leaf = self._owner[slot]
+            self._owner[slot] = -1
+            if leaf != -1:
+                self._filled[leaf] -= 1
+                self._rematch()
+        else:
+            self._result = None
+        self._free.append(slot)
+        return self.satisfied
+
+    def _count(self, p: Principal, delta: int):
+        if p.id:
+            self._ids[p.id] += delta
+        if p.roles:
+            for role in p.roles:
+                self._roles[role] += delta
+        for leaf in self._prop_leaves:
+            if leaf.test()(p):
+                self._props[leaf] += delta
+
+    def _rematch(self):
+        """
+        Restore a maximum matching after one member was added or removed: at most one more slot
+        can be filled, by an augmenting path from some leaf that is still short.
+        """
+        for i, need in enumerate(self._needs):
+            if self._filled[i] < need:
+                if _augment(i, self._candidates, self._owner):
+                    self._filled[i] += 1
+                    return
+
+    def _holders(self, leaf: Condition) -> int:
+        if leaf.id:
+            return self._ids[leaf.id]
+        if leaf.prop:
+            return self._props[leaf]
+        return self._roles[leaf.roles]
+
+    def _check_counts(self, c: Condition) -> bool:
+        if c.id:
+            return self._ids[c.id] > 0
+        if c.roles:
+            return self._roles[c.roles] >= c.n
+        if c.prop:
+            return self._props[c] >= c.n
+        if c.any:
+            return sum(1 for x in c.any if self._check_counts(x)) >= c.n
+        return all(self._check_counts(x) for x in c.all)
+
+    @property
+    def satisfied(self) -> bool:
+        if not self._slots:
+            return False
+        if self._leaves:
+            return all(have >= need for have, need in zip(self._filled, self._needs))
+        if self._compiled is not None:
+            if self._result is None:
+                self._result = self._compiled.evaluate(set(self._slots))
+            return self._result
+        return self._check_counts(self.condition)
+
+    def missing(self) -> List[Condition]:
+        """
+        Return the leaves the group still falls short on, each with n reduced to the number of
+        additional holders it needs. For a matchable condition this is exact: adding principals
+        that cover these deficits, each serving one leaf, satisfies it. Otherwise it lists every
+        leaf (once) that the current members don't satisfy even when counted with overlap, which
+        is a cheap hint rather than a complete answer.
+        """
+        if self._leaves:
+            return [_deficit(leaf, have) for leaf, have, need in zip(self._leaves, self._filled, self._needs)
+                    if have < need]
+        missing = []
+        seen = set()
+        stack = [self.condition]
+        while stack:
+            c = stack.pop()
+            if c in seen:
+                continue
+            seen.add(c)
+            if _is_leaf(c):
+                have = self._holders(c)
+                if have < (c.n or 1):
+                    missing.append(_deficit(c, have))
+            else:
+                stack.extend(reversed(c.all or c.any))
+        return missing
@@ -0,0 +1,147 @@
+import threading
+import time
+from typing import Callable, List
+
+from .dbc import *
+
+# The Instrumentation that evaluations report to, or None. Evaluation code looks this up once per
+# call, so leaving instrumentation off costs next to nothing.
+active = None
+
+
+class SearchStats:
+    """
+    Counters for one evaluation: condition nodes visited, combinations generated, subsets produced
+    by the disjoint search, branches skipped by the minimum-size check ("Optimization 2"), answers
+    found in a memo, and the deepest the search recursed.
+    """
+    __slots__ = ['nodes', 'combinations', 'subsets', 'pruned', 'memo_hits', 'depth', 'max_depth']
+
+    FIELDS = ['nodes', 'combinations', 'subsets', 'pruned', 'memo_hits', 'max_depth']
+
+    def __init__(self):
+        self.nodes = self.combinations = self.subsets = self.pruned = self.memo_hits = 0
+        self.depth = self.max_depth = 0
+
+    def enter(self):
+        self.depth += 1
+        if self.depth > self.max_depth:
+            self.max_depth = self.depth
+
+    def leave(self):
+        self.depth -= 1
+
+    def as_dict(self) -> dict:
+        return {name: getattr(self, name) for name in self.FIELDS}
+
+
+class Histogram:
+    """
+    Counts of durations falling at or below each bound (in seconds), plus one bucket for anything
+    slower than the last bound.
+    """
+    __slots__ = ['bounds', 'counts', 'count', 'total']
+
+    DEFAULT_BOUNDS = (0.00001, 0.0001, 0.001, 0.01, 0.1, 1.0)
+
+    def __init__(self, bounds: List[float] = DEFAULT_BOUNDS):
+        self.bounds = tuple(bounds)
+        self.counts = [0] * (len(self.bounds) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def record(self, seconds: float):
+        i = 0
+        for bound in self.bounds:
+            if seconds <= bound:
+                break
+            i += 1
+        self.counts[i] += 1
+        self.count += 1
+        self.total += seconds
+
+    def as_dict(self) -> dict:
+        buckets = [[bound, count] for bound, count in zip(self.bounds, self.counts)]
+        buckets.append(["inf", self.counts[-1]])
+        return {"count": self.count, "total": self.total, "buckets": buckets}
+
+
+class Instrumentation:
+    """
+    Totals of SearchStats across evaluations, a timing histogram for all of them, and one per rule
+    (for evaluations of a Rule or a compiled rule). If callback is given, it is called after each
+    evaluation with a dict of that evaluation's counters, its "seconds", and its "rule" (a Rule, or
+    None), which makes it easy to forward to a metrics system. Safe to share across threads.
+    """
+
+    def __init__(self, callback: Callable[[dict], None] = None, bounds: List[float] = Histogram.DEFAULT_BOUNDS):
+        self.callback = callback
+        self.bounds = bounds
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.calls = 0
+            self.totals = {name: 0 for name in SearchStats.FIELDS}
+            self.timings = Histogram(self.bounds)
+            self.rule_timings = {}
+
+    def measure(self, rule, fn: Callable, *args):
+        """
+        Call fn(*args, stats) with a fresh SearchStats, and record what it did and how long it took.
+        """
+        stats = SearchStats()
+        started = time.perf_counter()
+        answer = fn(*args, stats)
+        self.record(stats, time.perf_counter() - started, rule)
+        return answer
+
+    def record(self, stats: SearchStats, seconds: float, rule=None):
+        with self._lock:
+            self.calls += 1
+            totals = self.totals
+            for name in SearchStats.FIELDS:
+                if name == 'max_depth':
+                    totals[name] = max(totals[name], stats.max_depth)
+                else:
+                    totals[name] += getattr(stats, name)
+            self.timings.record(seconds)
+            if rule is not None:
+                histogram = self.rule_timings.get(rule)
+                if histogram is None:
+                    histogram = self.rule_timings[rule] = Histogram(self.bounds)
+                histogram.record(seconds)
+        if self.callback is not None:
+            report = stats.as_dict()
+            report["seconds"] = seconds
+            report["rule"] = rule
+            self.callback(report)
+
+    def as_dict(self) -> dict:
+        """
+        Export everything as plain data. Rules are identified by their JSON text.
+        """
+        with self._lock:
+            answer = {"calls": self.calls}
+            answer.update(self.totals)
+            answer["seconds"] = self.timings.as_dict()
+            answer["rules"] = {rule.to_json(): histogram.as_dict() for rule, histogram in self.rule_timings.items()}
+        return answer
+
+
+def enable(instrumentation: Instrumentation = None) -> Instrumentation:
+    """
+    Start reporting every evaluation to instrumentation (by default, a new one), and return it.
+    """
+    global active
+    if instrumentation is None:
+        instrumentation = Instrumentation()
+    precondition(isinstance(instrumentation, Instrumentation), '"instrumentation" must be an Instrumentation.')
+    active = instrumentation
+    return instrumentation
+
+
+def disable():
+    global active
+    active = None
@@ -0,0 +1,65 @@
+from typing import Union
+
+from .dbc import *
+from .principal import Principal
+from .rule import Rule
+from .condition import Condition
+
+
+class Interner:
+    """
+    A hash-consing table for conditions, rules and principals. Interning an object returns the
+    canonical instance of everything structurally identical to it, so a subcondition that recurs
+    across many rules is stored once, and equality checks between interned objects succeed on
+    identity. Interned objects must not be modified.
+    """
+
+    def __init__(self):
+        self._conditions = {}
+        self._rules = {}
+        self._principals = {}
+
+    def __len__(self):
+        return len(self._conditions) + len(self._rules) + len(self._principals)
+
+    def condition(self, c: Condition) -> Condition:
+        precondition(isinstance(c, Condition), '"c" must be a Condition.')
+        found = self._conditions.get(c)
+        if found is not None:
+            return found
+        children = c.all or c.any
+        if children:
+            interned = [self.condition(x) for x in children]
+            # Don't modify the caller's object; build a new node if any subcondition changed.
+            if any(a is not b for a, b in zip(interned, children)):
+                c = Condition(all=interned) if c.all else Condition(any=interned, n=c.n)
+        self._conditions[c] = c
+        return c
+
+    def rule(self, rule: Rule) -> Rule:
+        precondition(isinstance(rule, Rule), '"rule" must be a Rule.')
+        found = self._rules.get(rule)
+        if found is not None:
+            return found
+        when = self.condition(rule.when)
+        if when is not rule.when:
+            rule = Rule(rule.privs, when)
+        self._rules[rule] = rule
+        return rule
+
+    def principal(self, p: Principal) -> Principal:
+        """
+        Return the canonical instance of a principal. Principals without an id are distinct
+        individuals even when their roles match, so they are returned unchanged.
+        """
+        precondition(isinstance(p, Principal), '"p" must be a Principal.')
+        if not p.id:
+            return p
+        return self._principals.setdefault(p, p)
+
+    def intern(self, obj: Union[Condition, Rule, Principal]):
+        if isinstance(obj, Condition):
+            return self.condition(obj)
+        if isinstance(obj, Rule):
+            return self.rule(obj)
+        return self.principal(obj)
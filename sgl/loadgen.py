@@ -0,0 +1,114 @@
+"""
+Load generator for AuthorizationServer. Run it against a server that is already listening:
+
+    python -m sgl.server rules.json --port 8750 &
+    python -m sgl.loadgen rules.json --port 8750 --requests 10000 --concurrency 64
+
+It asks for the privileges the rules grant, on behalf of random groups built from the ids and roles
+the rules mention, and prints throughput and latency percentiles as JSON.
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from typing import List, Sequence
+
+from .principal import Principal
+from .rule import Rule
+from .condition import Condition
+from .client import AuthorizationClient
+
+
+def _names(c: Condition, ids: set, roles: set):
+    if c.id:
+        ids.add(c.id)
+    elif c.roles:
+        roles.add(c.roles)
+    elif c.all or c.any:
+        for x in c.all or c.any:
+            _names(x, ids, roles)
+
+
+def make_requests(rules: Sequence[Rule], count: int, seed: int = 0, distinct: int = 100) -> List[dict]:
+    """
+    Build count authorize requests drawn from distinct different questions, so that some of them
+    repeat the way real traffic does.
+    """
+    rand = random.Random(seed)
+    ids, roles = set(), set()
+    for rule in rules:
+        _names(rule.when, ids, roles)
+    ids, roles = sorted(ids), sorted(roles) or ["member"]
+    privs = sorted({priv for rule in rules for priv in rule.privs})
+    questions = []
+    for i in range(distinct):
+        group = []
+        for j in range(rand.randint(1, 6)):
+            held = rand.sample(roles, rand.randint(1, min(2, len(roles))))
+            id = rand.choice(ids) if ids and rand.random() < 0.3 else None
+            group.append(Principal(id=id, roles=held).to_dict())
+        questions.append({"group": group, "priv": rand.choice(privs)})
+    return [rand.choice(questions) for i in range(count)]
+
+
+def _percentile(ordered: List[float], fraction: float) -> float:
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+async def run(client: AuthorizationClient, requests: Sequence[dict], concurrency: int = 64) -> dict:
+    """
+    Send requests through client with at most concurrency of them in flight. Return counts of
+    granted and denied requests, throughput, and latency percentiles in milliseconds.
+    """
+    latencies = []
+    granted = 0
+    position = iter(requests)
+
+    async def worker():
+        nonlocal granted
+        for request in position:
+            started = time.perf_counter()
+            response = await client.request(request)
+            latencies.append(time.perf_counter() - started)
+            if response.get("granted"):
+                granted += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*[worker() for i in range(concurrency)])
+    elapsed = time.perf_counter() - started
+    latencies.sort()
+    stats = {"requests": len(latencies), "granted": granted, "denied": len(latencies) - granted,
+             "seconds": elapsed, "per_second": len(latencies) / elapsed if elapsed else 0.0}
+    if latencies:
+        for name, fraction in [("p50_ms", 0.5), ("p90_ms", 0.9), ("p99_ms", 0.99)]:
+            stats[name] = _percentile(latencies, fraction) * 1000
+        stats["max_ms"] = latencies[-1] * 1000
+    return stats
+
+
+def main(argv=None):
+    from .server import load_rules, _run
+    parser = argparse.ArgumentParser(description="Generate load against an SGL authorization server.")
+    parser.add_argument("rules", help="the rules the server holds, used to build realistic requests")
+    where = parser.add_mutually_exclusive_group(required=True)
+    where.add_argument("--unix", help="path of the server's unix socket")
+    where.add_argument("--port", type=int, help="the server's localhost TCP port")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--requests", type=int, default=10000)
+    parser.add_argument("--distinct", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--pool-size", type=int, default=4)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    requests = make_requests(load_rules(args.rules), args.requests, args.seed, args.distinct)
+
+    async def go():
+        async with AuthorizationClient(args.unix, args.host, args.port, args.pool_size) as client:
+            return await run(client, requests, args.concurrency)
+
+    print(json.dumps(_run(go()), indent=2))
+
+
+if __name__ == "__main__":
+    main()
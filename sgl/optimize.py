@@ -0,0 +1,151 @@
+from typing import List, Tuple
+
+from .dbc import *
+from .condition import Condition
+from .properties import value_key
+from .api import _can_match, _estimate_cost
+
+
+def _describe(path: str) -> str:
+    return path if path else "/"
+
+
+def _order_key(c: Condition) -> tuple:
+    # Ids are the most selective leaves, so they go first; then roles; then subtrees by cost.
+    return (_estimate_cost(c), 0 if c.id else 1)
+
+
+def _test_key(c: Condition):
+    """
+    Return what a counted leaf tests, apart from how many principals must pass: its role, or its
+    custom property test. Return None for other conditions.
+    """
+    if c.roles:
+        return ("roles", c.roles)
+    if c.prop:
+        return ("prop", c.prop, c.op, value_key(c.value))
+    return None
+
+
+def _with_n(c: Condition, n: int) -> Condition:
+    if c.prop:
+        return Condition(prop=c.prop, value=c.value, op=c.op, n=n)
+    return Condition(roles=c.roles, n=n)
+
+
+def _describe_test(c: Condition) -> str:
+    return f'role "{c.roles}"' if c.roles else f'property "{c.prop}"'
+
+
+def _merge_duplicates(children: List[Condition], kind: str, path: str, changes: List[str]) -> List[Condition]:
+    """
+    Drop repeated subconditions of an overlapping "all" or an "any" with n == 1, and merge leaves
+    that make the same test of a role or custom property. In an "all", the leaf with the largest n
+    implies the others; in an "any", the one with the smallest n does.
+    """
+    answer = []
+    seen = set()
+    tests_at = {}
+    for x in children:
+        key = _test_key(x)
+        if key is not None:
+            i = tests_at.get(key)
+            if i is not None:
+                kept = answer[i]
+                n = max(kept.n, x.n) if kind == "all" else min(kept.n, x.n)
+                if n != kept.n:
+                    answer[i] = _with_n(x, n)
+                changes.append(f'{_describe(path)}: merged duplicate tests of {_describe_test(x)} in {kind}')
+                continue
+            tests_at[key] = len(answer)
+        elif x in seen:
+            changes.append(f'{_describe(path)}: removed duplicate {x.to_json()} from {kind}')
+            continue
+        seen.add(x)
+        answer.append(x)
+    return answer
+
+
+def _optimize_overlapping(c: Condition, path: str, changes: List[str], keep_all: bool) -> Condition:
+    """
+    Rewrite a condition that _check_satisfies evaluates without disjoint semantics. Here the usual
+    laws of boolean algebra hold, except that an "any" with n > 1 counts its satisfied children, so
+    its children can only be reordered. If keep_all is true, the result must not become an "all"
+    unless c already was one, because a top-level "all" is evaluated differently.
+    """
+    if c.id or c.roles or c.prop:
+        return c
+    kind = "all" if c.all else "any"
+    original = c.all or c.any
+    children = [_optimize_overlapping(x, f"{path}/{kind}/{i}", changes, False) for i, x in enumerate(original)]
+    flat = kind == "all" or c.n == 1
+    if flat:
+        merged = []
+        for i, x in enumerate(children):
+            nested = x.all if kind == "all" else (x.any if x.any and x.n == 1 else None)
+            if nested:
+                changes.append(f"{path}/{kind}/{i}: flattened nested {kind} into its parent")
+                merged.extend(nested)
+            else:
+                merged.append(x)
+        children = _merge_duplicates(merged, kind, path, changes)
+    ordered = sorted(children, key=_order_key)
+    if any(a is not b for a, b in zip(ordered, children)):
+        changes.append(f"{_describe(path)}: reordered {kind} by estimated cost")
+    children = ordered
+    if flat and len(children) == 1 and not (keep_all and children[0].all and not c.all):
+        changes.append(f"{_describe(path)}: replaced {kind} of one item with the item itself")
+        return children[0]
+    if len(children) == len(original) and all(a is b for a, b in zip(children, original)):
+        return c
+    return Condition(all=children) if kind == "all" else Condition(any=children, n=c.n)
+
+
+def _optimize_disjoint(c: Condition, changes: List[str]) -> Condition:
+    """
+    Rewrite a top-level "all" that is evaluated with disjoint semantics. The minimal-subset search
+    is sensitive to the shape of the tree, so we only touch "all"s of leaves, which are decided by
+    matching: there, leaves that make the same test of a role or custom property can be combined by
+    adding their n's, and the order of leaves doesn't matter.
+    """
+    if not _can_match(c):
+        return c
+    children = []
+    tests_at = {}
+    for x in c.all:
+        key = _test_key(x)
+        if key is not None:
+            i = tests_at.get(key)
+            if i is not None:
+                children[i] = _with_n(x, children[i].n + x.n)
+                changes.append(f'/: combined disjoint tests of {_describe_test(x)} into one with n={children[i].n}')
+                continue
+            tests_at[key] = len(children)
+        children.append(x)
+    ordered = sorted(children, key=_order_key)
+    if any(a is not b for a, b in zip(ordered, children)):
+        changes.append("/: reordered all by estimated cost")
+    if len(ordered) == 1:
+        changes.append("/: replaced all of one item with the item itself")
+        return ordered[0]
+    if len(ordered) == len(c.all) and all(a is b for a, b in zip(ordered, c.all)):
+        return c
+    return Condition(all=ordered)
+
+
+def optimize(condition: Condition, disjoint=True) -> Tuple[Condition, List[str]]:
+    """
+    Apply rewrites that don't change what a condition means when it is evaluated with the given
+    disjoint setting: flattening nested "all" and "any" nodes, removing duplicates, merging tests
+    of the same role, collapsing nodes with one child, and putting cheap, selective subconditions
+    first so evaluation can stop sooner. Return the optimized condition and a list of the changes
+    that were made, each prefixed with the path of the node it affected. The input is not
+    modified; if nothing could be improved, it is returned as-is.
+    """
+    precondition(isinstance(condition, Condition), '"condition" must be a Condition.')
+    changes = []
+    if disjoint and condition.all:
+        answer = _optimize_disjoint(condition, changes)
+    else:
+        answer = _optimize_overlapping(condition, "", changes, bool(disjoint))
+    return answer, changes
@@ -0,0 +1,177 @@
+import json
+import os
+import sys
+from array import array
+from concurrent.futures import Executor, FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from typing import Iterable, List, Sequence, Union
+
+from .dbc import *
+from .principal import Principal
+from .rule import Rule
+from .condition import Condition
+from .api import _normalize_group, _normalize_condition, _can_match, _GroupIndex, _Search, _popcount, \
+    _iter_matching_minimal_masks, _has_matching_minimal_mask
+
+
+def _gil_disabled() -> bool:
+    is_gil_enabled = getattr(sys, "_is_gil_enabled", None)
+    return is_gil_enabled is not None and not is_gil_enabled()
+
+
+def default_executor(max_workers: int = None) -> Executor:
+    """
+    Return the kind of executor that can actually run evaluations in parallel: a process pool,
+    or a thread pool on free-threaded builds of python, where threads don't contend for the GIL.
+    """
+    if _gil_disabled():
+        return ThreadPoolExecutor(max_workers)
+    return ProcessPoolExecutor(max_workers)
+
+
+# Workers see the same few conditions over and over, so they keep the compiled form of each one,
+# keyed by the JSON text it was shipped as.
+_compiled_by_text = {}
+_MAX_COMPILED = 1024
+
+
+def _compiled(text: str):
+    compiled = _compiled_by_text.get(text)
+    if compiled is None:
+        if len(_compiled_by_text) >= _MAX_COMPILED:
+            _compiled_by_text.clear()
+        compiled = _compiled_by_text[text] = Condition.from_json(text).compile()
+    return compiled
+
+
+def _members(text: str) -> List[Principal]:
+    return [Principal.from_dict(x) for x in json.loads(text)]
+
+
+def _serialize_group(group) -> str:
+    return json.dumps([p.to_dict() for p in group], separators=(",", ":"))
+
+
+def _evaluate_chunk(disjoint, conditions: List[str], items: List[tuple]) -> bytes:
+    """
+    Worker side of satisfies_parallel(): evaluate (group text, condition number) items.
+    """
+    results = bytearray(len(items))
+    groups = {}
+    for i, (text, which) in enumerate(items):
+        group = groups.get(text)
+        if group is None:
+            group = groups[text] = set(_members(text))
+        if _compiled(conditions[which]).evaluate(group, disjoint):
+            results[i] = 1
+    return bytes(results)
+
+
+def satisfies_parallel(pairs: Iterable[tuple], disjoint=True, executor: Executor = None,
+                       max_workers: int = None, chunksize: int = 64) -> array:
+    """
+    Like satisfies_many(), but fans the work out to an executor -- by default, one from
+    default_executor(), which is shut down afterwards. Groups and conditions are normalized
+    once, in this process, and shipped to workers as compact JSON text; each distinct condition is
+    serialized once per chunk of work rather than pickled as a graph of Condition objects.
+    Return an array of 1 (satisfied) and 0 (not), in the same order as pairs.
+    """
+    precondition(isinstance(chunksize, int) and chunksize > 0, '"chunksize" must be a positive integer.')
+    # Groups and conditions are remembered by id(), so keep every one of them alive until we're
+    # done; otherwise a generator's freed objects could lend their ids to later ones.
+    pairs = list(pairs)
+    group_texts = {}
+    condition_texts = {}
+    items = []
+    for group, condition in pairs:
+        group_text = group_texts.get(id(group))
+        if group_text is None:
+            group_text = group_texts[id(group)] = _serialize_group(_normalize_group(group))
+        condition_text = condition_texts.get(id(condition))
+        if condition_text is None:
+            condition_text = condition_texts[id(condition)] = _normalize_condition(condition).to_json()
+        items.append((group_text, condition_text))
+    chunks = []
+    for start in range(0, len(items), chunksize):
+        chunk = items[start:start + chunksize]
+        texts = sorted(set(condition for group, condition in chunk))
+        numbers = {text: i for i, text in enumerate(texts)}
+        chunks.append((texts, [(group, numbers[condition]) for group, condition in chunk]))
+    results = array("B")
+    if not chunks:
+        return results
+    owned = executor is None
+    if owned:
+        executor = default_executor(max_workers)
+    try:
+        for answer in executor.map(_evaluate_chunk, [disjoint] * len(chunks), *zip(*chunks)):
+            results.frombytes(answer)
+    finally:
+        if owned:
+            executor.shutdown()
+    return results
+
+
+def _search_part(group: str, condition: str, subsets: List[int]) -> bool:
+    """
+    Worker side of satisfies_split(): try one share of the ways to satisfy the first subcondition.
+    """
+    c = Condition.from_json(condition)
+    # Members arrive in the order the masks refer to, so index them in that order.
+    index = _GroupIndex(_members(group))
+    search = _Search(index)
+    min_group_remainder_size = search.rest_min_size(c, 1)
+    group_len = len(index.members)
+    for subset in subsets:
+        if group_len - _popcount(subset) < min_group_remainder_size:
+            continue
+        group_remainder = index.full & ~subset
+        if group_remainder and _has_matching_minimal_mask(search, group_remainder, c, 1):
+            return True
+    return False
+
+
+def satisfies_split(group: Union[Principal, Sequence[Principal], dict],
+                    condition: Union[Rule, Condition, dict], executor: Executor = None,
+                    max_workers: int = None, parts: int = None) -> bool:
+    """
+    Decide one expensive disjoint check by splitting its search across workers. The ways to
+    satisfy the first subcondition of the top-level "all" are worked out here and divided into
+    parts (by default, 4 per worker, or per CPU if max_workers isn't given); each worker looks for a
+    way to satisfy the rest of the "all" with what its subsets leave over. We stop as soon as any
+    worker finds one, without waiting for the others to finish.
+
+    Conditions that don't need the combinatorial search are just evaluated here.
+    """
+    group = _normalize_group(group)
+    c = _normalize_condition(condition)
+    if not c.all or len(c.all) == 1 or _can_match(c):
+        return c.compile().evaluate(group)
+    index = _GroupIndex(group)
+    subsets = list(_iter_matching_minimal_masks(_Search(index), index.full, c.all[0]))
+    if not subsets:
+        return False
+    if parts is None:
+        parts = 4 * (max_workers or os.cpu_count() or 1)
+    precondition(isinstance(parts, int) and parts > 0, '"parts" must be a positive integer.')
+    owned = executor is None
+    if owned:
+        executor = default_executor(max_workers)
+    found = False
+    try:
+        group_text = _serialize_group(index.members)
+        condition_text = c.to_json()
+        pending = {executor.submit(_search_part, group_text, condition_text, subsets[i::parts])
+                   for i in range(min(parts, len(subsets)))}
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            if any(future.result() for future in done):
+                found = True
+                for future in pending:
+                    future.cancel()
+                return True
+        return False
+    finally:
+        if owned:
+            # Parts still running can't change the answer once one has found a way; let them
+            # finish in the background rather than waiting for them.
+            executor.shutdown(wait=not found)
@@ -1,50 +1,170 @@
 import json
-from typing import List, Set, Union
+import sys
+from typing import FrozenSet, List, Set, Union
 
 from .dbc import *
+from .properties import PRINCIPAL_FIELDS, _SCALARS, _shared, _shared_layout, canonical_value, \
+    normalize_principal_value
+
+
+# Directories tend to contain millions of principals but only a handful of distinct combinations
+# of roles. Every principal with the same roles shares one frozenset from this registry (which is
+# bounded; see sgl.properties.MAX_SHARED), and every role name is an interned string.
+_role_sets = {}
+
+
+def _shared_role_set(roles) -> FrozenSet[str]:
+    roles = frozenset(sys.intern(role) for role in roles)
+    return _shared(_role_sets, roles, roles)
+
+
+def _supported(value) -> bool:
+    return isinstance(value, _SCALARS) or (
+        isinstance(value, list) and all(isinstance(x, _SCALARS) for x in value))
+
+
+def _extra_fields(value: dict) -> dict:
+    """
+    Return the custom properties in the dict form of a principal. Values that properties can't hold
+    (such as nested objects) are ignored, as unknown fields always have been.
+    """
+    if len(value) == ("id" in value) + ("roles" in value):
+        return None
+    return {k: v for k, v in value.items() if k not in PRINCIPAL_FIELDS and _supported(v)}
 
 
 class Principal:
-    def __init__(self, id: str = None, roles: Union[List[str], Set[str]] = None):
+    """
+    A member of a group: an id, a set of roles, and optionally custom properties (see
+    docs/custom-properties.md). Principals with the same property names share one layout, and
+    store just a tuple of values each.
+    """
+    __slots__ = ['id', 'roles', '_key', '_layout', '_values']
+
+    def __init__(self, id: str = None, roles: Union[List[str], Set[str]] = None, props: dict = None):
         self.id = self.roles = None
-        precondition(bool(id) or bool(roles), 'either "id" or "roles" must have a meaningful value.')
+        self._key = self._layout = self._values = None
+        precondition(bool(id) or bool(roles) or bool(props),
+                     'either "id", "roles" or "props" must have a meaningful value.')
         if id:
             precondition_is_str(id, "id")
             self.id = id
         if roles:
             precondition_nonempty_sequence_of_str(roles, "roles")
-            self.roles = sorted(set(roles))
+            self.roles = _shared_role_set(roles)
+        if props:
+            precondition(isinstance(props, dict), '"props" must be a dict.')
+            for name in props:
+                precondition(isinstance(name, str) and name not in PRINCIPAL_FIELDS,
+                             f'"{name}" cannot be used as the name of a custom property.')
+            self._set_props(props)
+
+    def _set_props(self, props: dict):
+        names = tuple(sorted(props))
+        self._layout = _shared_layout(names)
+        self._values = tuple(normalize_principal_value(name, props[name]) for name in names)
+
+    @property
+    def props(self) -> dict:
+        """
+        The custom properties of this principal, as a new dict. Arrays are given as sorted lists.
+        """
+        if self._layout is None:
+            return {}
+        return {name: canonical_value(value) for name, value in zip(self._layout, self._values)}
+
+    def get(self, name: str, default=None):
+        """
+        Return the value of a custom property, or default if this principal doesn't have it. An
+        array is given as a sorted list.
+        """
+        layout = self._layout
+        if layout is not None:
+            i = layout.get(name)
+            if i is not None:
+                return canonical_value(self._values[i])
+        return default
 
     def __str__(self):
         return self.to_json()
 
     def to_dict(self) -> dict:
-        if self.id and self.roles:
-            return self.__dict__
+        answer = {}
         if self.id:
-            return {"id": self.id}
-        return {"roles": self.roles}
+            answer["id"] = self.id
+        if self.roles:
+            answer["roles"] = sorted(self.roles)
+        if self._layout is not None:
+            for name, value in zip(self._layout, self._values):
+                answer[name] = canonical_value(value)
+        return answer
 
     def to_json(self) -> str:
         return json.dumps(self.to_dict())
 
     @classmethod
-    def from_dict(cls, value: dict) -> 'Principal':
+    def from_dict(cls, value: dict, trusted=False) -> 'Principal':
+        """
+        Build a Principal from its dict form. If trusted, the dict is assumed to be valid already
+        (see sgl.bulk), and none of the usual checks are made.
+        """
+        if trusted:
+            p = cls.__new__(cls)
+            p._key = p._layout = p._values = None
+            p.id = value.get('id') or None
+            roles = value.get('roles')
+            p.roles = _shared_role_set(roles) if roles else None
+            props = _extra_fields(value)
+            if props:
+                p._set_props(props)
+            return p
         precondition(isinstance(value, dict), '"value" must be a dict')
-        return Principal(value.get('id'), value.get('roles'))
+        return Principal(value.get('id'), value.get('roles'), _extra_fields(value))
 
     @classmethod
-    def from_json(cls, json_text: str) -> 'Principal':
+    def from_json(cls, json_text: str, trusted=False) -> 'Principal':
         precondition(json_text, '"json_text" must be non-empty.')
         precondition_is_str(json_text, "json_text")
-        return Principal.from_dict(json.loads(json_text))
+        return Principal.from_dict(json.loads(json_text), trusted)
+
+    def to_binary(self) -> bytes:
+        """
+        Return the compact binary rendering of this principal. See sgl.binary.
+        """
+        from .binary import encode
+        return encode(self)
+
+    @classmethod
+    def from_binary(cls, data) -> 'Principal':
+        from .binary import decode_as
+        return decode_as(data, Principal)
+
+    def key(self) -> tuple:
+        """
+        Return a canonical, hashable description of this principal's id and roles, followed by its
+        custom properties if it has any. It is computed once and cached, so a principal must not be
+        modified after it has been used.
+        """
+        key = self._key
+        if key is None:
+            key = (self.id or "", tuple(sorted(self.roles)) if self.roles else ())
+            if self._layout is not None:
+                # Values are compared as JSON text, so keys of any two principals can be sorted.
+                key += tuple((name, json.dumps(canonical_value(value)))
+                             for name, value in zip(self._layout, self._values))
+            self._key = key
+        return key
 
     def __eq__(self, other):
+        if self is other:
+            return True
         if isinstance(other, Principal):
-            return self.__dict__ == other.__dict__
+            return self.key() == other.key()
         return NotImplemented
 
     def __hash__(self):
-        return hash((self.id, str(self.roles))) if self.id else hash(id(self))
+        # Principals without an id are anonymous individuals: two of them with the same roles are
+        # still two members of a group, so they hash by identity rather than by structure.
+        return hash(self.key()) if self.id else hash(id(self))
 
 
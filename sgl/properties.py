@@ -0,0 +1,279 @@
+"""
+Custom properties of principals, and the operators that conditions use to test them. See
+docs/custom-properties.md.
+
+A property value is a JSON scalar (str, number, bool or null) or an array of them. Principals
+store arrays as frozensets; conditions store them as tuples in a canonical order, so equivalent
+conditions have the same key. Each operator is turned into a specialized test function once, when
+a condition is first evaluated, rather than dispatched every time a principal is tested.
+
+Python considers True equal to 1 and False equal to 0, but JSON doesn't. Inside a set, a bool is
+stored as one of the _Bool markers below, so a set can hold both true and 1; and keys describe a
+value with the type of each scalar, so conditions on true and on 1 are never merged.
+"""
+import re
+import sys
+from typing import Callable, Tuple
+
+from .dbc import *
+
+# Fields of a condition or principal that are not custom properties.
+CONDITION_FIELDS = frozenset(["id", "roles", "all", "any", "n", "op"])
+PRINCIPAL_FIELDS = frozenset(["id", "roles"])
+
+COMPARISONS = ("=", "!=", "<", ">", "<=", ">=")
+OPERATORS = COMPARISONS + ("in", "not in", "contains", "like")
+
+_SCALARS = (str, int, float, bool, type(None))
+
+# Registries of shared values (here, and of role sets in sgl.principal) hold at most this many
+# entries, so that a long-running process building principals from untrusted input (such as
+# sgl.server) doesn't keep every combination it has ever seen. A full registry starts over;
+# principals built already keep what they share.
+MAX_SHARED = 4096
+
+
+def _shared(registry: dict, key, value):
+    """
+    Return the value registered under key, registering value first if there isn't one.
+    """
+    found = registry.get(key)
+    if found is None:
+        if len(registry) >= MAX_SHARED:
+            registry.clear()
+        found = registry.setdefault(key, value)
+    return found
+
+
+# Principals with the same property names share one layout, which maps each name to the position
+# of its value in the principal's tuple of values.
+_layouts = {}
+
+
+def _shared_layout(names: tuple) -> dict:
+    return _layouts.get(names) or _shared(_layouts, names, {name: i for i, name in enumerate(names)})
+
+
+# Sets of values repeat across principals as often as sets of roles do.
+_value_sets = {}
+
+
+def _order(value):
+    # Sorts a mix of JSON scalars without comparing values of different types.
+    return (type(value).__name__, value)
+
+
+def _is_number(value) -> bool:
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+class _Bool:
+    """
+    A JSON boolean as a member of a set, where True would be the same member as 1.
+    """
+    __slots__ = ['value']
+
+    def __init__(self, value: bool):
+        self.value = value
+
+    def __eq__(self, other):
+        return isinstance(other, _Bool) and other.value is self.value
+
+    def __hash__(self):
+        return hash((_Bool, self.value))
+
+    def __repr__(self):
+        return "true" if self.value else "false"
+
+
+_BOOLS = {True: _Bool(True), False: _Bool(False)}
+
+
+def _item(x):
+    # The form of a scalar as a member of a set.
+    if x is True or x is False:
+        return _BOOLS[x]
+    return sys.intern(x) if isinstance(x, str) else x
+
+
+def _plain(x):
+    return x.value if isinstance(x, _Bool) else x
+
+
+def _typed(x):
+    if x is True or x is False:
+        return ("bool", x)
+    if _is_number(x):
+        return ("number", x)
+    return (type(x).__name__, x)
+
+
+def value_key(value):
+    """
+    Return a hashable description of a condition's value in which true and 1 differ.
+    """
+    if isinstance(value, tuple):
+        return tuple(_typed(x) for x in value)
+    return _typed(value)
+
+
+def normalize_principal_value(name: str, value):
+    """
+    Return the form in which a principal stores a property value: strings are interned, and arrays
+    become shared frozensets.
+    """
+    if isinstance(value, str):
+        return sys.intern(value)
+    if isinstance(value, _SCALARS):
+        return value
+    precondition(isinstance(value, (list, tuple, set, frozenset)) and all(isinstance(x, _SCALARS) for x in value),
+                 f'property "{name}" must be a JSON scalar or an array of them.')
+    value = frozenset(_item(x) for x in value)
+    return _shared(_value_sets, value, value)
+
+
+def canonical_value(value):
+    """
+    Return a JSON-friendly form of a stored value: a set becomes a sorted list.
+    """
+    if isinstance(value, frozenset):
+        return sorted([_plain(x) for x in value], key=_order)
+    return value
+
+
+def default_op(value) -> str:
+    return "in" if isinstance(value, tuple) else "="
+
+
+def normalize_condition(name: str, value, op: str) -> Tuple[object, str]:
+    """
+    Check the value and op of a condition on a custom property. Return the value in canonical form
+    (an array becomes a sorted tuple without duplicates) and the op, with its default filled in.
+    """
+    precondition(isinstance(name, str) and name not in CONDITION_FIELDS,
+                 f'"{name}" cannot be used as the name of a custom property.')
+    if isinstance(value, (list, tuple, set, frozenset)):
+        precondition(all(isinstance(x, _SCALARS) for x in value),
+                     f'the value of "{name}" must be a JSON scalar or an array of them.')
+        value = tuple(sorted([_plain(x) for x in set(_item(x) for x in value)], key=_order))
+    else:
+        precondition(isinstance(value, _SCALARS), f'the value of "{name}" must be a JSON scalar or an array of them.')
+        if isinstance(value, str):
+            value = sys.intern(value)
+    if op is None:
+        op = default_op(value)
+    precondition(op in OPERATORS, f'"op" must be one of {", ".join(OPERATORS)}.')
+    if op in ("in", "not in"):
+        precondition(isinstance(value, tuple), f'"{op}" needs an array of values.')
+    elif op in ("<", ">", "<=", ">="):
+        precondition(_is_number(value) or isinstance(value, str), f'"{op}" needs a number or a str.')
+    elif op == "like":
+        precondition(isinstance(value, str), '"like" needs a regular expression.')
+        try:
+            re.compile(value)
+        except re.error as e:
+            raise PreconditionViolation(f'"{value}" is not a valid regular expression: {e}')
+    return value, op
+
+
+# Each of these takes the value from a condition and returns a test of a principal's value. The
+# principal's value is a scalar or a frozenset.
+
+def _equals(value) -> Callable:
+    if isinstance(value, tuple):
+        wanted = frozenset(_item(x) for x in value)
+        return lambda x: x == wanted
+    # A set-valued property "equals" a scalar that it holds, as roles do.
+    item = _item(value)
+    if isinstance(value, bool) or value is None:
+        return lambda x: item in x if isinstance(x, frozenset) else x is value
+    return lambda x: item in x if isinstance(x, frozenset) else (x == value and not isinstance(x, bool))
+
+
+def _not_equals(value) -> Callable:
+    equals = _equals(value)
+    return lambda x: not equals(x)
+
+
+def _in(value) -> Callable:
+    wanted = frozenset(_item(x) for x in value)
+
+    def test(x):
+        if isinstance(x, frozenset):
+            return not wanted.isdisjoint(x)
+        if x is True or x is False:
+            return _BOOLS[x] in wanted
+        return x in wanted
+    return test
+
+
+def _not_in(value) -> Callable:
+    contained = _in(value)
+    return lambda x: not contained(x)
+
+
+def _contains(value) -> Callable:
+    if isinstance(value, tuple):
+        wanted = frozenset(_item(x) for x in value)
+        return lambda x: wanted <= x if isinstance(x, frozenset) else False
+    if isinstance(value, str):
+        return lambda x: value in x if isinstance(x, (frozenset, str)) else False
+    item = _item(value)
+    return lambda x: item in x if isinstance(x, frozenset) else False
+
+
+def _ordering(compare: Callable) -> Callable:
+    def make(value) -> Callable:
+        if isinstance(value, str):
+            return lambda x: isinstance(x, str) and compare(x, value)
+
+        # A set-valued property is compared by its size.
+        def test(x):
+            if isinstance(x, frozenset):
+                return compare(len(x), value)
+            return _is_number(x) and compare(x, value)
+        return test
+    return make
+
+
+def _like(value) -> Callable:
+    search = re.compile(value).search
+
+    def test(x):
+        if isinstance(x, str):
+            return search(x) is not None
+        if isinstance(x, frozenset):
+            return any(isinstance(item, str) and search(item) is not None for item in x)
+        return False
+    return test
+
+
+_MAKERS = {
+    "=": _equals,
+    "!=": _not_equals,
+    "<": _ordering(lambda a, b: a < b),
+    ">": _ordering(lambda a, b: a > b),
+    "<=": _ordering(lambda a, b: a <= b),
+    ">=": _ordering(lambda a, b: a >= b),
+    "in": _in,
+    "not in": _not_in,
+    "contains": _contains,
+    "like": _like,
+}
+
+
+def compile_test(name: str, op: str, value) -> Callable:
+    """
+    Return a function that tells whether a principal has property name, and its value passes op
+    with value. A principal without the property never passes, whatever the op.
+    """
+    check = _MAKERS[op](value)
+
+    def test(p) -> bool:
+        layout = p._layout
+        if layout is not None:
+            i = layout.get(name)
+            if i is not None:
+                return bool(check(p._values[i]))
+        return False
+    return test
@@ -0,0 +1,193 @@
+import itertools
+import time
+from typing import Iterator, List, Sequence, Set, Union
+
+from .dbc import *
+from .principal import Principal
+from .rule import Rule
+from .condition import Condition
+from .api import _normalize_condition
+
+
+def _leaves(c: Condition, slots: dict):
+    """
+    Map each distinct leaf of c to the total number of principals its occurrences can call for.
+    """
+    if c.id or c.roles or c.prop:
+        slots[c] = slots.get(c, 0) + (c.n or 1)
+    else:
+        for x in c.all or c.any:
+            _leaves(x, slots)
+
+
+def _max_quorum_size(c: Condition) -> int:
+    """
+    Return an upper bound on the size of a minimal quorum. Every member of a minimal quorum fills
+    a slot some leaf needs, so no quorum needs more members than the leaves have slots.
+    """
+    if c.id:
+        return 1
+    if c.roles or c.prop:
+        return c.n
+    if c.all:
+        return sum(_max_quorum_size(x) for x in c.all)
+    return sum(sorted((_max_quorum_size(x) for x in c.any), reverse=True)[:c.n])
+
+
+def _shapes(caps: List[int], size: int, start: int = 0) -> Iterator[List[int]]:
+    """
+    Yield every way to take size members from classes of interchangeable principals, taking at
+    most caps[i] from class i.
+    """
+    if start == len(caps):
+        if size == 0:
+            yield []
+        return
+    for count in range(min(caps[start], size), -1, -1):
+        if sum(caps[start + 1:]) < size - count:
+            break
+        for rest in _shapes(caps, size - count, start + 1):
+            yield [count] + rest
+
+
+def _expand(shape: List[int], classes: List[tuple], start: int = 0) -> Iterator[tuple]:
+    """
+    Yield every set of principals with the given shape. Unlike itertools.product, this never
+    materializes the combinations of a class, which can be enormous.
+    """
+    if start == len(shape):
+        yield ()
+        return
+    for picked in itertools.combinations(classes[start][1], shape[start]):
+        for rest in _expand(shape, classes, start + 1):
+            yield picked + rest
+
+
+class QuorumIndex:
+    """
+    An index of a directory of principals by id and by role, for asking which minimal sets of
+    principals ("quorums") from the directory would satisfy a condition.
+
+    Only principals that can satisfy some leaf of the condition are considered. Those that satisfy
+    the same leaves are interchangeable, so we search over how many members to take from each such
+    class -- usually a handful of classes, however large the directory -- rather than over
+    combinations of principals. Each shape that is a minimal quorum is then expanded into actual
+    sets of principals lazily.
+    """
+
+    def __init__(self, principals: Sequence[Union[Principal, dict]]):
+        principals = [Principal.from_dict(x) if isinstance(x, dict) else x for x in principals]
+        precondition_nonempty_sequence_of_x(principals, "principals", Principal)
+        # Groups are sets, so a directory can't list the same principal twice.
+        principals = list(dict.fromkeys(principals))
+        self._size = len(principals)
+        self._principals = principals
+        self._by_id = {}
+        self._by_role = {}
+        self._by_prop = {}
+        for p in principals:
+            if p.id:
+                self._by_id.setdefault(p.id, []).append(p)
+            if p.roles:
+                for role in p.roles:
+                    self._by_role.setdefault(role, []).append(p)
+
+    def __len__(self):
+        return self._size
+
+    def candidates(self, leaf: Condition) -> List[Principal]:
+        """
+        Return the principals that satisfy an id, roles or custom property leaf.
+        """
+        if leaf.id:
+            return self._by_id.get(leaf.id, [])
+        if leaf.roles:
+            return self._by_role.get(leaf.roles, [])
+        found = self._by_prop.get(leaf)
+        if found is None:
+            test = leaf.test()
+            found = self._by_prop[leaf] = [p for p in self._principals if test(p)]
+        return found
+
+    def _classes(self, c: Condition) -> List[tuple]:
+        """
+        Partition the principals that matter to c by the set of leaves each one satisfies. Return
+        (leaves, members, cap) tuples, where cap is the most members of the class a minimal quorum
+        could use.
+        """
+        slots = {}
+        _leaves(c, slots)
+        leaves = list(slots)
+        profiles = {}
+        for i, leaf in enumerate(leaves):
+            for p in self.candidates(leaf):
+                profiles.setdefault(p, []).append(i)
+        classes = {}
+        for p, served in profiles.items():
+            classes.setdefault(tuple(served), []).append(p)
+        answer = []
+        for served, members in sorted(classes.items()):
+            answer.append((served, members, min(len(members), sum(slots[leaves[i]] for i in served))))
+        return answer
+
+    def iter_quorums(self, condition: Union[Rule, Condition, dict], disjoint=True, limit: int = None,
+                     deadline: float = None, clock=time.monotonic) -> Iterator[Set[Principal]]:
+        """
+        Yield the minimal subsets of the directory that satisfy a condition, smallest first. Stop
+        after limit quorums, or once clock() passes deadline.
+        """
+        c = _normalize_condition(condition)
+        precondition(limit is None or (isinstance(limit, int) and limit >= 0), '"limit" must be a non-negative integer.')
+        compiled = c.compile()
+        classes = self._classes(c)
+        caps = [cap for served, members, cap in classes]
+        yielded = 0
+        if limit == 0 or not classes:
+            return
+
+        def satisfied(shape):
+            group = set()
+            for count, (served, members, cap) in zip(shape, classes):
+                group.update(members[:count])
+            return bool(group) and compiled.evaluate(group, disjoint)
+
+        for size in range(1, min(sum(caps), _max_quorum_size(c)) + 1):
+            for shape in _shapes(caps, size):
+                if deadline is not None and clock() > deadline:
+                    return
+                if not satisfied(shape):
+                    continue
+                # Satisfaction only grows as members are added, so a quorum is minimal exactly when
+                # dropping any one member breaks it.
+                smaller = list(shape)
+                minimal = True
+                for i, count in enumerate(shape):
+                    if count:
+                        smaller[i] -= 1
+                        minimal = not satisfied(smaller)
+                        smaller[i] += 1
+                        if not minimal:
+                            break
+                if not minimal:
+                    continue
+                for picked in _expand(shape, classes):
+                    if deadline is not None and clock() > deadline:
+                        return
+                    yield set(picked)
+                    yielded += 1
+                    if limit is not None and yielded >= limit:
+                        return
+
+
+def iter_quorums(directory: Sequence[Union[Principal, dict]], condition: Union[Rule, Condition, dict],
+                 disjoint=True, limit: int = None, deadline: float = None) -> Iterator[Set[Principal]]:
+    """
+    Yield the minimal subsets of a directory of principals that satisfy a condition, smallest
+    first. Build a QuorumIndex instead to ask several questions of the same directory.
+    """
+    return QuorumIndex(directory).iter_quorums(condition, disjoint, limit, deadline)
+
+
+def quorums(directory: Sequence[Union[Principal, dict]], condition: Union[Rule, Condition, dict],
+            disjoint=True, limit: int = None, deadline: float = None) -> List[Set[Principal]]:
+    return list(iter_quorums(directory, condition, disjoint, limit, deadline))
@@ -1,4 +1,5 @@
 import json
+import sys
 from typing import Sequence
 
 from .dbc import *
@@ -6,9 +7,12 @@ from .condition import Condition
 
 
 class Rule:
+    __slots__ = ['privs', 'when', '_hash']
+
     def __init__(self, privs: Sequence[str], when: Condition):
         precondition_nonempty_sequence_of_str(privs, "privs")
-        self.privs = sorted(set(privs))
+        self.privs = tuple(sorted(set(sys.intern(priv) for priv in privs)))
+        self._hash = None
         if isinstance(when, dict):
             self.when = Condition.from_dict(when)
         elif isinstance(when, Condition):
@@ -20,25 +24,72 @@ class Rule:
         return self.to_json()
 
     def to_dict(self):
-        return {"grant": self.privs, "when": self.when.to_dict()}
+        return {"grant": list(self.privs), "when": self.when.to_dict()}
 
     def to_json(self) -> str:
         return json.dumps(self.to_dict())
 
     @classmethod
-    def from_dict(cls, value: dict) -> 'Rule':
+    def from_dict(cls, value: dict, trusted=False) -> 'Rule':
+        """
+        Build a Rule from its dict form. If trusted, the dict is assumed to be valid already
+        (see sgl.bulk), and none of the usual checks are made.
+        """
+        if trusted:
+            rule = cls.__new__(cls)
+            rule.privs = tuple(sorted(set(sys.intern(priv) for priv in value["grant"])))
+            rule._hash = None
+            when = value["when"]
+            rule.when = Condition._from_trusted_dict(when) if isinstance(when, dict) else when
+            return rule
         precondition(isinstance(value, dict), '"value" must be a dict')
         return Rule(value.get("grant"), value.get("when"))
 
     @classmethod
-    def from_json(cls, json_text: str) -> 'Rule':
+    def from_json(cls, json_text: str, trusted=False) -> 'Rule':
         precondition(json_text, '"json_text" must be non-empty.')
         precondition_is_str(json_text, "json_text")
-        return Rule.from_dict(json.loads(json_text))
+        return Rule.from_dict(json.loads(json_text), trusted)
+
+    def to_binary(self) -> bytes:
+        """
+        Return the compact binary rendering of this rule. See sgl.binary.
+        """
+        from .binary import encode
+        return encode(self)
+
+    @classmethod
+    def from_binary(cls, data) -> 'Rule':
+        from .binary import decode_as
+        return decode_as(data, Rule)
+
+    def compile(self) -> 'CompiledRule':
+        """
+        Return a reusable predicate that evaluates this rule's condition and knows which privileges
+        it grants. See sgl.compiled.
+        """
+        from .compiled import CompiledRule
+        return CompiledRule(self)
+
+    def key(self) -> tuple:
+        """
+        Return a canonical, hashable description of this rule. See Condition.key().
+        """
+        return (self.privs, self.when.key())
+
+    def __hash__(self):
+        h = self._hash
+        if h is None:
+            h = self._hash = hash((self.privs, hash(self.when)))
+        return h
 
     def __eq__(self, other):
+        if self is other:
+            return True
         if isinstance(other, Rule):
-            return self.__dict__ == other.__dict__
+            if hash(self) != hash(other):
+                return False
+            return self.privs == other.privs and self.when == other.when
         return NotImplemented
 
 
@@ -0,0 +1,92 @@
+import bisect
+from typing import Dict, Iterator, List, Optional, Sequence, Set, Tuple, Union
+
+from .dbc import *
+from .principal import Principal
+from .rule import Rule
+from .condition import Condition
+from .api import effective_privileges, _normalize_group, _estimate_cost, _get_min_group_size
+from .compiled import CompiledRule
+from .intern import Interner
+
+
+def _too_small(group_size: int, c: Condition, disjoint) -> bool:
+    """
+    Tell whether a group is too small to possibly satisfy a condition. _get_min_group_size assumes
+    disjoint evaluation, so it only applies to a top-level "all"; otherwise we can only rely on the
+    number of principals a roles or custom property leaf demands.
+    """
+    if c.roles or c.prop:
+        return group_size < c.n
+    if c.all and disjoint:
+        return group_size < _get_min_group_size(c)
+    return False
+
+
+class RuleSet:
+    """
+    A collection of rules, indexed by the privileges they grant. Asking whether a group has a
+    privilege only evaluates rules that grant it, cheapest first, and stops at the first one that
+    is satisfied. Rules are interned as they are added, so subconditions they have in common are
+    stored once.
+    """
+
+    def __init__(self, rules: Sequence[Union[Rule, dict]] = None, interner: Interner = None):
+        self._interner = interner if interner is not None else Interner()
+        self._rules = []
+        self._by_priv = {}
+        if rules:
+            for rule in rules:
+                self.add(rule)
+
+    def add(self, rule: Union[Rule, dict]) -> CompiledRule:
+        if isinstance(rule, dict):
+            rule = Rule.from_dict(rule)
+        precondition(isinstance(rule, Rule), '"rule" must be a Rule or dict.')
+        compiled = self._interner.rule(rule).compile()
+        entry = (_estimate_cost(rule.when), len(self._rules), compiled)
+        self._rules.append(compiled)
+        for priv in compiled.privs:
+            bisect.insort(self._by_priv.setdefault(priv, []), entry)
+        return compiled
+
+    def __len__(self):
+        return len(self._rules)
+
+    def __iter__(self) -> Iterator[Rule]:
+        return (compiled.rule for compiled in self._rules)
+
+    def privileges(self) -> List[str]:
+        return sorted(self._by_priv)
+
+    def candidates(self, priv: str) -> List[Rule]:
+        """
+        Return the rules that grant a privilege, in the order authorize() tries them.
+        """
+        return [entry[2].rule for entry in self._by_priv.get(priv, [])]
+
+    def authorize(self, group: Union[Principal, Sequence[Principal], dict], priv: str,
+                  disjoint=True) -> Optional[Rule]:
+        """
+        Return the first rule that grants priv to group, or None if no rule does.
+        """
+        precondition_is_str(priv, "priv")
+        entries = self._by_priv.get(priv)
+        if not entries:
+            return None
+        group = _normalize_group(group)
+        size = len(group)
+        for cost, seq, compiled in entries:
+            if _too_small(size, compiled.condition, disjoint):
+                continue
+            if compiled.evaluate(group, disjoint):
+                return compiled.rule
+        return None
+
+    def effective_privileges(self, group: Union[Principal, Sequence[Principal], dict],
+                             disjoint=True) -> Tuple[Set[str], Dict[str, Rule]]:
+        """
+        Return every privilege the group holds under these rules, and the first rule (in the order
+        rules were added) that grants each one. See api.effective_privileges().
+        """
+        return effective_privileges(group, self, disjoint)
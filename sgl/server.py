@@ -0,0 +1,333 @@
+import argparse
+import asyncio
+import json
+import sys
+from typing import Dict, List, Union
+
+from .dbc import *
+from .principal import Principal
+from .rule import Rule
+from .api import condition_digest, group_digest, satisfies_many, _normalize_group
+from .ruleset import RuleSet
+from .snapshot import Snapshot, load_snapshot
+
+
+# asyncio.run() and asyncio.get_running_loop() are new in python 3.7.
+_running_loop = getattr(asyncio, "get_running_loop", asyncio.get_event_loop)
+
+if hasattr(asyncio, "run"):
+    _run = asyncio.run
+else:
+    def _run(main):
+        loop = asyncio.new_event_loop()
+        try:
+            asyncio.set_event_loop(loop)
+            return loop.run_until_complete(main)
+        finally:
+            tasks = [task for task in asyncio.Task.all_tasks(loop) if not task.done()]
+            for task in tasks:
+                task.cancel()
+            loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            loop.run_until_complete(loop.shutdown_asyncgens())
+            asyncio.set_event_loop(None)
+            loop.close()
+
+
+def _describe(e: BaseException) -> str:
+    return str(e) or e.__class__.__name__
+
+
+async def _skip_line(reader: asyncio.StreamReader):
+    """
+    Discard the rest of a line that is too long to read, up to and including its newline.
+    """
+    while True:
+        try:
+            await reader.readuntil(b"\n")
+            return
+        except asyncio.IncompleteReadError:
+            return
+        except asyncio.LimitOverrunError as e:
+            await reader.readexactly(e.consumed)
+
+
+class AuthorizationServer:
+    """
+    A local authorization service. It holds compiled rule sets and answers checks sent as
+    newline-delimited JSON over a unix socket or a localhost TCP port. Each request is a JSON
+    object on one line:
+
+        {"id": 1, "group": [...principals...], "priv": "enter"}
+        {"id": 2, "group": {...principal...}, "condition": {...}, "disjoint": false}
+
+    A "priv" request asks a rule set (named by an optional "ruleset" field) to authorize the group;
+    the response is {"id": 1, "granted": true, "rule": {...}}. A "condition" (or "rule") request is
+    a plain satisfies() check; the response is {"id": 2, "result": false}. Problems are reported as
+    {"id": ..., "error": "..."} without closing the connection, as are requests longer than
+    max_request_size bytes.
+
+    Identical questions that arrive while the first one is still being answered share its answer.
+    Distinct questions are collected for up to batch_window seconds (or until max_batch of them are
+    waiting) and evaluated together, so groups are normalized and indexed once per batch.
+    """
+
+    def __init__(self, rulesets: Union[RuleSet, Snapshot, Dict[str, Union[RuleSet, Snapshot]]],
+                 batch_window: float = 0.002, max_batch: int = 256, executor=None,
+                 max_request_size: int = 16 * 1024 * 1024):
+        if isinstance(rulesets, (RuleSet, Snapshot)):
+            rulesets = {"default": rulesets}
+        precondition(rulesets and all(isinstance(x, (RuleSet, Snapshot)) for x in rulesets.values()),
+                     '"rulesets" must be a RuleSet or Snapshot, or a non-empty dict of them.')
+        precondition(isinstance(max_batch, int) and max_batch > 0, '"max_batch" must be a positive integer.')
+        precondition(isinstance(max_request_size, int) and max_request_size > 0,
+                     '"max_request_size" must be a positive integer.')
+        self.rulesets = dict(rulesets)
+        self.max_request_size = max_request_size
+        self.batch_window = batch_window
+        self.max_batch = max_batch
+        self.executor = executor
+        self.stats = {"requests": 0, "coalesced": 0, "evaluated": 0, "batches": 0, "errors": 0}
+        self._in_flight = {}
+        self._queue = None
+        self._batcher = None
+        self._servers = []
+
+    def _ruleset(self, name) -> RuleSet:
+        if name is None and len(self.rulesets) == 1:
+            return next(iter(self.rulesets.values()))
+        ruleset = self.rulesets.get(name if name is not None else "default")
+        precondition(ruleset is not None, f'unknown ruleset {name!r}.')
+        return ruleset
+
+    def _question(self, request: dict) -> tuple:
+        """
+        Turn a request into a normalized question and the key that identifies it for coalescing.
+        """
+        precondition(isinstance(request, dict), 'each request must be a JSON object.')
+        group = request.get("group")
+        if isinstance(group, list):
+            group = [Principal.from_dict(x) if isinstance(x, dict) else x for x in group]
+        group = _normalize_group(group)
+        disjoint = bool(request.get("disjoint", True))
+        priv = request.get("priv")
+        if priv is not None:
+            precondition_is_str(priv, "priv")
+            name = request.get("ruleset")
+            ruleset = self._ruleset(name)
+            return ("priv", name, priv, group_digest(group), disjoint), (ruleset, group, priv, disjoint)
+        condition = request.get("condition") or request.get("rule")
+        precondition(isinstance(condition, dict) and condition, 'a request needs a "priv", "condition" or "rule".')
+        return ("check", condition_digest(condition), group_digest(group), disjoint), (None, group, condition, disjoint)
+
+    def _evaluate_batch(self, questions: List[tuple]) -> List[dict]:
+        answers = [None] * len(questions)
+        checks = {True: [], False: []}
+        for i, (ruleset, group, what, disjoint) in enumerate(questions):
+            if ruleset is not None:
+                rule = ruleset.authorize(group, what, disjoint)
+                answers[i] = {"granted": rule is not None, "rule": rule.to_dict() if rule is not None else None}
+            else:
+                checks[disjoint].append(i)
+        for disjoint, indexes in checks.items():
+            if indexes:
+                results = satisfies_many([questions[i][1:3] for i in indexes], disjoint)
+                for i, result in zip(indexes, results):
+                    answers[i] = {"result": bool(result)}
+        return answers
+
+    def _answer_batch(self, questions: List[tuple]) -> List[dict]:
+        try:
+            return self._evaluate_batch(questions)
+        except (PreconditionViolation, Exception):
+            if len(questions) == 1:
+                raise
+        # One bad question (say, a condition nested too deeply to evaluate) shouldn't cost the rest
+        # of its batch their answers.
+        answers = []
+        for question in questions:
+            try:
+                answers.append(self._evaluate_batch([question])[0])
+            except (PreconditionViolation, Exception) as e:
+                answers.append({"error": _describe(e)})
+        return answers
+
+    async def _run_batches(self):
+        loop = _running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.batch_window
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            self.stats["batches"] += 1
+            self.stats["evaluated"] += len(batch)
+            try:
+                answers = await loop.run_in_executor(self.executor, self._answer_batch, [q for k, q, f in batch])
+                for (key, question, future), answer in zip(batch, answers):
+                    future.set_result(answer)
+            except BaseException as e:
+                for key, question, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                if isinstance(e, asyncio.CancelledError):
+                    raise
+            finally:
+                for key, question, future in batch:
+                    self._in_flight.pop(key, None)
+
+    async def check(self, request: dict) -> dict:
+        """
+        Answer one request (already parsed from JSON), with coalescing and batching.
+        """
+        self.stats["requests"] += 1
+        response = {"id": request.get("id")} if isinstance(request, dict) else {"id": None}
+        try:
+            key, question = self._question(request)
+            future = self._in_flight.get(key)
+            if future is None:
+                future = self._in_flight[key] = _running_loop().create_future()
+                await self._queue.put((key, question, future))
+            else:
+                self.stats["coalesced"] += 1
+            response.update(await asyncio.shield(future))
+        except asyncio.CancelledError:
+            raise
+        except (PreconditionViolation, Exception) as e:
+            response["error"] = _describe(e)
+        if "error" in response:
+            self.stats["errors"] += 1
+        return response
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        lock = asyncio.Lock()
+
+        async def reply(response):
+            async with lock:
+                writer.write(json.dumps(response).encode("utf-8") + b"\n")
+                await writer.drain()
+
+        async def answer(line):
+            try:
+                request = json.loads(line)
+            except Exception as e:
+                self.stats["errors"] += 1
+                response = {"id": None, "error": f"invalid JSON: {_describe(e)}"}
+            else:
+                response = await self.check(request)
+            await reply(response)
+
+        tasks = set()
+        try:
+            while True:
+                try:
+                    line = await reader.readuntil(b"\n")
+                except asyncio.IncompleteReadError as e:
+                    # The last request may not end with a newline.
+                    line = e.partial
+                except asyncio.LimitOverrunError:
+                    await _skip_line(reader)
+                    self.stats["errors"] += 1
+                    await reply({"id": None, "error": f"request longer than {self.max_request_size} bytes."})
+                    continue
+                if not line:
+                    break
+                if line.strip():
+                    # Answer requests concurrently, so one connection can have many in flight.
+                    task = asyncio.ensure_future(answer(line))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+    def _ensure_started(self):
+        if self._batcher is None:
+            self._queue = asyncio.Queue()
+            self._batcher = asyncio.ensure_future(self._run_batches())
+
+    async def start_unix(self, path: str) -> asyncio.AbstractServer:
+        self._ensure_started()
+        server = await asyncio.start_unix_server(self._handle, path, limit=self.max_request_size)
+        self._servers.append(server)
+        return server
+
+    async def start_tcp(self, host: str = "127.0.0.1", port: int = 0) -> asyncio.AbstractServer:
+        """
+        Listen on a TCP port (by default, one chosen by the OS; see the returned server's sockets).
+        """
+        self._ensure_started()
+        server = await asyncio.start_server(self._handle, host, port, limit=self.max_request_size)
+        self._servers.append(server)
+        return server
+
+    async def close(self):
+        for server in self._servers:
+            server.close()
+            await server.wait_closed()
+        self._servers = []
+        if self._batcher is not None:
+            self._batcher.cancel()
+            try:
+                await self._batcher
+            except asyncio.CancelledError:
+                pass
+            self._batcher = None
+
+
+def load_rules(path: str) -> List[Rule]:
+    """
+    Load rules from a file holding either a JSON array of rules or one rule per line.
+    """
+    with open(path, "rt") as f:
+        text = f.read()
+    if text.lstrip().startswith("["):
+        return [Rule.from_dict(x) for x in json.loads(text)]
+    return [Rule.from_json(line) for line in text.splitlines() if line.strip()]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve SGL authorization checks over a local socket.")
+    parser.add_argument("rules", help="file of rules, as a JSON array or one rule per line")
+    where = parser.add_mutually_exclusive_group(required=True)
+    where.add_argument("--unix", help="path of a unix socket to listen on")
+    where.add_argument("--port", type=int, help="localhost TCP port to listen on")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--batch-window", type=float, default=0.002)
+    parser.add_argument("--snapshot", help="serve from this snapshot of the rules, rebuilding it if it is out of date")
+    args = parser.parse_args(argv)
+    if args.snapshot:
+        rules = load_snapshot(args.snapshot, args.rules)
+    else:
+        rules = RuleSet(load_rules(args.rules))
+
+    async def serve():
+        server = AuthorizationServer(rules, batch_window=args.batch_window)
+        if args.unix:
+            listener = await server.start_unix(args.unix)
+        else:
+            listener = await server.start_tcp(args.host, args.port)
+        # Report the port the OS chose, if --port was 0.
+        address = listener.sockets[0].getsockname()
+        print(f"Serving {args.unix or address[0] + ':' + str(address[1])}", file=sys.stderr)
+        try:
+            # Server.serve_forever() is new in python 3.7.
+            await _running_loop().create_future()
+        finally:
+            await server.close()
+
+    try:
+        _run(serve())
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
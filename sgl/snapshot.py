@@ -0,0 +1,388 @@
+"""
+Precompiled snapshots of a rule set, for processes that would otherwise parse and index the same
+policy every time they start.
+
+A snapshot file holds the rules already indexed: a string table of every privilege, role and id;
+the conditions flattened into a table of fixed-size nodes, with subconditions that rules have in
+common stored once; and, for each privilege, the rules that grant it in the order authorize()
+tries them. Opening one maps the file into memory instead of reading it, so processes that open
+the same snapshot share its pages, and nothing is parsed up front. A rule is only built -- and
+compiled -- the first time a check needs it.
+
+The header records a format version, a checksum of the rest of the file, and the size and
+modification time of the file the rules came from. load_snapshot() uses them to notice a snapshot
+that is damaged, from another version, or older than its rules, and to build a fresh one.
+
+    snapshot = load_snapshot("policy.snapshot", "policy.json")
+    rule = snapshot.authorize(group, "enter")
+"""
+import json
+import mmap
+import os
+import struct
+import sys
+import tempfile
+import zlib
+from array import array
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Set, Tuple, Union
+
+from .dbc import *
+from .principal import Principal
+from .rule import Rule
+from .condition import Condition
+from .api import effective_privileges, _normalize_group, _estimate_cost
+from .compiled import CompiledRule
+from .intern import Interner
+from .ruleset import _too_small
+
+MAGIC = b"SGLs"
+VERSION = 1
+
+# magic, version, checksum of everything after the header, number of sections, and the size and
+# modification time (in ns) of the source of the rules, or -1 if there was none. Then the offset
+# and length of each section.
+_HEADER = struct.Struct("<4sIIIqq")
+_SECTION = struct.Struct("<QQ")
+
+# The sections, in order. Every one but the string data is an array of little-endian uint32.
+(_STRING_OFFSETS,  # count + 1 offsets into the string data
+ _STRING_DATA,     # UTF-8
+ _NODES,           # 4 per node: tag, then (string, n, -), or (n, first child, child count); the
+                   # string of a custom property test is its name, op and value as JSON
+ _CHILDREN,        # node numbers
+ _RULES,           # 3 per rule: root node, first privilege, privilege count
+ _RULE_PRIVS,      # string numbers
+ _PRIVS,           # 3 per privilege, sorted by name: string, first entry, entry count
+ _ENTRIES,         # rule numbers
+ ) = range(8)
+_SECTIONS = 8
+_HEADER_SIZE = _HEADER.size + _SECTIONS * _SECTION.size
+
+_ID, _ROLES, _ALL, _ANY, _PROP = range(5)
+_UINT32 = 0xffffffff
+
+
+def _fingerprint(source: Optional[str]) -> Tuple[int, int]:
+    if source is None:
+        return -1, -1
+    st = os.stat(source)
+    return st.st_size, st.st_mtime_ns
+
+
+def _uint32s(values) -> bytes:
+    a = array("I", values)
+    precondition(a.itemsize == 4, "this platform has no 32-bit unsigned array type.")
+    if sys.byteorder == "big":
+        a.byteswap()
+    return a.tobytes()
+
+
+def write_snapshot(rules: Iterable[Union[Rule, dict]], path: str, source: str = None):
+    """
+    Write a snapshot of rules to path. If the rules were loaded from a file, pass its path as
+    source, so that load_snapshot() can tell when the snapshot is out of date. The file is written
+    under a temporary name and then renamed, so a process opening path never sees half of it.
+    """
+    size, mtime = _fingerprint(source)
+    interner = Interner()
+    strings = {}
+    nodes = []
+    children = []
+    node_numbers = {}
+
+    def string(s: str) -> int:
+        precondition(isinstance(s, str), "only conditions on a single role can be snapshotted.")
+        i = strings.get(s)
+        if i is None:
+            i = strings[s] = len(strings)
+        return i
+
+    def node(c: Condition) -> int:
+        # Children are numbered before their parents, so a node only refers to lower numbers.
+        number = node_numbers.get(id(c))
+        if number is not None:
+            return number
+        if c.id:
+            record = (_ID, string(c.id), 0, 0)
+        elif c.roles:
+            precondition(c.n <= _UINT32, '"n" is too large to snapshot.')
+            record = (_ROLES, string(c.roles), c.n, 0)
+        elif c.prop:
+            precondition(c.n <= _UINT32, '"n" is too large to snapshot.')
+            test = json.dumps([c.prop, c.op, list(c.value) if isinstance(c.value, tuple) else c.value])
+            record = (_PROP, string(test), c.n, 0)
+        else:
+            numbers = [node(x) for x in (c.all or c.any)]
+            record = (_ALL, 0, len(children), len(numbers)) if c.all else \
+                (_ANY, min(c.n, _UINT32), len(children), len(numbers))
+            children.extend(numbers)
+        number = node_numbers[id(c)] = len(nodes) // 4
+        nodes.extend(record)
+        return number
+
+    rule_records = []
+    rule_privs = []
+    by_priv = {}
+    for rule in rules:
+        if isinstance(rule, dict):
+            rule = Rule.from_dict(rule)
+        precondition(isinstance(rule, Rule), '"rules" must contain Rule objects or dicts.')
+        rule = interner.rule(rule)
+        seq = len(rule_records) // 3
+        rule_records.extend((node(rule.when), len(rule_privs), len(rule.privs)))
+        rule_privs.extend(string(priv) for priv in rule.privs)
+        cost = _estimate_cost(rule.when)
+        for priv in rule.privs:
+            by_priv.setdefault(priv, []).append((cost, seq))
+
+    privs = []
+    entries = []
+    for priv in sorted(by_priv, key=lambda x: x.encode("utf-8")):
+        ordered = sorted(by_priv[priv])
+        privs.extend((strings[priv], len(entries), len(ordered)))
+        entries.extend(seq for cost, seq in ordered)
+
+    offsets = [0]
+    data = bytearray()
+    for s in strings:
+        data += s.encode("utf-8")
+        offsets.append(len(data))
+    sections = [_uint32s(offsets), bytes(data), _uint32s(nodes), _uint32s(children),
+                _uint32s(rule_records), _uint32s(rule_privs), _uint32s(privs), _uint32s(entries)]
+
+    body = bytearray()
+    table = []
+    for section in sections:
+        # Keep every section 8-byte aligned.
+        body += b"\0" * (-(_HEADER_SIZE + len(body)) % 8)
+        table.append((_HEADER_SIZE + len(body), len(section)))
+        body += section
+    header = _HEADER.pack(MAGIC, VERSION, zlib.crc32(body), _SECTIONS, size, mtime) + \
+        b"".join(_SECTION.pack(*x) for x in table)
+
+    folder = os.path.dirname(os.path.abspath(path))
+    fd, temp = tempfile.mkstemp(dir=folder, prefix=".snapshot-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(header)
+            f.write(body)
+        os.replace(temp, path)
+    except BaseException:
+        os.unlink(temp)
+        raise
+
+
+class Snapshot:
+    """
+    A read-only rule set backed by a snapshot file. It answers the same questions as a RuleSet, in
+    the same order, but builds each rule only when it is first needed. Raise PreconditionViolation
+    if the file is not a valid snapshot (or, if verify, if its checksum doesn't match).
+    """
+
+    def __init__(self, path: str, verify=True):
+        self._map = None
+        with open(path, "rb") as f:
+            precondition(os.fstat(f.fileno()).st_size >= _HEADER_SIZE, "not a snapshot: the file is too short.")
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            self._open(verify)
+        except BaseException:
+            self.close()
+            raise
+        self._strings = {}
+        self._conditions = {}
+        self._compiled = {}
+        self._priv_numbers = {}
+
+    def _open(self, verify: bool):
+        data = memoryview(self._map)
+        magic, version, checksum, count, size, mtime = _HEADER.unpack_from(data)
+        precondition(magic == MAGIC, "not a snapshot.")
+        precondition(version == VERSION, f"snapshot format {version} is not supported (expected {VERSION}).")
+        precondition(count == _SECTIONS, "the snapshot is damaged.")
+        if verify:
+            precondition(zlib.crc32(data[_HEADER_SIZE:]) == checksum, "the snapshot is damaged.")
+        self.source_fingerprint = (size, mtime)
+        sections = []
+        for i in range(_SECTIONS):
+            offset, length = _SECTION.unpack_from(data, _HEADER.size + i * _SECTION.size)
+            precondition(offset + length <= len(data), "the snapshot is damaged.")
+            section = data[offset:offset + length]
+            if i != _STRING_DATA:
+                precondition(length % 4 == 0, "the snapshot is damaged.")
+                if sys.byteorder == "big":
+                    copy = array("I", section.tobytes())
+                    copy.byteswap()
+                    section = memoryview(copy)
+                else:
+                    section = section.cast("I")
+            sections.append(section)
+        (self._string_offsets, self._string_data, self._nodes, self._children, self._rules,
+         self._rule_privs, self._privs, self._entries) = sections
+
+    def close(self):
+        """
+        Unmap the file. Rules that have already been built stay usable.
+        """
+        if self._map is not None:
+            for name in ["_string_offsets", "_string_data", "_nodes", "_children", "_rules",
+                         "_rule_privs", "_privs", "_entries"]:
+                view = getattr(self, name, None)
+                if isinstance(view, memoryview):
+                    view.release()
+            try:
+                self._map.close()
+            except BufferError:
+                # Someone still holds a view of the map; it will be unmapped when they let go.
+                pass
+            self._map = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def is_stale(self, source: str) -> bool:
+        """
+        Tell whether source has changed since this snapshot was written from it.
+        """
+        return self.source_fingerprint != _fingerprint(source)
+
+    def _string(self, i: int) -> str:
+        s = self._strings.get(i)
+        if s is None:
+            offsets = self._string_offsets
+            s = self._strings[i] = sys.intern(str(self._string_data[offsets[i]:offsets[i + 1]], "utf-8"))
+        return s
+
+    def _condition(self, number: int) -> Condition:
+        c = self._conditions.get(number)
+        if c is not None:
+            return c
+        nodes = self._nodes
+        at = number * 4
+        tag, a, b, count = nodes[at], nodes[at + 1], nodes[at + 2], nodes[at + 3]
+        if tag == _ID:
+            c = Condition(id=self._string(a))
+        elif tag == _ROLES:
+            c = Condition(roles=self._string(a), n=b)
+        elif tag == _PROP:
+            prop, op, value = json.loads(self._string(a))
+            c = Condition(prop=prop, value=value, op=op, n=b)
+        else:
+            children = [self._condition(x) for x in self._children[b:b + count]]
+            c = Condition(all=children) if tag == _ALL else Condition(any=children, n=a)
+        self._conditions[number] = c
+        return c
+
+    def _compiled_rule(self, seq: int) -> CompiledRule:
+        compiled = self._compiled.get(seq)
+        if compiled is None:
+            root, first, count = self._rules[seq * 3:seq * 3 + 3]
+            rule = Rule([self._string(x) for x in self._rule_privs[first:first + count]], self._condition(root))
+            compiled = self._compiled[seq] = rule.compile()
+        return compiled
+
+    def __len__(self):
+        return len(self._rules) // 3
+
+    def __iter__(self) -> Iterator[Rule]:
+        return (self._compiled_rule(seq).rule for seq in range(len(self)))
+
+    def rule(self, seq: int) -> Rule:
+        """
+        Return the rule that was seq'th in the list the snapshot was written from.
+        """
+        precondition(0 <= seq < len(self), '"seq" is out of range.')
+        return self._compiled_rule(seq).rule
+
+    def privileges(self) -> List[str]:
+        privs = self._privs
+        return [self._string(privs[i]) for i in range(0, len(privs), 3)]
+
+    def _find(self, priv: str) -> Optional[int]:
+        """
+        Return the number of a privilege in the sorted privilege table, found by bisecting on the
+        encoded names, or None if no rule grants it.
+        """
+        number = self._priv_numbers.get(priv, -1)
+        if number != -1:
+            return number
+        target = priv.encode("utf-8")
+        privs, offsets, data = self._privs, self._string_offsets, self._string_data
+        number = None
+        low, high = 0, len(privs) // 3
+        while low < high:
+            middle = (low + high) // 2
+            s = privs[middle * 3]
+            name = data[offsets[s]:offsets[s + 1]].tobytes()
+            if name < target:
+                low = middle + 1
+            elif name > target:
+                high = middle
+            else:
+                number = middle
+                break
+        if len(self._priv_numbers) < 4096:
+            self._priv_numbers[priv] = number
+        return number
+
+    def _candidates(self, priv: str) -> Sequence[int]:
+        number = self._find(priv)
+        if number is None:
+            return ()
+        first, count = self._privs[number * 3 + 1], self._privs[number * 3 + 2]
+        return self._entries[first:first + count]
+
+    def candidates(self, priv: str) -> List[Rule]:
+        """
+        Return the rules that grant a privilege, in the order authorize() tries them.
+        """
+        return [self._compiled_rule(seq).rule for seq in self._candidates(priv)]
+
+    def authorize(self, group: Union[Principal, Sequence[Principal], dict], priv: str,
+                  disjoint=True) -> Optional[Rule]:
+        """
+        Return the first rule that grants priv to group, or None if no rule does. See
+        RuleSet.authorize().
+        """
+        precondition_is_str(priv, "priv")
+        candidates = self._candidates(priv)
+        if not candidates:
+            return None
+        group = _normalize_group(group)
+        size = len(group)
+        for seq in candidates:
+            compiled = self._compiled_rule(seq)
+            if _too_small(size, compiled.condition, disjoint):
+                continue
+            if compiled.evaluate(group, disjoint):
+                return compiled.rule
+        return None
+
+    def effective_privileges(self, group: Union[Principal, Sequence[Principal], dict],
+                             disjoint=True) -> Tuple[Set[str], Dict[str, Rule]]:
+        """
+        Return every privilege the group holds under these rules. This builds every rule.
+        """
+        return effective_privileges(group, self, disjoint)
+
+
+def load_snapshot(path: str, source: str = None, verify=True) -> Snapshot:
+    """
+    Open the snapshot at path. If it is missing, damaged, written by another version, or older
+    than source (a file of rules, as a JSON array or one rule per line), first build it from source.
+    """
+    try:
+        snapshot = Snapshot(path, verify)
+    except (OSError, PreconditionViolation):
+        precondition(source is not None, f"{path} is not a usable snapshot, and there is no source to rebuild it from.")
+        snapshot = None
+    if snapshot is not None:
+        if source is None or not snapshot.is_stale(source):
+            return snapshot
+        snapshot.close()
+    from .stream import iter_rules
+    write_snapshot(iter_rules(source, errors="raise"), path, source)
+    return Snapshot(path, verify)
@@ -0,0 +1,254 @@
+"""
+Streaming readers for large inputs: newline-delimited JSON (one value per line), or a single
+JSON array that is parsed one element at a time. Memory stays bounded by the size of the largest
+value, not of the input, and a bad value is reported without abandoning the rest of the stream.
+"""
+import io
+import json
+import re
+from collections import namedtuple
+from typing import Iterator, Union
+
+from .dbc import *
+from .principal import Principal
+from .rule import Rule
+from .condition import Condition
+from .api import _canonical_condition_dict, _normalize_group
+from .bulk import validate_condition, validate_principal, validate_rule
+
+# Reading this much at a time is large enough to be efficient, and small enough not to matter.
+CHUNK_SIZE = 1 << 16
+
+# A single value (line or array element) bigger than this is treated as an error rather than
+# buffered indefinitely.
+MAX_VALUE_SIZE = 1 << 26
+
+_ERRORS = ("yield", "skip", "raise")
+
+_number_tail = re.compile(r"[0-9eE.+-]*").match
+
+Decision = namedtuple("Decision", ["position", "request", "result"])
+
+
+class StreamError:
+    """
+    A value in a stream that couldn't be used. position is the line number (starting at 1) for
+    newline-delimited input, or the index of the element for a JSON array.
+    """
+    __slots__ = ['position', 'message', 'text']
+
+    def __init__(self, position: int, message: str, text: str = None):
+        self.position = position
+        self.message = message
+        # Enough of the offending input to recognize it, without holding on to all of it.
+        self.text = text[:200] if text else text
+
+    def __repr__(self):
+        return f"StreamError({self.position}, {self.message!r})"
+
+
+def _open(source):
+    """
+    Accept a path, a text or binary file, or an iterable of lines, and return something we can
+    read() from or iterate over, decoding bytes as UTF-8.
+    """
+    if isinstance(source, str):
+        return open(source, "rt", encoding="utf-8")
+    if isinstance(source, (io.RawIOBase, io.BufferedIOBase)) or "b" in getattr(source, "mode", ""):
+        return io.TextIOWrapper(source, encoding="utf-8")
+    return source
+
+
+def _read_chunk(f) -> str:
+    chunk = f.read(CHUNK_SIZE)
+    return chunk.decode("utf-8") if isinstance(chunk, bytes) else chunk
+
+
+def _iter_lines(f) -> Iterator[tuple]:
+    for number, line in enumerate(f, 1):
+        if isinstance(line, bytes):
+            line = line.decode("utf-8")
+        if len(line) > MAX_VALUE_SIZE:
+            yield number, StreamError(number, "line is too long.", line)
+        elif line.strip():
+            try:
+                yield number, json.loads(line)
+            except ValueError as e:
+                yield number, StreamError(number, f"invalid JSON: {e}", line)
+
+
+def _iter_array(f, buffer: str) -> Iterator[tuple]:
+    """
+    Yield the elements of a JSON array one at a time, reading more input only when the element at
+    hand isn't complete yet. A syntax error in the array itself leaves us with no way to find the
+    next element, so it ends the stream.
+    """
+    decode = json.JSONDecoder().raw_decode
+    at = buffer.index("[") + 1
+    position = 0
+    eof = False
+    # What may come next: a value or the end of the array (at the start), a value (after a comma),
+    # or a comma or the end of the array (after a value).
+    expect = "value or ]"
+    while True:
+        # Skip whitespace, reading more input if that uses up what we have.
+        while True:
+            while at < len(buffer) and buffer[at] in " \t\r\n":
+                at += 1
+            if at < len(buffer) or eof:
+                break
+            chunk = _read_chunk(f)
+            eof = not chunk
+            buffer = buffer[at:] + chunk
+            at = 0
+        if at >= len(buffer):
+            yield position, StreamError(position, "the JSON array is not terminated.")
+            return
+        char = buffer[at]
+        if expect == ", or ]":
+            if char == "]":
+                return
+            if char != ",":
+                yield position, StreamError(position, "invalid JSON: expected ',' or ']' between elements.",
+                                            buffer[at:at + 200])
+                return
+            at += 1
+            expect = "value"
+            continue
+        if char == "]" and expect == "value or ]":
+            return
+        try:
+            value, end = decode(buffer, at)
+            # A number that runs to the end of what we have read (even as far as "1." or "2e")
+            # may go on in the next chunk.
+            complete = eof or _number_tail(buffer, end).end() < len(buffer)
+            error = None
+        except ValueError as e:
+            complete = False
+            error = e
+        if not complete:
+            if not eof and len(buffer) - at < MAX_VALUE_SIZE:
+                chunk = _read_chunk(f)
+                eof = not chunk
+                buffer = buffer[at:] + chunk
+                at = 0
+                continue
+            message = f"invalid JSON: {error}" if error else "value is too long."
+            yield position, StreamError(position, message, buffer[at:at + 200])
+            return
+        yield position, value
+        position += 1
+        expect = ", or ]"
+        at = end
+        if at > CHUNK_SIZE:
+            # Drop what we have consumed, so the buffer never holds more than a value or so.
+            buffer = buffer[at:]
+            at = 0
+
+
+def iter_values(source, format: str = "auto") -> Iterator[tuple]:
+    """
+    Yield (position, value) for each JSON value in source, where value is a StreamError if it
+    couldn't be parsed. format is "jsonl", "array", or "auto" (an array if the first thing in the
+    input is "[").
+    """
+    precondition(format in ("auto", "jsonl", "array"), '"format" must be "auto", "jsonl" or "array".')
+    f = _open(source)
+    if format == "jsonl" or (format == "auto" and not hasattr(f, "read")):
+        yield from _iter_lines(f)
+        return
+    buffer = ""
+    while not buffer.strip():
+        chunk = _read_chunk(f)
+        if not chunk:
+            return
+        buffer += chunk
+    if format == "array" or buffer.lstrip().startswith("["):
+        yield from _iter_array(f, buffer.lstrip())
+        return
+    # Newline-delimited after all: finish the line we have started, then carry on line by line.
+    rest = f.readline()
+    lines = (buffer + (rest.decode("utf-8") if isinstance(rest, bytes) else rest)).splitlines(True)
+    for number, value in _iter_lines(lines):
+        yield number, value
+    for number, value in _iter_lines(f):
+        yield number + len(lines), value
+
+
+def _handle(error: StreamError, errors: str):
+    if errors == "raise":
+        raise PreconditionViolation(f"{error.position}: {error.message}")
+    return errors == "yield"
+
+
+def _iter_objects(source, format, errors, validate, build) -> Iterator:
+    precondition(errors in _ERRORS, f'"errors" must be one of {_ERRORS}.')
+    for position, value in iter_values(source, format):
+        if not isinstance(value, StreamError):
+            try:
+                validate(value, str(position))
+                yield build(value)
+                continue
+            except PreconditionViolation as e:
+                value = StreamError(position, str(e), json.dumps(value))
+        if _handle(value, errors):
+            yield value
+
+
+def iter_rules(source, format: str = "auto", errors: str = "yield") -> Iterator[Union[Rule, StreamError]]:
+    """
+    Yield a Rule for each value in source. Bad values are yielded as StreamError objects, skipped,
+    or raised as a PreconditionViolation, depending on errors ("yield", "skip" or "raise").
+    """
+    return _iter_objects(source, format, errors, validate_rule, lambda x: Rule.from_dict(x, trusted=True))
+
+
+def iter_conditions(source, format: str = "auto", errors: str = "yield") -> Iterator[Union[Condition, StreamError]]:
+    return _iter_objects(source, format, errors, validate_condition,
+                         lambda x: Condition.from_dict(x, trusted=True))
+
+
+def iter_principals(source, format: str = "auto", errors: str = "yield") -> Iterator[Union[Principal, StreamError]]:
+    return _iter_objects(source, format, errors, validate_principal,
+                         lambda x: Principal.from_dict(x, trusted=True))
+
+
+# Replayed requests keep asking about the same few rules, so we keep the compiled form of each,
+# keyed by its canonical structure, up to this many.
+_MAX_CONDITIONS = 4096
+
+
+def iter_decisions(source, disjoint=True, format: str = "auto",
+                   errors: str = "yield") -> Iterator[Union[Decision, StreamError]]:
+    """
+    Evaluate a stream of check requests -- objects with a "group" (a principal or a list of them)
+    and a "rule" or "condition" -- and yield a Decision(position, request, result) for each one. A
+    request may override disjoint with its own "disjoint" field. Bad requests are handled as
+    described for iter_rules().
+    """
+    precondition(errors in _ERRORS, f'"errors" must be one of {_ERRORS}.')
+    conditions = {}
+    for position, request in iter_values(source, format):
+        if not isinstance(request, StreamError):
+            try:
+                precondition(isinstance(request, dict), "a request must be an object.")
+                condition = request.get("rule") or request.get("condition")
+                precondition(isinstance(condition, dict), 'a request needs a "rule" or "condition" object.')
+                if "when" in condition:
+                    condition = condition["when"]
+                key = _canonical_condition_dict(condition)
+                compiled = conditions.get(key)
+                if compiled is None:
+                    if len(conditions) >= _MAX_CONDITIONS:
+                        conditions.clear()
+                    compiled = conditions[key] = Condition.from_dict(condition).compile()
+                group = request.get("group")
+                if isinstance(group, list):
+                    group = [Principal.from_dict(x) for x in group]
+                result = compiled.evaluate(_normalize_group(group), request.get("disjoint", disjoint))
+                yield Decision(position, request, result)
+                continue
+            except (PreconditionViolation, ValueError, TypeError, AttributeError) as e:
+                request = StreamError(position, str(e), json.dumps(request, default=str))
+        if _handle(request, errors):
+            yield request
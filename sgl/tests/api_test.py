@@ -2,6 +2,7 @@ import pytest
 
 from ..api import *
 from .examples import *
+from .randomized import random_condition, random_group
 from ..condition import Condition
 
 
@@ -169,3 +170,168 @@ def donttest_any_with_n_3():
     assert not satisfies([p.grandpa_carl, p.sister_emily, p.investor], x)
     assert satisfies([p.grandpa_carl, p.grandma_carol, p.sister_emily, p.investor], x)
     assert satisfies([p.grandpa_carl, p.sister_emily, p.brother_extra, p.investor], x)
+
+
+def test_matching_handles_large_quorums():
+    signers = [Principal(id="signer%d" % i, roles=["signer"]) for i in range(20)]
+    auditors = [Principal(id="auditor%d" % i, roles=["auditor"]) for i in range(20)]
+    both = [Principal(id="both%d" % i, roles=["signer", "auditor"]) for i in range(5)]
+    x = Condition.from_dict({"all": [
+        {"roles": "signer", "n": 12},
+        {"roles": "auditor", "n": 10},
+        {"id": "both0"}
+    ]})
+    assert satisfies(signers[:10] + auditors[:10] + both, x)
+    assert not satisfies(signers[:8] + auditors[:9] + both, x)
+
+
+def test_matching_agrees_with_enumeration():
+    import random
+    from ..api import _can_match, _satisfies_by_matching, _get_matching_minimal_subsets
+    rand = random.Random(42)
+    roles = ["a", "b", "c"]
+    for trial in range(300):
+        group = set()
+        for i in range(rand.randint(1, 7)):
+            held = [r for r in roles if rand.random() < 0.4]
+            group.add(Principal(id=rand.choice(["x", "y", None]), roles=held or ["z"]))
+        leaves = []
+        for i in range(rand.randint(1, 3)):
+            if rand.random() < 0.2:
+                leaves.append(Condition(id=rand.choice(["x", "y"])))
+            else:
+                leaves.append(Condition(roles=rand.choice(roles), n=rand.randint(1, 3)))
+        x = Condition(all=leaves)
+        assert _can_match(x)
+        assert _satisfies_by_matching(group, x) == bool(_get_matching_minimal_subsets(group, x))
+
+
+def test_minimal_subsets_are_principal_sets():
+    from ..api import _get_matching_minimal_subsets
+    group = {p.grandma_carol, p.grandpa_carl, p.sister_emily}
+    subsets = _get_matching_minimal_subsets(group, r.rations_to_grandparent_and_sibling.when)
+    assert sorted(sorted(x.id for x in s) for s in subsets) == [["Carl", "Emily"], ["Carol", "Emily"]]
+    subsets = _get_matching_minimal_subsets(group, c.two_grandparents)
+    assert subsets == [{p.grandma_carol, p.grandpa_carl}]
+
+
+def test_subset_memo_is_shared_across_calls():
+    from ..api import SubsetMemo
+    memo = SubsetMemo(maxsize=1000)
+    for i in range(2):
+        assert satisfies([p.grandma_carol, p.grandpa_carl], c.trusted, memo=memo)
+        assert not satisfies(p.objs, _complex_condition(), memo=memo)
+        assert satisfies(p.objs + [Principal(roles=["investor"])], _complex_condition(), memo=memo)
+    assert memo.hits > 0
+    assert len(memo) <= 1000
+
+
+def test_subset_memo_is_bounded():
+    from ..api import SubsetMemo
+    memo = SubsetMemo(maxsize=3)
+    assert not satisfies(p.objs, _complex_condition(), memo=memo)
+    assert len(memo) == 3
+    with pytest.raises(PreconditionViolation):
+        SubsetMemo(maxsize=0)
+
+
+def _complex_condition():
+    return Condition(all=[
+        c.bob,
+        Condition(n=2, roles="sibling"),
+        Condition(all=[
+            c.trusted,
+            Condition(all=[
+                Condition(n=2, roles="employee"),
+                Condition(n=2, roles="investor"),
+            ])
+        ])
+    ])
+
+
+def test_lazy_search_agrees_with_full_enumeration():
+    import random
+    from ..api import _GroupIndex, _Search, _get_matching_minimal_masks, _iter_matching_minimal_masks, \
+        _has_matching_minimal_mask
+    rand = random.Random(7)
+    for trial in range(300):
+        x = random_condition(rand)
+        index = _GroupIndex(set(random_group(rand)))
+        everything = _get_matching_minimal_masks(_Search(index), index.full, x)
+        assert list(_iter_matching_minimal_masks(_Search(index), index.full, x)) == everything
+        assert _has_matching_minimal_mask(_Search(index), index.full, x) == bool(everything)
+
+
+def test_iter_minimal_subsets_is_lazy():
+    from ..api import iter_minimal_subsets, minimal_subsets
+    group = [Principal(id="p%d" % i, roles=["signer"]) for i in range(60)]
+    x = Condition(all=[Condition(roles="signer", n=5), Condition(any=[Condition(roles="signer", n=2)])])
+    first = next(iter_minimal_subsets(group, x))
+    assert len(first) == 60
+    assert minimal_subsets(p.grandma_carol, c.grandparent) == [{p.grandma_carol}]
+
+
+def test_satisfies_many_agrees_with_satisfies():
+    from ..api import satisfies_many
+    groups = [[x] for x in p.objs] + [p.objs, [p.grandma_carol, p.grandpa_carl]]
+    pairs = [(group, x) for group in groups for x in c.objs + r.objs + [{"id": "Bob"}]]
+    for disjoint in [True, False]:
+        results = satisfies_many(pairs, disjoint)
+        assert len(results) == len(pairs)
+        assert list(results) == [int(satisfies(group, x, disjoint)) for group, x in pairs]
+
+
+def test_evaluate_matrix_agrees_with_satisfies():
+    from ..api import evaluate_matrix
+    groups = [p.bob, p.objs, {"roles": ["grandparent"]}]
+    conditions = c.objs + r.objs
+    matrix = evaluate_matrix(groups, conditions)
+    assert len(matrix) == len(groups)
+    for group, row in zip(groups, matrix):
+        assert list(row) == [int(satisfies(group, x)) for x in conditions]
+
+
+def test_satisfies_many_checks_preconditions():
+    from ..api import satisfies_many
+    assert len(satisfies_many([])) == 0
+    with pytest.raises(PreconditionViolation):
+        satisfies_many([([], c.bob)])
+    with pytest.raises(PreconditionViolation):
+        satisfies_many([(p.bob, None)])
+
+
+def test_effective_privileges_agrees_with_satisfies():
+    from ..api import effective_privileges
+    groups = [[x] for x in p.objs] + [p.objs, [p.grandma_carol, p.grandpa_carl]]
+    for group in groups:
+        for disjoint in [True, False]:
+            privs, granted_by = effective_privileges(group, r.objs, disjoint)
+            expected = {priv for rule in r.objs if satisfies(group, rule, disjoint) for priv in rule.privs}
+            assert privs == expected
+            for priv, rule in granted_by.items():
+                assert priv in rule.privs
+                assert satisfies(group, rule, disjoint)
+
+
+def test_effective_privileges_names_first_granting_rule():
+    from ..api import effective_privileges
+    from ..rule import Rule
+    first = Rule(["read"], {"roles": "a"})
+    second = Rule(["read", "write"], {"any": [{"roles": "a"}, {"roles": "b"}]})
+    privs, granted_by = effective_privileges({"roles": ["a"]}, [first, second.to_dict()])
+    assert privs == {"read", "write"}
+    assert granted_by["read"] == first
+    assert granted_by["write"] == second
+    assert effective_privileges({"roles": ["c"]}, [first, second]) == (set(), {})
+
+
+def test_effective_privileges_on_random_rules():
+    import random
+    from ..api import effective_privileges
+    from ..rule import Rule
+    rand = random.Random(16)
+    for i in range(100):
+        rules = [Rule([rand.choice(["x", "y", "z"])], random_condition(rand)) for j in range(6)]
+        group = random_group(rand)
+        privs, granted_by = effective_privileges(group, rules)
+        assert privs == {priv for rule in rules if satisfies(group, rule) for priv in rule.privs}
@@ -0,0 +1,25 @@
+import json
+import random
+
+from benchmarks.generators import SHAPES, role_names, make_rules, make_directory
+from benchmarks.run import run, compare
+from ..api import satisfies
+
+
+def test_generators_are_seeded():
+    roles = role_names(5)
+    first = [x.to_dict() for x in make_rules(random.Random(3), 20, roles)]
+    assert first == [x.to_dict() for x in make_rules(random.Random(3), 20, roles)]
+    directory = make_directory(random.Random(3), 50, roles)
+    assert len(directory) == 50
+    for shape in SHAPES:
+        rule = make_rules(random.Random(4), 1, roles, [shape])[0]
+        assert satisfies(directory, rule, disjoint=False) in [True, False]
+
+
+def test_quick_run_is_machine_readable():
+    results = run(seed=1, quick=True)
+    json.dumps(results)
+    assert {x["benchmark"] for x in results["results"]} >= {"satisfies", "satisfies_many", "rule_from_dict"}
+    ratios = compare(results, results)
+    assert ratios and all(x["ratio"] == 1.0 for x in ratios)
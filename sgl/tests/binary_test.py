@@ -0,0 +1,87 @@
+import json
+import random
+
+import pytest
+
+from ..binary import MAGIC, decode, decode_as, encode
+from ..condition import Condition
+from ..dbc import PreconditionViolation
+from ..principal import Principal
+from ..rule import Rule
+from .examples import *
+from .randomized import random_condition, random_group
+
+
+def test_examples_round_trip():
+    for x in c.objs:
+        assert Condition.from_binary(x.to_binary()) == x
+    for x in r.objs:
+        assert Rule.from_binary(x.to_binary()) == x
+    for x in p.objs:
+        assert Principal.from_binary(x.to_binary()).key() == x.key()
+    assert decode(encode(r.objs)) == r.objs
+    assert [x.key() for x in decode(encode(p.objs))] == [x.key() for x in p.objs]
+
+
+def test_random_round_trip():
+    rand = random.Random(23)
+    for i in range(300):
+        condition = random_condition(rand)
+        decoded = decode(encode(condition))
+        assert decoded == condition
+        assert decoded.to_dict() == condition.to_dict()
+    group = random_group(rand)
+    assert [x.key() for x in decode(encode(group))] == [x.key() for x in group]
+
+
+def test_large_numbers_and_unicode():
+    condition = Condition(any=[Condition(roles="rôle", n=300), Condition(id="éé")], n=1000)
+    rule = Rule(["privilège"] * 2, condition)
+    assert Rule.from_binary(rule.to_binary()) == rule
+
+
+def test_memoryview_and_bytearray():
+    data = encode(r.objs)
+    assert decode(memoryview(data)) == r.objs
+    assert decode(bytearray(data)) == r.objs
+    assert decode(memoryview(b"xx" + data)[2:]) == r.objs
+
+
+def test_smaller_than_json():
+    rules = r.objs * 50
+    assert len(encode(rules)) * 3 < len(json.dumps([x.to_dict() for x in rules]))
+
+
+def test_strings_are_shared():
+    data = encode([Condition(roles="a-long-role-name", n=i) for i in range(1, 10)])
+    assert data.count(b"a-long-role-name") == 1
+
+
+def test_kind_is_checked():
+    with pytest.raises(PreconditionViolation):
+        Rule.from_binary(r.objs[0].when.to_binary())
+    with pytest.raises(PreconditionViolation):
+        decode_as(encode(r.objs), Rule)
+    assert decode_as(encode(r.objs), Rule, many=True) == r.objs
+    assert decode_as(encode([]), Principal, many=True) == []
+    with pytest.raises(PreconditionViolation):
+        encode([r.objs[0], r.objs[0].when])
+    with pytest.raises(PreconditionViolation):
+        encode({"id": "x"})
+
+
+def test_invalid_data():
+    data = encode(r.objs)
+    for bad in [b"", b"JSON", data[:-1], data + b"\0", data[:4] + b"\x09" + data[5:],
+                data[:5] + b"q" + data[6:], MAGIC + b"\x01r\x01\x00\x01\x01\x00\x00\x00"]:
+        with pytest.raises(PreconditionViolation):
+            decode(bad)
+
+
+def test_truncated_data():
+    # Floats are read as 8 raw bytes, so cutting one short must still be reported as invalid.
+    for value in [Condition(prop="x", value=2.5, op=">"), Principal(id="a", props={"f": [1.5, "s"]}), r.objs]:
+        data = encode(value)
+        for end in range(len(data)):
+            with pytest.raises(PreconditionViolation):
+                decode(data[:end])
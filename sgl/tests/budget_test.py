@@ -0,0 +1,95 @@
+import itertools
+import random
+
+import pytest
+
+from ..api import satisfies, _comb
+from ..budget import Budget, BudgetExceeded, estimate_cost
+from ..condition import Condition
+from ..dbc import PreconditionViolation
+from ..principal import Principal
+from .examples import *
+from .randomized import random_condition, random_group
+
+
+def _bad_rule(n=4):
+    # A large n on a popular role, next to siblings, inside a disjoint "all".
+    return Condition(all=[
+        Condition(roles="member", n=n),
+        Condition(any=[Condition(roles="member", n=2), Condition(id="nobody")]),
+        Condition(roles="admin"),
+    ])
+
+
+def test_comb():
+    for n in range(8):
+        for k in range(-1, n + 2):
+            assert _comb(n, k) == (len(list(itertools.combinations(range(n), k))) if k >= 0 else 0)
+
+
+def test_estimate_cost_grows_with_group_size():
+    costs = [estimate_cost(_bad_rule(), size) for size in [5, 10, 20, 40]]
+    assert costs == sorted(costs)
+    assert costs[-1] > 1000 * costs[0]
+
+
+def test_estimate_cost_is_small_for_cheap_shapes():
+    multisig = Condition(all=[Condition(roles="a", n=2), Condition(id="x")])
+    assert estimate_cost(multisig, 1000) < 10000
+    assert estimate_cost(_bad_rule(), 1000, disjoint=False) < 10000
+    assert estimate_cost(c.bob, 0) >= 1
+    with pytest.raises(PreconditionViolation):
+        estimate_cost(c.bob, -1)
+
+
+def test_estimate_cost_bounds_actual_steps():
+    rand = random.Random(18)
+    for i in range(200):
+        condition = random_condition(rand)
+        group = random_group(rand)
+        budget = Budget()
+        satisfies(group, condition, budget=budget)
+        assert budget.steps <= estimate_cost(condition, len(set(group))), condition.to_dict()
+
+
+def test_budget_of_the_estimate_never_runs_out():
+    nested = Condition.from_dict({"all": [{"all": [{"all": [{"id": "y"}, {"roles": "a", "n": 2}]}]}, {"id": "z"}]})
+    # Principals can share an id.
+    group = [Principal(id=x, roles=["a", f"r{i}"]) for i, x in enumerate(["y", "y", "y", "z", "z", "q"])]
+    budget = Budget(max_steps=estimate_cost(nested, len(group)))
+    assert satisfies(group, nested, budget=budget) == satisfies(group, nested)
+    rand = random.Random(1018)
+    for i in range(1000):
+        condition = random_condition(rand)
+        group = set(random_group(rand) + random_group(rand))
+        for disjoint in [True, False]:
+            budget = Budget(max_steps=estimate_cost(condition, len(group), disjoint))
+            assert satisfies(group, condition, disjoint, budget=budget) == satisfies(group, condition, disjoint)
+
+
+def test_step_budget_stops_runaway_search():
+    group = [Principal(id=f"m{i}", roles=["member"]) for i in range(30)]
+    with pytest.raises(BudgetExceeded) as e:
+        satisfies(group, _bad_rule(), budget=Budget(max_steps=10000))
+    assert e.value.steps > 10000
+
+
+def test_time_budget_stops_runaway_search():
+    group = [Principal(id=f"m{i}", roles=["member"]) for i in range(30)]
+    ticks = itertools.count()
+    with pytest.raises(BudgetExceeded):
+        satisfies(group, _bad_rule(3), budget=Budget(seconds=100, clock=lambda: next(ticks)))
+
+
+def test_generous_budget_gives_normal_answers():
+    for group in [[x] for x in p.objs] + [p.objs]:
+        for condition in c.objs:
+            budget = Budget(max_steps=100000, seconds=60)
+            assert satisfies(group, condition, budget=budget) == satisfies(group, condition)
+
+
+def test_budget_checks_preconditions():
+    with pytest.raises(PreconditionViolation):
+        Budget(max_steps=0)
+    with pytest.raises(PreconditionViolation):
+        Budget(seconds=-1)
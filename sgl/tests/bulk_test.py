@@ -0,0 +1,75 @@
+import json
+import random
+
+import pytest
+
+from ..bulk import load_conditions, load_principals, load_rules, validate_condition, validate_rule
+from ..condition import Condition
+from ..dbc import PreconditionViolation
+from ..principal import Principal
+from ..rule import Rule
+from .examples import *
+from .randomized import random_condition, random_group
+
+
+def test_trusted_from_dict_matches_checked_from_dict():
+    for x in c.dicts:
+        assert Condition.from_dict(x, trusted=True).key() == Condition.from_dict(x).key()
+    for x in r.dicts:
+        assert Rule.from_dict(x, trusted=True) == Rule.from_dict(x)
+    for x in p.dicts:
+        assert Principal.from_dict(x, trusted=True).key() == Principal.from_dict(x).key()
+    rand = random.Random(21)
+    for i in range(200):
+        x = random_condition(rand).to_dict()
+        trusted = Condition.from_dict(x, trusted=True)
+        assert trusted == Condition.from_dict(x)
+        assert trusted.to_dict() == x
+
+
+def test_trusted_from_json():
+    assert Rule.from_json(r.enter_to_bob.to_json(), trusted=True) == r.enter_to_bob
+    assert Condition.from_json('{"roles": "a", "n": 2.0}', trusted=True).n == 2
+    assert Principal.from_json('{"id": "", "roles": ["x"]}', trusted=True).id is None
+
+
+def test_bulk_loaders():
+    assert load_rules(r.dicts) == r.objs
+    assert load_rules(json.dumps(r.dicts)) == r.objs
+    assert [x.key() for x in load_conditions(c.dicts)] == [x.key() for x in c.objs]
+    group = random_group(random.Random(2))
+    assert [x.key() for x in load_principals([x.to_dict() for x in group])] == [x.key() for x in group]
+
+
+@pytest.mark.parametrize("bad, where", [
+    ({"id": "x", "roles": "y"}, "[1]"),
+    ({"roles": "y", "n": 0}, "[1]"),
+    ({"roles": "y", "n": 1.5}, "[1]"),
+    ({"all": [{"id": "x"}, {"any": [{"id": 3}]}]}, "[1].all[1].any[0]"),
+    ({"any": {"id": "x"}}, "[1]"),
+    ("not a dict", "[1]"),
+])
+def test_validation_rejects_whole_document(bad, where):
+    with pytest.raises(PreconditionViolation) as e:
+        load_conditions([{"id": "fine"}, bad])
+    assert str(e.value).startswith(where + ":")
+    # The constructors agree that these are bad.
+    with pytest.raises((PreconditionViolation, TypeError)):
+        Condition.from_dict(bad)
+
+
+def test_validation_of_rules_and_principals():
+    with pytest.raises(PreconditionViolation):
+        validate_rule({"grant": "enter", "when": {"id": "x"}})
+    with pytest.raises(PreconditionViolation):
+        validate_rule({"grant": ["enter"], "when": {}})
+    with pytest.raises(PreconditionViolation):
+        load_principals([{"id": "x"}, {"roles": []}])
+    with pytest.raises(PreconditionViolation):
+        load_principals([{"roles": "admin"}])
+    with pytest.raises(PreconditionViolation):
+        load_rules({"grant": ["x"]})
+    validate_condition({"roles": "a", "n": 3.0})
+    # Stricter than the constructor, which doesn't check the type of a role name.
+    with pytest.raises(PreconditionViolation):
+        validate_condition({"roles": ["y"]})
@@ -0,0 +1,122 @@
+import threading
+
+import pytest
+
+from ..api import *
+from .examples import *
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_condition_digest_is_canonical():
+    assert condition_digest(c.bob) == condition_digest({"id": "Bob"})
+    assert condition_digest(r.enter_to_bob) == condition_digest(c.bob)
+    assert condition_digest({"grant": ["x"], "when": {"id": "Bob"}}) == condition_digest(c.bob)
+    assert condition_digest(c.sibling) == condition_digest({"roles": "sibling"})
+    assert condition_digest(c.trusted) == condition_digest(c.trusted_dict)
+    assert condition_digest(c.bob) != condition_digest(c.sibling)
+    for x in c.objs:
+        assert condition_digest(x) == condition_digest(x.to_dict())
+
+
+def test_condition_digest_validates_dicts():
+    with pytest.raises(PreconditionViolation):
+        condition_digest({"id": "Bob", "roles": "sibling"})
+    with pytest.raises(PreconditionViolation):
+        condition_digest({"roles": "sibling", "n": -1})
+    with pytest.raises(PreconditionViolation):
+        condition_digest({"id": "Bob", "op": "!="})
+    with pytest.raises(PreconditionViolation):
+        condition_digest({"all": [{"id": "Bob"}, {"roles": "sibling", "op": "in"}]})
+
+
+def test_cache_rejects_conditions_it_has_seen_a_valid_form_of():
+    cache = DecisionCache()
+    assert satisfies(p.bob, c.bob, cache=cache)
+    with pytest.raises(PreconditionViolation):
+        satisfies(p.bob, {"id": "Bob", "op": "!="}, cache=cache)
+
+
+def test_group_digest_ignores_order_but_not_properties():
+    assert group_digest([p.bob, p.grandma_carol]) == group_digest([p.grandma_carol, p.bob])
+    assert group_digest(p.grandma_extra) == group_digest({"roles": ["grandparent"], "extra": "something"})
+    assert group_digest(p.grandma_extra) != group_digest({"roles": ["grandparent"]})
+    assert group_digest(p.bob) != group_digest(p.grandma_carol)
+
+
+def test_cache_hits_and_misses():
+    cache = DecisionCache()
+    assert satisfies(p.bob, c.bob, cache=cache)
+    assert satisfies(p.bob, {"id": "Bob"}, cache=cache)
+    assert not satisfies(p.grandma_carol, r.enter_to_bob, cache=cache)
+    assert not satisfies(p.grandma_carol, c.bob, cache=cache)
+    stats = cache.stats()
+    assert stats["hits"] == 2
+    assert stats["misses"] == 2
+    assert stats["size"] == 2
+
+
+def test_cache_distinguishes_disjoint():
+    cache = DecisionCache()
+    x = r.call_meeting_to_employee_and_investor
+    assert not satisfies(p.employee_and_investor, x, cache=cache)
+    assert satisfies(p.employee_and_investor, x, disjoint=False, cache=cache)
+
+
+def test_cache_is_bounded():
+    cache = DecisionCache(maxsize=2)
+    for x in p.objs:
+        satisfies(x, c.grandparent, cache=cache)
+    assert len(cache) == 2
+    assert cache.stats()["evictions"] == len(p.objs) - 2
+
+
+def test_cache_expires_decisions():
+    clock = FakeClock()
+    cache = DecisionCache(ttl=10, clock=clock)
+    satisfies(p.bob, c.bob, cache=cache)
+    clock.now = 5
+    satisfies(p.bob, c.bob, cache=cache)
+    clock.now = 11
+    satisfies(p.bob, c.bob, cache=cache)
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["expirations"] == 1
+
+
+def test_cache_invalidates_per_rule():
+    cache = DecisionCache()
+    satisfies(p.bob, r.enter_to_bob, cache=cache)
+    satisfies(p.grandma_carol, r.enter_to_bob, cache=cache)
+    satisfies(p.grandma_carol, c.grandparent, cache=cache)
+    assert cache.invalidate({"grant": ["enter"], "when": {"id": "Bob"}}) == 2
+    assert len(cache) == 1
+    assert cache.invalidate(condition_digest(c.grandparent)) == 1
+    assert len(cache) == 0
+
+
+def test_cache_is_thread_safe():
+    cache = DecisionCache(maxsize=5)
+    errors = []
+
+    def work():
+        try:
+            for i in range(200):
+                for x in p.objs:
+                    satisfies(x, c.objs[i % len(c.objs)], cache=cache)
+        except BaseException as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=work) for i in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not errors
+    assert len(cache) <= 5
@@ -0,0 +1,53 @@
+import pytest
+
+from ..api import satisfies
+from ..dbc import PreconditionViolation
+from ..condition import Condition
+from ..principal import Principal
+from ..compiled import CompiledCondition, CompiledRule
+from .examples import *
+
+
+def test_compiled_agrees_with_satisfies():
+    groups = [[x] for x in p.objs] + [p.objs, p.objs[:4], p.objs[3:], [p.grandma_carol, p.grandpa_carl]]
+    for cond in c.objs + [r.when for r in r.objs]:
+        compiled = cond.compile()
+        for group in groups:
+            for disjoint in [True, False]:
+                assert compiled(group, disjoint) == satisfies(group, cond, disjoint)
+
+
+def test_compiled_complex_all_disjoint():
+    x = Condition(all=[
+        c.bob,
+        Condition(n=2, roles="sibling"),
+        Condition(all=[c.trusted, Condition(n=3, roles="employee")])
+    ]).compile()
+    assert not x(p.objs)
+    assert x(p.objs + [Principal(roles=["employee"])])
+    assert not x(p.objs, disjoint=False)
+
+
+def test_compiled_rule_knows_privs():
+    compiled = r.three_privs_to_grandparent.compile()
+    assert isinstance(compiled, CompiledRule)
+    assert compiled.privs == ("delegate", "medical", "school")
+    assert compiled(p.grandma_carol)
+    assert compiled({"roles": ["grandparent"]})
+    assert not compiled(p.bob)
+
+
+def test_compiled_is_immutable():
+    compiled = c.bob.compile()
+    with pytest.raises(AttributeError):
+        compiled.condition = c.grandparent
+
+
+def test_compiled_rejects_empty_group():
+    with pytest.raises(PreconditionViolation):
+        c.bob.compile()([])
+
+
+def test_compiled_requires_condition():
+    with pytest.raises(PreconditionViolation):
+        CompiledCondition({"id": "Bob"})
@@ -0,0 +1,77 @@
+import random
+
+import pytest
+
+from ..api import satisfies
+from ..condition import Condition
+from ..dbc import PreconditionViolation
+from ..incremental import GroupEvaluator
+from ..principal import Principal
+from .examples import *
+from .randomized import random_condition, random_group
+
+
+def test_evaluator_tracks_additions_and_removals():
+    e = GroupEvaluator(c.two_grandparents)
+    assert not e.satisfied
+    assert not e.add(p.grandma_carol)
+    assert e.add(p.grandpa_carl)
+    assert len(e) == 2
+    assert p.grandma_carol in e
+    assert not e.remove(p.grandma_carol)
+    assert e.add(p.grandma_carol)
+
+
+def test_evaluator_reports_missing():
+    multisig = Condition(all=[Condition(roles="a", n=2), Condition(id="x"), Condition(roles="b")])
+    e = GroupEvaluator(multisig)
+    assert [x.to_dict() for x in e.missing()] == [{"roles": "a", "n": 2}, {"id": "x"}, {"roles": "b"}]
+    e.add(Principal(id="x"))
+    e.add(Principal(roles=["a"]))
+    assert [x.to_dict() for x in e.missing()] == [{"roles": "a"}, {"roles": "b"}]
+    # This member can serve either remaining leaf, but not both.
+    e.add(Principal(roles=["a", "b"]))
+    assert len(e.missing()) == 1
+    assert e.add(Principal(roles=["a", "b"]))
+    assert e.missing() == []
+
+
+def test_evaluator_reassigns_members_when_one_leaves():
+    multisig = Condition(all=[Condition(roles="a"), Condition(roles="b")])
+    ab = Principal(id="ab", roles=["a", "b"])
+    a = Principal(id="a", roles=["a"])
+    b = Principal(id="b", roles=["b"])
+    e = GroupEvaluator(multisig, group=[ab, a])
+    assert e.satisfied
+    e.add(b)
+    assert e.remove(a)
+    assert e.remove(ab) is False
+    assert [x.to_dict() for x in e.missing()] == [{"roles": "a"}]
+
+
+def test_evaluator_rejects_non_members():
+    e = GroupEvaluator(c.bob)
+    with pytest.raises(PreconditionViolation):
+        e.remove(p.bob)
+
+
+def test_evaluator_agrees_with_satisfies():
+    rand = random.Random(15)
+    for i in range(300):
+        condition = random_condition(rand)
+        disjoint = rand.random() < 0.7
+        e = GroupEvaluator(condition, disjoint)
+        pool = random_group(rand) + random_group(rand)
+        # A dict has the same notion of membership as the sets groups are normalized to.
+        members = {}
+        for step in range(12):
+            if members and rand.random() < 0.35:
+                x = rand.choice(list(members))
+                del members[x]
+                result = e.remove(x)
+            else:
+                x = rand.choice(pool)
+                members[x] = True
+                result = e.add(x)
+            expected = bool(members) and satisfies(list(members), condition, disjoint)
+            assert result == expected, (condition.to_dict(), [m.to_dict() for m in members], disjoint)
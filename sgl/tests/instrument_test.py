@@ -0,0 +1,110 @@
+import json
+
+import pytest
+
+from .. import instrument
+from ..api import satisfies, satisfies_many
+from ..condition import Condition
+from ..instrument import Histogram, Instrumentation, SearchStats
+from ..principal import Principal
+from ..ruleset import RuleSet
+from .examples import *
+
+
+@pytest.fixture
+def enabled():
+    instrumentation = instrument.enable()
+    yield instrumentation
+    instrument.disable()
+
+
+def _hard_condition():
+    return Condition(all=[
+        Condition(any=[Condition(roles="a", n=2), Condition(roles="b")]),
+        Condition(roles="a", n=2),
+        Condition(roles="c"),
+    ])
+
+
+def _group():
+    return [Principal(id=f"p{i}", roles=["a", "b"] if i % 2 else ["a"]) for i in range(5)] + \
+        [Principal(id="q", roles=["a"])]
+
+
+def test_disabled_by_default():
+    assert instrument.active is None
+    assert satisfies(p.bob, c.bob)
+
+
+def test_counts_search_work(enabled):
+    assert not satisfies(_group(), _hard_condition())
+    totals = enabled.as_dict()
+    assert totals["calls"] == 1
+    assert totals["nodes"] > 0
+    assert totals["combinations"] > 0
+    assert totals["max_depth"] >= 2
+    assert totals["seconds"]["count"] == 1
+
+
+def test_counts_pruning(enabled):
+    # The first subcondition can be met many ways, but never leaving enough members for the rest.
+    condition = Condition(all=[Condition(any=[Condition(roles="a"), Condition(roles="b")]),
+                               Condition(roles="a", n=6)])
+    assert not satisfies(_group(), condition)
+    assert enabled.as_dict()["pruned"] > 0
+
+
+def test_times_each_rule(enabled):
+    rs = RuleSet(r.objs)
+    rs.authorize([p.grandma_carol, p.grandpa_carl], "spoil_child")
+    satisfies(p.bob, r.enter_to_bob)
+    report = enabled.as_dict()
+    assert r.spoil_child_to_2_grandparents.to_json() in report["rules"]
+    assert report["rules"][r.enter_to_bob.to_json()]["count"] >= 1
+    # The report is plain data.
+    json.dumps(report)
+
+
+def test_callback_sees_each_evaluation():
+    reports = []
+    instrumentation = instrument.enable(Instrumentation(callback=reports.append))
+    try:
+        satisfies_many([(p.bob, c.bob), (p.objs, c.two_grandparents)])
+    finally:
+        instrument.disable()
+    assert len(reports) == 2
+    assert all("seconds" in x and "nodes" in x for x in reports)
+    assert instrumentation.calls == 2
+    instrumentation.reset()
+    assert instrumentation.as_dict()["calls"] == 0
+
+
+def test_results_unchanged_when_enabled(enabled):
+    for group in [[x] for x in p.objs] + [p.objs]:
+        for condition in c.objs:
+            for disjoint in [True, False]:
+                answer = satisfies(group, condition, disjoint)
+                instrument.disable()
+                try:
+                    assert answer == satisfies(group, condition, disjoint)
+                finally:
+                    instrument.enable(enabled)
+
+
+def test_histogram_buckets():
+    h = Histogram([0.1, 1.0])
+    for seconds in [0.05, 0.5, 0.5, 3]:
+        h.record(seconds)
+    assert h.as_dict() == {"count": 4, "total": 4.05, "buckets": [[0.1, 1], [1.0, 2], ["inf", 1]]}
+
+
+def test_search_stats_track_depth():
+    stats = SearchStats()
+    stats.enter()
+    stats.enter()
+    stats.leave()
+    stats.enter()
+    stats.leave()
+    stats.leave()
+    assert stats.depth == 0
+    assert stats.as_dict()["max_depth"] == 2
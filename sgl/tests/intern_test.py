@@ -0,0 +1,76 @@
+import pytest
+
+from ..dbc import PreconditionViolation
+from ..condition import Condition
+from ..principal import Principal
+from ..rule import Rule
+from ..intern import Interner
+from ..ruleset import RuleSet
+from .examples import *
+
+
+def test_condition_hash_is_structural():
+    assert hash(c.trusted) == hash(Condition.from_dict(c.trusted_dict))
+    assert hash(c.sibling) == hash(Condition(roles="sibling"))
+    assert hash(c.sibling) != hash(Condition(roles="sibling", n=2))
+    lookup = {x: i for i, x in enumerate(c.objs)}
+    for i, x in enumerate(c.objs):
+        assert lookup[Condition.from_dict(x.to_dict())] == i
+
+
+def test_rule_hash_is_structural():
+    lookup = {x: i for i, x in enumerate(r.objs)}
+    for i, x in enumerate(r.objs):
+        assert lookup[Rule.from_dict(x.to_dict())] == i
+    assert Rule(["a", "b"], c.bob) == Rule(["b", "a", "a"], {"id": "Bob"})
+    assert Rule(["a"], c.bob) != Rule(["b"], c.bob)
+
+
+def test_principal_hash():
+    assert hash(p.bob) == hash(Principal(id="Bob"))
+    assert Principal(id="x", roles=["b", "a"]) == Principal(id="x", roles=["a", "b"])
+    # Anonymous principals with the same roles are different members of a group.
+    assert len({Principal(roles=["a"]), Principal(roles=["a"])}) == 2
+    assert Principal(roles=["a"]) == Principal(roles=["a"])
+
+
+def test_interner_shares_subtrees():
+    interner = Interner()
+    first = interner.condition(Condition.from_dict(
+        {"all": [{"roles": "grandparent"}, {"any": [{"id": "Bob"}, {"roles": "sibling"}]}]}))
+    second = interner.condition(Condition.from_dict(
+        {"any": [{"roles": "grandparent"}, {"any": [{"id": "Bob"}, {"roles": "sibling"}]}], "n": 2}))
+    assert first.all[0] is second.any[0]
+    assert first.all[1] is second.any[1]
+    assert interner.condition(Condition(roles="grandparent")) is first.all[0]
+
+
+def test_interner_does_not_modify_input():
+    interner = Interner()
+    interner.condition(Condition(id="Bob"))
+    x = Condition(all=[Condition(id="Bob")])
+    child = x.all[0]
+    y = interner.condition(x)
+    assert x.all[0] is child
+    assert y is not x
+    assert y == x
+
+
+def test_interner_rules_and_principals():
+    interner = Interner()
+    a = interner.rule(Rule(["x"], {"roles": "sibling"}))
+    b = interner.rule(Rule(["y"], {"roles": "sibling"}))
+    assert a.when is b.when
+    assert interner.rule(Rule(["x"], {"roles": "sibling"})) is a
+    assert interner.principal(Principal(id="Bob")) is interner.principal(Principal(id="Bob"))
+    anonymous = Principal(roles=["a"])
+    assert interner.principal(anonymous) is anonymous
+    assert interner.intern(Principal(roles=["a"])) is not anonymous
+    with pytest.raises(PreconditionViolation):
+        interner.rule(c.bob)
+
+
+def test_ruleset_interns_rules():
+    interner = Interner()
+    rs = RuleSet([Rule(["x"], {"roles": "sibling"}), Rule(["y"], {"roles": "sibling"})], interner)
+    assert rs.candidates("x")[0].when is rs.candidates("y")[0].when
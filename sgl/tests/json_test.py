@@ -1,6 +1,7 @@
 import json
 import pytest
 
+from .. import principal, properties
 from ..dbc import PreconditionViolation
 from ..api import CustomJSONEncoder
 from ..principal import Principal
@@ -46,9 +47,14 @@ def test_principal_str_role_rejected():
         Principal(roles="abc")
 
 
-# Required for forward compatibility
-def test_principal_ignores_extra_fields_in_dict():
-    assert Principal.from_dict({"id": "x", "a": 1, "b": 2.3, "c": [4, 5], "d": {}}) == Principal.from_dict({"id": "x"})
+# Extra fields are custom properties; values that properties can't hold are still ignored, for
+# forward compatibility.
+def test_principal_keeps_extra_fields_in_dict_as_properties():
+    x = Principal.from_dict({"id": "x", "a": 1, "b": 2.3, "c": [4, 5], "d": {}})
+    assert x.props == {"a": 1, "b": 2.3, "c": [4, 5]}
+    assert x.to_dict() == {"id": "x", "a": 1, "b": 2.3, "c": [4, 5]}
+    assert x != Principal.from_dict({"id": "x"})
+    assert x == Principal.from_dict({"id": "x", "c": [5, 4], "b": 2.3, "a": 1})
 
 
 def test_principal_to_json_hardcoded():
@@ -135,3 +141,36 @@ def test_rule_to_from_json_roundtrip():
 
 def test_rule_custemencoder_roundtrip():
     run_customencoder_roundtrip(r)
+
+
+def test_objects_are_slotted():
+    for o in [p.bob, c.bob, r.enter_to_bob]:
+        assert not hasattr(o, '__dict__')
+
+
+def test_principals_share_role_sets():
+    a = Principal(id="a", roles=["x", "y"])
+    b = Principal(roles=["y", "x", "x"])
+    assert a.roles is b.roles
+    assert a.roles == frozenset(["x", "y"])
+    assert b.to_dict() == {"roles": ["x", "y"]}
+
+
+# A server builds principals from whatever its clients send, so what they share can't grow forever.
+def test_shared_registries_are_bounded(monkeypatch):
+    monkeypatch.setattr(properties, "MAX_SHARED", 10)
+    kept = [Principal(id=f"u{i}", roles=[f"role{i}"], props={f"p{i}": [i, i + 1]}) for i in range(25)]
+    assert len(principal._role_sets) <= 10
+    assert len(properties._layouts) <= 10
+    assert len(properties._value_sets) <= 10
+    assert [(x.roles, x.props) for x in kept] == [
+        (frozenset([f"role{i}"]), {f"p{i}": [i, i + 1]}) for i in range(25)]
+    a = Principal(id="a", roles=["x", "y"], props={"p": [1, 2]})
+    b = Principal(id="b", roles=["y", "x"], props={"p": [2, 1]})
+    assert a.roles is b.roles
+    assert a._layout is b._layout
+    assert a._values[0] is b._values[0]
+
+
+def test_rule_privs_are_sorted_tuple():
+    assert Rule(["b", "a", "b"], c.bob).privs == ("a", "b")
@@ -0,0 +1,82 @@
+import random
+
+import pytest
+
+from ..api import satisfies
+from ..dbc import PreconditionViolation
+from ..condition import Condition
+from ..optimize import optimize
+from .examples import *
+from .randomized import random_condition, random_group
+
+
+def test_optimize_flattens_and_collapses():
+    x = Condition.from_dict({"any": [
+        {"any": [{"roles": "a"}]},
+        {"all": [{"all": [{"roles": "b"}, {"id": "x"}]}, {"roles": "c"}]}
+    ]})
+    y, changes = optimize(x)
+    assert y.to_dict() == {"any": [
+        {"roles": "a"},
+        {"all": [{"id": "x"}, {"roles": "b"}, {"roles": "c"}]}
+    ]}
+    assert changes
+
+
+def test_optimize_merges_duplicates():
+    x = Condition.from_dict({"any": [
+        {"roles": "a", "n": 2},
+        {"id": "x"},
+        {"roles": "a"},
+        {"id": "x"}
+    ]})
+    y, changes = optimize(x)
+    assert y.to_dict() == {"any": [{"id": "x"}, {"roles": "a"}]}
+    assert len(changes) == 3
+
+
+def test_optimize_leaves_counting_any_alone():
+    x = Condition.from_dict({"any": [{"roles": "a"}, {"roles": "a"}], "n": 2})
+    y, changes = optimize(x)
+    assert y is x
+    assert changes == []
+
+
+def test_optimize_combines_disjoint_leaves():
+    x = Condition.from_dict({"all": [{"roles": "a"}, {"id": "x"}, {"roles": "a", "n": 2}]})
+    y, changes = optimize(x)
+    assert y.to_dict() == {"all": [{"id": "x"}, {"n": 3, "roles": "a"}]}
+    y, changes = optimize(x, disjoint=False)
+    assert y.to_dict() == {"all": [{"id": "x"}, {"n": 2, "roles": "a"}]}
+
+
+def test_optimize_keeps_top_level_all_disjoint():
+    # Collapsing this "any" would turn the condition into a top-level "all", which satisfies()
+    # evaluates with disjoint semantics.
+    x = Condition(any=[r.call_meeting_to_employee_and_investor.when])
+    y, changes = optimize(x)
+    assert y.any
+    assert satisfies(p.employee_and_investor, y)
+    y, changes = optimize(x, disjoint=False)
+    assert y.all
+
+
+def test_optimize_does_not_modify_input():
+    before = c.trusted.to_json()
+    optimize(c.trusted)
+    assert c.trusted.to_json() == before
+
+
+def test_optimize_preserves_meaning():
+    rand = random.Random(11)
+    for trial in range(500):
+        x = random_condition(rand)
+        group = random_group(rand)
+        for disjoint in [True, False]:
+            y, changes = optimize(x, disjoint)
+            assert satisfies(group, y, disjoint) == satisfies(group, x, disjoint)
+
+
+def test_optimize_requires_condition():
+    with pytest.raises(PreconditionViolation):
+        optimize({"id": "x"})
@@ -0,0 +1,102 @@
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from .. import parallel
+from ..api import satisfies
+from ..condition import Condition
+from ..principal import Principal
+from ..parallel import satisfies_parallel, satisfies_split
+from .examples import *
+
+
+def _pairs():
+    groups = [[x] for x in p.objs] + [p.objs, [p.grandma_carol, p.grandpa_carl]]
+    return [(group, x) for group in groups for x in c.objs + r.objs + [{"id": "Bob"}]]
+
+
+def test_satisfies_parallel_with_threads():
+    pairs = _pairs()
+    with ThreadPoolExecutor(4) as executor:
+        for disjoint in [True, False]:
+            results = satisfies_parallel(pairs, disjoint, executor=executor, chunksize=7)
+            assert list(results) == [int(satisfies(group, x, disjoint)) for group, x in pairs]
+
+
+def test_satisfies_parallel_with_processes():
+    pairs = _pairs()
+    results = satisfies_parallel(pairs, max_workers=2)
+    assert list(results) == [int(satisfies(group, x)) for group, x in pairs]
+
+
+def test_satisfies_parallel_with_a_process_pool_of_our_own():
+    pairs = _pairs()
+    with ProcessPoolExecutor(2) as executor:
+        for disjoint in [True, False]:
+            results = satisfies_parallel(pairs, disjoint, executor=executor, chunksize=7)
+            assert list(results) == [int(satisfies(group, x, disjoint)) for group, x in pairs]
+        # The executor is still ours to use.
+        assert satisfies_split(p.objs + [Principal(roles=["employee"])], _complex(), executor=executor)
+
+
+def test_satisfies_parallel_with_a_generator():
+    pairs = ((Principal(id=f"u{i}"), Condition(id=f"u{i}")) for i in range(200))
+    with ThreadPoolExecutor(2) as executor:
+        assert list(satisfies_parallel(pairs, executor=executor)) == [1] * 200
+
+
+def test_satisfies_parallel_empty():
+    assert len(satisfies_parallel([], executor=ThreadPoolExecutor(1))) == 0
+
+
+def _complex():
+    return Condition(all=[
+        Condition(n=2, roles="sibling"),
+        c.bob,
+        Condition(all=[c.trusted, Condition(all=[Condition(n=2, roles="employee"), Condition(n=2, roles="investor")])])
+    ])
+
+
+def test_satisfies_split():
+    x = _complex()
+    with ThreadPoolExecutor(3) as executor:
+        assert not satisfies_split(p.objs, x, executor=executor)
+        assert satisfies_split(p.objs + [Principal(roles=["investor"])], x, executor=executor, parts=2)
+        assert satisfies_split(p.objs + [Principal(roles=["sibling"])] * 3 + [Principal(roles=["investor"])], x,
+                               executor=executor) == \
+            satisfies(p.objs + [Principal(roles=["sibling"])] * 3 + [Principal(roles=["investor"])], x)
+        # Shapes that don't need the search are evaluated locally.
+        assert satisfies_split(p.bob, c.bob, executor=executor)
+        assert not satisfies_split(p.employee_and_investor, r.call_meeting_to_employee_and_investor,
+                                   executor=executor)
+
+
+def test_satisfies_split_with_processes():
+    x = _complex()
+    assert satisfies_split(p.objs + [Principal(roles=["employee"])], x, max_workers=2)
+
+
+def test_satisfies_split_returns_without_waiting_for_other_parts(monkeypatch):
+    release = threading.Event()
+    running = threading.Barrier(2)
+    calls = []
+
+    def search_part(group, condition, subsets):
+        # Both parts start; the first to get here finds a way, and the other takes its time.
+        calls.append(subsets)
+        first = len(calls) == 1
+        running.wait(10)
+        if first:
+            return True
+        release.wait(10)
+        return False
+
+    monkeypatch.setattr(parallel, "_search_part", search_part)
+    monkeypatch.setattr(parallel, "default_executor", lambda max_workers: ThreadPoolExecutor(max_workers))
+    try:
+        group = p.objs + [Principal(roles=["sibling"])] * 3 + [Principal(roles=["investor"])]
+        start = time.monotonic()
+        assert satisfies_split(group, _complex(), max_workers=2, parts=2)
+        assert time.monotonic() - start < 5
+    finally:
+        release.set()
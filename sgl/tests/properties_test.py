@@ -0,0 +1,262 @@
+import itertools
+import random
+
+import pytest
+
+from ..api import satisfies, effective_privileges, minimal_subsets
+from ..binary import decode, encode
+from ..bulk import load_principals, load_rules, validate_condition
+from ..condition import Condition
+from ..dbc import PreconditionViolation
+from ..incremental import GroupEvaluator
+from ..optimize import optimize
+from ..principal import Principal
+from ..quorum import quorums
+from ..rule import Rule
+from ..ruleset import RuleSet
+from ..snapshot import Snapshot, write_snapshot
+
+DISCOUNT = {
+    "grant": ["insurance-discount"],
+    "when": {"any": [{"years_exp": 20, "op": ">"}, {"certifications": "FAAFP"}]}
+}
+
+DOCTOR = {"id": "Prabhakar Ro", "years_exp": 27, "certifications": ["ABPP", "MCHES", "CHSE", "FAAFP"]}
+
+
+def test_doc_examples():
+    rule = Rule.from_dict(DISCOUNT)
+    assert satisfies(DOCTOR, rule)
+    assert satisfies({"id": "x", "years_exp": 21}, rule)
+    assert satisfies({"id": "x", "certifications": ["FAAFP"]}, rule)
+    assert not satisfies({"id": "x", "years_exp": 20, "certifications": ["ABPP"]}, rule)
+    assert not satisfies({"id": "x", "roles": ["years_exp"]}, rule)
+    assert satisfies(DOCTOR, {"certifications": 3, "op": ">="})
+    assert not satisfies(DOCTOR, {"certifications": 5, "op": ">="})
+
+
+def test_condition_round_trip():
+    for value in [{"years_exp": 20, "op": ">"}, {"state": ["ID", "UT"]}, {"state": ["UT"], "op": "not in"},
+                  {"name": "^Dr", "op": "like"}, {"active": True}, {"level": 3, "n": 2},
+                  {"tags": ["a", "b"], "op": "contains"}, {"nickname": None, "op": "!="}]:
+        c = Condition.from_dict(value)
+        assert c.to_dict() == value
+        assert Condition.from_json(c.to_json()) == c
+        assert Condition.from_dict(value, trusted=True) == c
+        assert Condition.from_binary(c.to_binary()) == c
+    # The default op is filled in, and arrays are put in canonical order.
+    assert Condition.from_dict({"x": 1, "op": "="}) == Condition.from_dict({"x": 1})
+    assert Condition.from_dict({"x": ["b", "a", "b"]}) == Condition.from_dict({"x": ["a", "b"], "op": "in"})
+    assert Condition.from_dict({"x": 1}) != Condition.from_dict({"x": 2})
+    assert Condition(prop="x", value=1, op=">").key() == ("prop", "x", ">", ("number", 1), 1)
+
+
+def test_invalid_conditions():
+    bad = [{"x": 1, "op": "~"}, {"x": 1, "op": "in"}, {"x": [1], "op": ">"}, {"x": "(", "op": "like"},
+           {"x": {"y": 1}}, {"x": [[1]]}, {"x": 1, "y": 2}, {"x": 1, "n": 0}, {"op": ">"}]
+    for value in bad:
+        with pytest.raises(PreconditionViolation):
+            Condition.from_dict(value)
+        with pytest.raises(PreconditionViolation):
+            validate_condition({"all": [{"id": "a"}, value]})
+    with pytest.raises(PreconditionViolation):
+        Condition(roles="a", op=">")
+    # "op" is never dropped from a standard condition, which would reverse a test like "!=".
+    for value in [{"id": "Fred", "op": "!="}, {"roles": "a", "op": ">"}, {"all": [{"id": "a"}], "op": "="},
+                  {"any": [{"id": "a"}, {"x": 1, "op": "!="}], "op": "="}]:
+        with pytest.raises(PreconditionViolation):
+            Condition.from_dict(value)
+        with pytest.raises(PreconditionViolation):
+            validate_condition(value)
+        with pytest.raises(PreconditionViolation):
+            load_rules([{"grant": ["x"], "when": {"all": [{"id": "a"}, value]}}])
+    with pytest.raises(PreconditionViolation):
+        Condition(prop="n", value=1)
+    # Unknown fields next to a standard condition are still ignored.
+    assert Condition.from_dict({"id": "x", "note": "hi"}) == Condition(id="x")
+
+
+@pytest.mark.parametrize("condition, value, expected", [
+    ({"x": 5}, 5, True), ({"x": 5}, 5.0, True), ({"x": 5}, "5", False), ({"x": 1}, True, False),
+    ({"x": True}, True, True), ({"x": True}, 1, False), ({"x": None}, None, True),
+    ({"x": "a"}, ["a", "b"], True), ({"x": "c"}, ["a", "b"], False),
+    ({"x": ["a", "b"], "op": "="}, ["b", "a"], True), ({"x": ["a", "b"], "op": "="}, ["a"], False),
+    ({"x": 5, "op": "!="}, 6, True), ({"x": 5, "op": "!="}, 5, False),
+    ({"x": 5, "op": "<"}, 4, True), ({"x": 5, "op": "<"}, 5, False), ({"x": 5, "op": "<="}, 5, True),
+    ({"x": 5, "op": ">"}, 6.5, True), ({"x": 5, "op": ">="}, "9", False), ({"x": 1, "op": ">"}, True, False),
+    ({"x": 2, "op": ">="}, ["a", "b"], True), ({"x": 2, "op": ">"}, ["a", "b"], False),
+    ({"x": "2020-01-01", "op": "<"}, "2019-12-31", True), ({"x": "2020-01-01", "op": "<"}, 2019, False),
+    ({"x": ["UT", "ID"]}, "UT", True), ({"x": ["UT", "ID"]}, "NV", False), ({"x": ["UT"]}, ["NV", "UT"], True),
+    ({"x": ["UT"], "op": "not in"}, "NV", True), ({"x": ["UT"], "op": "not in"}, "UT", False),
+    ({"x": "b", "op": "contains"}, ["a", "b"], True), ({"x": "ell", "op": "contains"}, "hello", True),
+    ({"x": ["a", "b"], "op": "contains"}, ["a", "b", "c"], True), ({"x": ["a", "d"], "op": "contains"}, ["a"], False),
+    ({"x": 3, "op": "contains"}, 3, False),
+    ({"x": "^Dr\\.", "op": "like"}, "Dr. Who", True), ({"x": "^Dr\\.", "op": "like"}, "Mr. Dr.", False),
+    ({"x": "^F", "op": "like"}, ["ABPP", "FAAFP"], True), ({"x": "^F", "op": "like"}, 5, False),
+])
+def test_operators(condition, value, expected):
+    c = Condition.from_dict(condition)
+    p = Principal.from_dict({"id": "p", "x": value})
+    assert c.test()(p) is expected
+    assert satisfies(p, c) is expected
+    assert c.compile()(p) is expected
+
+
+def test_missing_property_never_passes():
+    p = Principal(id="p", props={"y": 1})
+    for condition in [{"x": 1}, {"x": 1, "op": "!="}, {"x": [1], "op": "not in"}, {"x": 0, "op": ">"}]:
+        assert not satisfies(p, condition)
+        assert not satisfies(Principal(id="q"), condition)
+
+
+def test_principal_properties():
+    p = Principal.from_dict(DOCTOR)
+    assert p.get("years_exp") == 27
+    assert p.get("certifications") == sorted(DOCTOR["certifications"])
+    assert p.get("missing", 0) == 0
+    assert Principal.from_json(p.to_json()) == p
+    assert Principal.from_binary(p.to_binary()) == p
+    assert Principal.from_dict(DOCTOR, trusted=True) == p
+    assert load_principals([DOCTOR])[0] == p
+    other = Principal.from_dict(dict(DOCTOR, id="Someone Else"))
+    # Principals with the same property names share a layout, and equal sets are shared too.
+    assert other._layout is p._layout
+    assert other._values[0] is p._values[0]
+    assert Principal(props={"years_exp": 3}).to_dict() == {"years_exp": 3}
+    with pytest.raises(PreconditionViolation):
+        Principal(id="x", props={"roles": 1})
+    with pytest.raises(PreconditionViolation):
+        Principal(id="x", props={"x": {"y": 1}})
+
+
+def test_bools_are_not_numbers():
+    Principal(id="a", props={"y": [1, 0]})
+    assert Principal(id="b", props={"y": [True]}).to_dict() == {"id": "b", "y": [True]}
+    assert Principal(id="c", props={"y": [1, True, 0, False]}).get("y") == [False, True, 0, 1]
+    assert Principal(id="d", props={"y": [True]}) != Principal(id="d", props={"y": [1]})
+    assert Principal.from_binary(Principal(id="c", props={"y": [1, True]}).to_binary()).get("y") == [True, 1]
+
+    assert not satisfies({"id": "u", "flag": 1}, {"flag": [True], "op": "in"})
+    assert satisfies({"id": "u", "flag": True}, {"flag": [True], "op": "in"})
+    assert not satisfies({"id": "u", "flag": [1]}, {"flag": True})
+    assert satisfies({"id": "u", "flag": [1, True]}, {"flag": [True, 1], "op": "="})
+    assert not satisfies({"id": "u", "flag": [1]}, {"flag": [True], "op": "contains"})
+    assert Condition.from_dict({"x": [True, 1]}).to_dict() == {"x": [True, 1]}
+
+    assert Condition.from_dict({"flag": True}) != Condition.from_dict({"flag": 1})
+    assert Condition.from_dict({"flag": [True]}) != Condition.from_dict({"flag": [1]})
+    assert Condition.from_dict({"flag": 1}) == Condition.from_dict({"flag": 1.0})
+    rules = [Rule(["x"], {"flag": 1}), Rule(["y"], {"flag": True})]
+    user = {"id": "u", "flag": True}
+    assert RuleSet(rules).authorize(user, "y") == rules[1]
+    assert effective_privileges(user, rules)[0] == {"y"}
+    assert optimize(Condition(any=[x.when for x in rules]))[0] == Condition(any=[x.when for x in rules])
+
+
+def _random_leaf(rand):
+    roll = rand.random()
+    n = rand.randint(1, 2)
+    if roll < 0.2:
+        return Condition(roles=rand.choice(["a", "b"]), n=n)
+    if roll < 0.5:
+        return Condition(prop="level", value=rand.randint(1, 4), op=rand.choice([">", "<=", "="]), n=n)
+    if roll < 0.7:
+        return Condition(prop="tags", value=rand.choice(["x", "y"]), n=n)
+    if roll < 0.85:
+        return Condition(prop="level", value=[1, 3], op=rand.choice(["in", "not in"]), n=n)
+    return Condition(prop="tags", value=1, op=">", n=n)
+
+
+def _random_condition(rand, depth=0):
+    if depth > 1 or rand.random() < 0.4:
+        return _random_leaf(rand)
+    children = [_random_condition(rand, depth + 1) for i in range(rand.randint(1, 3))]
+    if rand.random() < 0.6:
+        return Condition(all=children)
+    return Condition(any=children, n=rand.randint(1, 2))
+
+
+def _random_group(rand):
+    group = []
+    for i in range(rand.randint(1, 5)):
+        props = {}
+        if rand.random() < 0.8:
+            props["level"] = rand.randint(0, 5)
+        if rand.random() < 0.6:
+            props["tags"] = rand.sample(["x", "y", "z"], rand.randint(0, 3))
+        group.append(Principal(id=f"p{i}", roles=[r for r in ["a", "b"] if rand.random() < 0.4] or None,
+                               props=props or {"other": 1}))
+    return group
+
+
+def _brute_force(group, c, disjoint):
+    """
+    Decide a condition by trying every assignment of members to the subconditions of each disjoint
+    "all". A nested "all" is disjoint too.
+    """
+    if c.prop:
+        return sum(1 for p in group if c.test()(p)) >= c.n
+    if c.roles:
+        return sum(1 for p in group if p.roles and c.roles in p.roles) >= c.n
+    if c.any:
+        return sum(1 for x in c.any if _brute_force(group, x, False)) >= c.n
+    if not disjoint:
+        return all(_brute_force(group, x, False) for x in c.all)
+    members = list(group)
+    for owners in itertools.product(range(len(c.all) + 1), repeat=len(members)):
+        parts = [[p for p, o in zip(members, owners) if o == i] for i in range(len(c.all))]
+        if all(part and _brute_force(part, x, True) for part, x in zip(parts, c.all)):
+            return True
+    return False
+
+
+def test_engines_agree(tmp_path):
+    rand = random.Random(25)
+    rules = []
+    for i in range(150):
+        c = _random_condition(rand)
+        group = _random_group(rand)
+        rules.append(Rule([f"priv{i % 7}"], c))
+        for disjoint in [True, False]:
+            expected = _brute_force(group, c, disjoint)
+            assert satisfies(group, c, disjoint) == expected, (c.to_json(), [p.to_dict() for p in group])
+            assert c.compile()(group, disjoint) == expected
+            assert satisfies(group, optimize(c, disjoint)[0], disjoint) == expected
+            evaluator = GroupEvaluator(c, disjoint)
+            for p in group:
+                evaluator.add(p)
+            assert evaluator.satisfied == expected
+        assert satisfies(group, decode(encode(c))) == satisfies(group, c)
+        if not c.all:
+            continue
+        # Minimal subsets and quorums are defined by disjoint evaluation of an "all".
+        assert bool(minimal_subsets(group, c)) == satisfies(group, c)
+        winners = [set(q) for size in range(1, len(group) + 1) for q in itertools.combinations(group, size)
+                   if _brute_force(q, c, True)]
+        expected = [q for q in winners if not any(other < q for other in winners)]
+        assert sorted(sorted(p.id for p in q) for q in quorums(group, c)) == \
+            sorted(sorted(p.id for p in q) for q in expected)
+
+    assert load_rules([x.to_dict() for x in rules]) == rules
+    path = str(tmp_path / "rules.snapshot")
+    write_snapshot(rules, path)
+    ruleset = RuleSet(rules)
+    with Snapshot(path) as snapshot:
+        assert list(snapshot) == rules
+        for i in range(30):
+            group = _random_group(rand)
+            assert snapshot.effective_privileges(group) == ruleset.effective_privileges(group) == \
+                effective_privileges(group, rules)
+
+
+def test_vectorized():
+    numpy = pytest.importorskip("numpy")
+    from ..vectorized import Directory
+    rand = random.Random(26)
+    principals = [p for i in range(20) for p in _random_group(rand)]
+    directory = Directory(principals)
+    for i in range(100):
+        c = _random_condition(rand)
+        for disjoint in [True, False]:
+            expected = [satisfies(p, c, disjoint) for p in principals]
+            assert list(directory.mask(c, disjoint)) == expected
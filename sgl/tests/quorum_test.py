@@ -0,0 +1,79 @@
+import itertools
+import random
+
+import pytest
+
+from ..api import satisfies
+from ..condition import Condition
+from ..dbc import PreconditionViolation
+from ..principal import Principal
+from ..quorum import QuorumIndex, iter_quorums, quorums
+from .examples import *
+from .randomized import random_condition, random_group
+
+
+def _brute_force(directory, condition, disjoint):
+    members = list(dict.fromkeys(directory))
+    satisfying = [set(x) for size in range(1, len(members) + 1)
+                  for x in itertools.combinations(members, size) if satisfies(list(x), condition, disjoint)]
+    return [x for x in satisfying if not any(y < x for y in satisfying)]
+
+
+def _keys(sets):
+    return sorted(sorted(id(p) for p in x) for x in sets)
+
+
+def test_quorums_for_two_grandparents():
+    found = quorums(p.objs, c.two_grandparents)
+    grandparents = [x for x in p.objs if x.roles and "grandparent" in x.roles]
+    assert _keys(found) == _keys(set(x) for x in itertools.combinations(grandparents, 2))
+    assert {p.grandma_carol, p.grandpa_carl} in found
+
+
+def test_quorums_come_smallest_first():
+    directory = [Principal(roles=["a"]), Principal(roles=["a"]), Principal(roles=["b"]), Principal(id="x", roles=["a", "b"])]
+    condition = Condition(any=[Condition(all=[Condition(roles="a"), Condition(roles="b")]), Condition(id="x")])
+    found = quorums(directory, condition, disjoint=False)
+    assert found[0] == {directory[3]}
+    assert [len(x) for x in found] == sorted(len(x) for x in found)
+    assert _keys(found) == _keys(_brute_force(directory, condition, False))
+
+
+def test_quorums_agree_with_brute_force():
+    rand = random.Random(17)
+    for i in range(150):
+        condition = random_condition(rand)
+        directory = random_group(rand) + random_group(rand)
+        for disjoint in [True, False]:
+            found = quorums(directory, condition, disjoint)
+            assert [len(x) for x in found] == sorted(len(x) for x in found)
+            assert _keys(found) == _keys(_brute_force(directory, condition, disjoint)), condition.to_dict()
+
+
+def test_quorums_stream_from_large_directories():
+    directory = [Principal(roles=["member"]) for i in range(200000)] + [Principal(id="boss", roles=["member"])]
+    index = QuorumIndex(directory)
+    assert len(index) == len(directory)
+    condition = Condition(all=[Condition(id="boss"), Condition(roles="member", n=3)])
+    found = list(index.iter_quorums(condition, limit=5))
+    assert len(found) == 5
+    for quorum in found:
+        assert len(quorum) == 4
+        assert directory[-1] in quorum
+        assert satisfies(list(quorum), condition)
+
+
+def test_quorums_honor_limits_and_deadlines():
+    directory = [Principal(roles=["a"]) for i in range(50)]
+    condition = Condition(roles="a", n=2)
+    assert len(quorums(directory, condition, limit=7)) == 7
+    assert quorums(directory, condition, limit=0) == []
+    ticks = itertools.count()
+    found = list(QuorumIndex(directory).iter_quorums(condition, deadline=10, clock=lambda: next(ticks)))
+    assert 0 < len(found) < 20
+    with pytest.raises(PreconditionViolation):
+        quorums(directory, condition, limit=-1)
+
+
+def test_no_quorums_when_nobody_qualifies():
+    assert list(iter_quorums(p.objs, {"roles": "astronaut"})) == []
@@ -0,0 +1,24 @@
+# Helpers that build small random conditions and groups, for tests that compare two ways of
+# evaluating the same thing. Pass in a seeded random.Random so failures are reproducible.
+from ..condition import Condition
+from ..principal import Principal
+
+
+def random_condition(rand, depth=0):
+    roll = rand.random()
+    if depth > 2 or roll < 0.5:
+        if rand.random() < 0.2:
+            return Condition(id=rand.choice(["x", "y"]))
+        return Condition(roles=rand.choice(["a", "b", "c"]), n=rand.randint(1, 2))
+    children = [random_condition(rand, depth + 1) for i in range(rand.randint(1, 3))]
+    if roll < 0.75:
+        return Condition(all=children)
+    return Condition(any=children, n=rand.randint(1, 2))
+
+
+def random_group(rand):
+    group = []
+    for i in range(rand.randint(1, 6)):
+        held = [r for r in ["a", "b", "c"] if rand.random() < 0.4]
+        group.append(Principal(id=rand.choice(["x", "y", None]), roles=held or ["z"]))
+    return group
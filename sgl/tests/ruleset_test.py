@@ -0,0 +1,58 @@
+import pytest
+
+from ..api import satisfies
+from ..dbc import PreconditionViolation
+from ..rule import Rule
+from ..ruleset import RuleSet
+from .examples import *
+
+
+def test_ruleset_indexes_privileges():
+    rs = RuleSet(r.objs)
+    assert len(rs) == len(r.objs)
+    assert "enter" in rs.privileges()
+    candidates = rs.candidates("enter")
+    assert len(candidates) == 2
+    assert r.enter_to_bob in candidates
+    assert r.enter_to_employee in candidates
+    assert rs.candidates("fly") == []
+
+
+def test_ruleset_authorize_finds_granting_rule():
+    rs = RuleSet(r.objs)
+    assert rs.authorize(p.bob, "enter") == r.enter_to_bob
+    assert rs.authorize(p.employee, "enter") == r.enter_to_employee
+    assert rs.authorize([p.grandma_carol, p.grandpa_carl], "spoil_child") == r.spoil_child_to_2_grandparents
+    assert rs.authorize(p.grandma_carol, "spoil_child") is None
+    assert rs.authorize(p.bob, "fly") is None
+
+
+def test_ruleset_agrees_with_satisfies():
+    rs = RuleSet(r.objs)
+    groups = [[x] for x in p.objs] + [p.objs, [p.employee_and_investor], [p.employee, p.investor]]
+    for group in groups:
+        for priv in rs.privileges():
+            for disjoint in [True, False]:
+                expected = any(satisfies(group, rule, disjoint) for rule in r.objs if priv in rule.privs)
+                assert bool(rs.authorize(group, priv, disjoint)) == expected
+
+
+def test_ruleset_tries_cheap_rules_first():
+    expensive = Rule(["x"], {"all": [{"any": [{"roles": "a"}, {"roles": "b"}]}, {"roles": "c"}]})
+    cheap = Rule(["x"], {"roles": "a"})
+    rs = RuleSet([expensive, {"grant": ["x"], "when": {"roles": "a"}}])
+    assert rs.candidates("x") == [cheap, expensive]
+
+
+def test_ruleset_rejects_bad_rules():
+    with pytest.raises(PreconditionViolation):
+        RuleSet(["not a rule"])
+
+
+def test_ruleset_effective_privileges():
+    rs = RuleSet(r.objs)
+    privs, granted_by = rs.effective_privileges([p.grandma_carol, p.grandpa_carl])
+    assert "spoil_child" in privs
+    assert granted_by["spoil_child"] == r.spoil_child_to_2_grandparents
+    for priv in rs.privileges():
+        assert (priv in privs) == bool(rs.authorize([p.grandma_carol, p.grandpa_carl], priv))
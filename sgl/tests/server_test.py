@@ -0,0 +1,222 @@
+import asyncio
+import json
+
+import pytest
+
+from ..api import satisfies
+from ..dbc import PreconditionViolation
+from ..ruleset import RuleSet
+from ..server import AuthorizationServer, load_rules, _run
+from ..client import AuthorizationClient
+from ..loadgen import make_requests, run
+from .examples import *
+
+
+def _serve(test, rulesets=None, **kwargs):
+    """
+    Run test(server, client) against a server listening on an OS-chosen localhost port.
+    """
+    async def go():
+        server = AuthorizationServer(rulesets or RuleSet(r.objs), **kwargs)
+        listener = await server.start_tcp()
+        port = listener.sockets[0].getsockname()[1]
+        try:
+            async with AuthorizationClient(port=port, pool_size=2) as client:
+                return await test(server, client)
+        finally:
+            await server.close()
+    return _run(go())
+
+
+def test_server_authorizes():
+    async def test(server, client):
+        assert await client.authorize(p.bob, "enter")
+        assert await client.authorize([p.grandma_carol, p.grandpa_carl], "spoil_child")
+        assert not await client.authorize(p.grandma_carol, "spoil_child")
+        assert not await client.authorize(p.bob, "fly")
+        response = await client.request({"group": p.bob_dict, "priv": "enter"})
+        assert response["rule"] == r.enter_to_bob.to_dict()
+    _serve(test)
+
+
+def test_server_checks_conditions():
+    async def test(server, client):
+        for group in [[x] for x in p.objs] + [p.objs]:
+            for condition in c.objs:
+                for disjoint in [True, False]:
+                    assert await client.satisfies(group, condition, disjoint) == satisfies(group, condition, disjoint)
+    _serve(test)
+
+
+def test_server_coalesces_identical_requests():
+    async def test(server, client):
+        results = await asyncio.gather(*[client.authorize(p.employee, "enter") for i in range(50)])
+        assert all(results)
+        return server.stats
+    stats = _serve(test, batch_window=0.05)
+    assert stats["requests"] == 50
+    assert stats["coalesced"] + stats["evaluated"] == 50
+    assert stats["evaluated"] < 50
+
+
+def test_server_batches_distinct_requests():
+    async def test(server, client):
+        groups = [[x] for x in p.objs]
+        results = await asyncio.gather(*[client.satisfies(g, c.trusted, False) for g in groups])
+        assert results == [satisfies(g, c.trusted, False) for g in groups]
+        return server.stats
+    stats = _serve(test, batch_window=0.05)
+    assert stats["batches"] < stats["evaluated"]
+
+
+def test_server_reports_errors_and_keeps_going():
+    async def test(server, client):
+        with pytest.raises(PreconditionViolation):
+            await client.request({"group": p.bob_dict})
+        with pytest.raises(PreconditionViolation):
+            await client.request({"group": p.bob_dict, "priv": "enter", "ruleset": "nope"})
+        assert await client.authorize(p.bob, "enter")
+        return server.stats
+    assert _serve(test)["errors"] == 2
+
+
+def test_server_over_unix_socket(tmp_path):
+    path = str(tmp_path / "sgl.sock")
+
+    async def go():
+        server = AuthorizationServer({"default": RuleSet(r.objs)})
+        await server.start_unix(path)
+        try:
+            async with AuthorizationClient(path) as client:
+                return await client.authorize(p.bob, "enter", ruleset="default")
+        finally:
+            await server.close()
+    assert _run(go())
+
+
+def test_server_answers_large_groups():
+    async def test(server, client):
+        group = [{"id": f"u{i}", "roles": ["employee"]} for i in range(3000)]
+        assert await client.satisfies(group, {"roles": "employee", "n": 3000})
+        assert not await client.satisfies(group, {"roles": "employee", "n": 3001})
+    _serve(test)
+
+
+def _exchange(lines: list, **kwargs) -> list:
+    """
+    Write raw request lines to a server in one go, and return its responses, in order of id.
+    """
+    async def go():
+        server = AuthorizationServer(RuleSet(r.objs), **kwargs)
+        listener = await server.start_tcp()
+        port = listener.sockets[0].getsockname()[1]
+        try:
+            reader, writer = await asyncio.open_connection("127.0.0.1", port)
+            writer.write("".join(line + "\n" for line in lines).encode("utf-8"))
+            answers = [json.loads(await reader.readline()) for line in lines]
+            writer.close()
+            return sorted(answers, key=lambda x: -1 if x["id"] is None else x["id"])
+        finally:
+            await server.close()
+    return _run(go())
+
+
+def test_server_rejects_oversized_lines_and_keeps_going():
+    big = json.dumps({"id": 1, "group": [p.bob_dict] * 100, "priv": "enter"})
+    small = json.dumps({"id": 2, "group": p.bob_dict, "priv": "enter"})
+    oversized, answered = _exchange([big, small], max_request_size=1000)
+    assert oversized["id"] is None and "longer than 1000" in oversized["error"]
+    assert answered == {"id": 2, "granted": True, "rule": r.enter_to_bob.to_dict()}
+
+
+def test_server_answers_unexpected_errors():
+    for depth in [400, 700, 2000]:
+        deep = '{"all": [' * depth + '{"id": "Bob"}' + ']}' * depth
+        lines = ['{"id": 1, "group": {"id": "Bob"}, "condition": ' + deep + '}',
+                 json.dumps({"id": 2, "group": p.bob_dict, "priv": "enter"})]
+        first, answered = _exchange(lines)
+        if depth == 400:
+            assert first == {"id": 1, "result": True}
+        else:
+            # Too deep to parse or to evaluate; either way, it gets an answer.
+            assert "error" in first
+        assert answered["granted"]
+
+
+class _BrokenRuleSet(RuleSet):
+    def authorize(self, group, priv, disjoint=True):
+        raise RuntimeError("boom")
+
+
+def test_server_answers_when_evaluation_fails():
+    async def test(server, client):
+        broken = client.request({"group": p.bob_dict, "priv": "enter", "ruleset": "broken"})
+        results = await asyncio.gather(broken, client.authorize(p.bob, "enter", ruleset="default"),
+                                       return_exceptions=True)
+        assert isinstance(results[0], PreconditionViolation) and "boom" in str(results[0])
+        assert results[1] is True
+        return server.stats
+    stats = _serve(test, {"default": RuleSet(r.objs), "broken": _BrokenRuleSet(r.objs)}, batch_window=0.05)
+    assert stats["errors"] == 1
+    assert stats["batches"] == 1
+
+
+class _RejectingRuleSet(RuleSet):
+    def authorize(self, group, priv, disjoint=True):
+        raise PreconditionViolation("rejected")
+
+
+def test_server_answers_the_rest_of_a_batch_when_one_request_is_rejected():
+    async def test(server, client):
+        results = await asyncio.gather(
+            client.authorize(p.bob, "enter", ruleset="default"),
+            client.request({"group": p.bob_dict, "priv": "enter", "ruleset": "rejecting"}),
+            client.satisfies(p.bob, c.bob),
+            return_exceptions=True)
+        assert results[0] is True
+        assert isinstance(results[1], PreconditionViolation) and "rejected" in str(results[1])
+        assert results[2] is True
+        return server.stats
+    stats = _serve(test, {"default": RuleSet(r.objs), "rejecting": _RejectingRuleSet(r.objs)}, batch_window=0.05)
+    assert stats["errors"] == 1
+    assert stats["batches"] == 1
+
+
+def test_client_fails_requests_on_errors_without_an_id():
+    async def test(server, client):
+        with pytest.raises(PreconditionViolation, match="longer than 1000"):
+            await asyncio.wait_for(client.authorize([p.bob] * 100, "enter"), 5)
+        assert await client.authorize(p.bob, "enter")
+    _serve(test, max_request_size=1000)
+
+
+def test_client_times_out():
+    async def go():
+        # A server that reads requests and never answers them.
+        async def ignore(reader, writer):
+            await reader.read()
+        listener = await asyncio.start_server(ignore, "127.0.0.1", 0)
+        port = listener.sockets[0].getsockname()[1]
+        try:
+            async with AuthorizationClient(port=port, timeout=0.1) as client:
+                with pytest.raises(asyncio.TimeoutError):
+                    await client.authorize(p.bob, "enter")
+        finally:
+            listener.close()
+            await listener.wait_closed()
+    _run(go())
+
+
+def test_loadgen(tmp_path):
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps(r.dicts))
+    rules = load_rules(str(path))
+    assert rules == r.objs
+    requests = make_requests(rules, 200, seed=1, distinct=20)
+
+    async def test(server, client):
+        return await run(client, requests, concurrency=8)
+    stats = _serve(test)
+    assert stats["requests"] == 200
+    assert stats["granted"] + stats["denied"] == 200
+    assert stats["p50_ms"] <= stats["max_ms"]
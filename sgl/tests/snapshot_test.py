@@ -0,0 +1,108 @@
+import json
+import os
+import random
+
+import pytest
+
+from ..dbc import PreconditionViolation
+from ..principal import Principal
+from ..ruleset import RuleSet
+from ..snapshot import Snapshot, load_snapshot, write_snapshot
+from .examples import *
+from .randomized import random_condition, random_group
+
+
+def _random_rules(rand, count):
+    from ..rule import Rule
+    return [Rule(rand.sample(["read", "write", "admin", "délete"], rand.randint(1, 2)), random_condition(rand))
+            for i in range(count)]
+
+
+def test_matches_ruleset(tmp_path):
+    rand = random.Random(24)
+    rules = _random_rules(rand, 60) + r.objs
+    path = str(tmp_path / "rules.snapshot")
+    write_snapshot(rules, path)
+    ruleset = RuleSet(rules)
+    with Snapshot(path) as snapshot:
+        assert len(snapshot) == len(rules)
+        assert list(snapshot) == rules
+        assert snapshot.privileges() == ruleset.privileges()
+        for priv in ruleset.privileges() + ["nothing"]:
+            assert snapshot.candidates(priv) == ruleset.candidates(priv)
+        for i in range(50):
+            group = random_group(rand)
+            for priv in ruleset.privileges():
+                for disjoint in [True, False]:
+                    assert snapshot.authorize(group, priv, disjoint) == ruleset.authorize(group, priv, disjoint)
+            assert snapshot.effective_privileges(group) == ruleset.effective_privileges(group)
+
+
+def test_rules_are_built_lazily(tmp_path):
+    path = str(tmp_path / "rules.snapshot")
+    write_snapshot(r.dicts, path)
+    snapshot = Snapshot(path)
+    assert not snapshot._compiled
+    grant = r.objs[0].privs[0]
+    snapshot.authorize(Principal(id="nobody"), grant)
+    assert 0 < len(snapshot._compiled) < len(r.objs)
+    rule = snapshot.rule(0)
+    snapshot.close()
+    assert rule == r.objs[0]
+
+
+def test_damage_is_detected(tmp_path):
+    path = tmp_path / "rules.snapshot"
+    write_snapshot(r.objs, str(path))
+    data = bytearray(path.read_bytes())
+    data[-1] ^= 0xff
+    path.write_bytes(bytes(data))
+    with pytest.raises(PreconditionViolation):
+        Snapshot(str(path))
+    Snapshot(str(path), verify=False).close()
+    path.write_bytes(b"[]")
+    with pytest.raises(PreconditionViolation):
+        Snapshot(str(path))
+    path.write_bytes(b"SGLs\x02" + bytes(200))
+    with pytest.raises(PreconditionViolation):
+        Snapshot(str(path))
+
+
+def test_load_snapshot_rebuilds_when_needed(tmp_path):
+    source = tmp_path / "rules.json"
+    path = str(tmp_path / "rules.snapshot")
+    source.write_text(json.dumps(r.dicts))
+    with pytest.raises(PreconditionViolation):
+        load_snapshot(path)
+    snapshot = load_snapshot(path, str(source))
+    assert list(snapshot) == r.objs
+    assert not snapshot.is_stale(str(source))
+    snapshot.close()
+    written = os.stat(path).st_mtime_ns
+
+    # Unchanged source: the snapshot is used as it is.
+    load_snapshot(path, str(source)).close()
+    assert os.stat(path).st_mtime_ns == written
+
+    # Changed source: rebuilt.
+    source.write_text("".join(json.dumps(x) + "\n" for x in r.dicts[:2]))
+    snapshot = load_snapshot(path, str(source))
+    assert list(snapshot) == r.objs[:2]
+    snapshot.close()
+
+    # Damaged snapshot: rebuilt.
+    with open(path, "r+b") as f:
+        f.seek(-1, 2)
+        f.write(b"\xff")
+    with load_snapshot(path, str(source)) as snapshot:
+        assert list(snapshot) == r.objs[:2]
+
+
+def test_server_accepts_a_snapshot(tmp_path):
+    from ..server import AuthorizationServer
+    path = str(tmp_path / "rules.snapshot")
+    write_snapshot(r.objs, path)
+    with Snapshot(path) as snapshot:
+        server = AuthorizationServer(snapshot)
+        group = [Principal.from_dict(x) for x in p.dicts]
+        assert server._ruleset(None).authorize(group, r.objs[0].privs[0]) is not None
@@ -0,0 +1,106 @@
+import io
+import json
+
+import pytest
+
+from .. import stream
+from ..api import satisfies
+from ..dbc import PreconditionViolation
+from ..principal import Principal
+from ..stream import Decision, StreamError, iter_decisions, iter_principals, iter_rules, iter_values
+from .examples import *
+
+
+def _jsonl(values):
+    return "".join(json.dumps(x) + "\n" for x in values)
+
+
+def test_rules_from_jsonl():
+    rules = list(iter_rules(io.StringIO(_jsonl(r.dicts))))
+    assert rules == r.objs
+
+
+def test_rules_from_array_file(tmp_path):
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps(r.dicts, indent=2))
+    assert list(iter_rules(str(path))) == r.objs
+    with open(path, "rb") as f:
+        assert list(iter_rules(f)) == r.objs
+
+
+def test_large_array_is_read_incrementally(monkeypatch):
+    monkeypatch.setattr(stream, "CHUNK_SIZE", 7)
+    text = json.dumps(p.dicts * 20)
+    principals = list(iter_principals(io.StringIO(text), format="array"))
+    assert [x.key() for x in principals] == [x.key() for x in p.objs * 20]
+
+
+def test_errors_do_not_abort_the_stream():
+    text = _jsonl(r.dicts[:1]) + "{not json\n" + '{"grant": ["x"], "when": {}}\n' + "\n" + _jsonl(r.dicts[1:2])
+    items = list(iter_rules(io.StringIO(text)))
+    assert items[0] == r.objs[0]
+    assert isinstance(items[1], StreamError) and items[1].position == 2
+    assert isinstance(items[2], StreamError) and items[2].position == 3
+    assert items[3] == r.objs[1]
+    assert list(iter_rules(io.StringIO(text), errors="skip")) == r.objs[:2]
+    with pytest.raises(PreconditionViolation):
+        list(iter_rules(io.StringIO(text), errors="raise"))
+
+
+def test_array_syntax_errors_end_the_stream():
+    values = list(iter_values(io.StringIO('[{"id": "a"}, {"id": "b"}, {oops}, {"id": "c"}]')))
+    assert [v for i, v in values[:2]] == [{"id": "a"}, {"id": "b"}]
+    assert isinstance(values[2][1], StreamError)
+    assert len(values) == 3
+    unterminated = list(iter_values(io.StringIO('[{"id": "a"}, ')))
+    assert isinstance(unterminated[-1][1], StreamError)
+    assert list(iter_values(io.StringIO("[ ]"))) == []
+    assert list(iter_values(io.StringIO(""))) == []
+
+
+def test_array_scalars_split_across_chunks(monkeypatch):
+    values = [1234, 5678, -1.5e10, True, None, "abcd", [12345], {"n": 98765}]
+    text = json.dumps(values)
+    for size in range(1, 9):
+        monkeypatch.setattr(stream, "CHUNK_SIZE", size)
+        assert [v for i, v in iter_values(io.StringIO(text), format="array")] == values
+        assert [v for i, v in iter_values(io.StringIO("[1234]"), format="array")] == [1234]
+
+
+def test_array_elements_need_commas(monkeypatch):
+    monkeypatch.setattr(stream, "CHUNK_SIZE", 4)
+    for text in ['[{"a": 1} {"b": 2}]', '[1 2]', '[1,,2]', '[1, 2,]', '[, 1]', '[12x]']:
+        values = list(iter_values(io.StringIO(text), format="array"))
+        assert isinstance(values[-1][1], StreamError), text
+        assert all(not isinstance(v, StreamError) for i, v in values[:-1])
+    assert [v for i, v in iter_values(io.StringIO('[1 , 2\n,3 ]'), format="array")] == [1, 2, 3]
+
+
+def test_decisions():
+    requests = []
+    for group in [[x] for x in p.dicts] + [p.dicts]:
+        for rule in r.dicts:
+            requests.append({"group": group, "rule": rule})
+    requests.append({"group": p.bob_dict, "condition": c.bob_dict, "disjoint": False})
+    requests.append({"group": [], "rule": r.dicts[0]})
+    decisions = list(iter_decisions(io.StringIO(_jsonl(requests))))
+    assert len(decisions) == len(requests)
+    for decision in decisions[:-1]:
+        assert isinstance(decision, Decision)
+        request = decision.request
+        group = request["group"]
+        assert decision.result == satisfies([Principal.from_dict(x) for x in group] if isinstance(group, list)
+                                            else group, request.get("rule") or request["condition"],
+                                            request.get("disjoint", True))
+    assert isinstance(decisions[-1], StreamError)
+    assert decisions[-1].position == len(requests)
+
+
+def test_decisions_reject_conditions_they_have_seen_a_valid_form_of():
+    requests = [{"group": p.bob_dict, "condition": {"id": "Bob"}},
+                {"group": p.bob_dict, "condition": {"id": "Bob", "op": "!="}}]
+    decisions = list(iter_decisions(io.StringIO(_jsonl(requests))))
+    assert decisions[0].result
+    assert isinstance(decisions[1], StreamError)
+    assert "op" in decisions[1].message
+
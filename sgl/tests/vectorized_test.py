@@ -0,0 +1,58 @@
+import random
+
+import pytest
+
+numpy = pytest.importorskip("numpy")
+
+from ..api import satisfies
+from ..condition import Condition
+from ..principal import Principal
+from ..vectorized import Directory
+from .examples import *
+from .randomized import random_condition, random_group
+
+
+def test_directory_agrees_with_satisfies():
+    directory = Directory(p.objs)
+    conditions = c.objs + r.objs + [
+        Condition(all=[c.grandparent]),
+        Condition(any=[c.grandparent, c.sibling, c.bob]),
+        Condition(any=[c.grandparent, c.sibling], n=2),
+    ]
+    for x in conditions:
+        for disjoint in [True, False]:
+            expected = [satisfies(q, x, disjoint) for q in p.objs]
+            assert directory.mask(x, disjoint).tolist() == expected
+
+
+def test_directory_agrees_with_satisfies_randomly():
+    rand = random.Random(3)
+    principals = random_group(rand) + random_group(rand) + random_group(rand)
+    directory = Directory(principals)
+    for trial in range(300):
+        x = random_condition(rand)
+        for disjoint in [True, False]:
+            expected = [satisfies(q, x, disjoint) for q in principals]
+            assert directory.mask(x, disjoint).tolist() == expected
+
+
+def test_directory_accepts_any_condition_form():
+    directory = Directory([p.bob, p.grandma_carol, {"roles": ["grandparent"]}])
+    assert directory.indices(c.grandparent).tolist() == [1, 2]
+    assert directory.indices({"grant": ["x"], "when": {"id": "Bob"}}).tolist() == [0]
+    assert directory.indices(r.three_privs_to_grandparent.compile()).tolist() == [1, 2]
+    assert directory.select({"roles": "grandparent"}) == [p.grandma_carol, directory.principals[2]]
+
+
+def test_directory_handles_unknown_roles_and_ids():
+    directory = Directory([p.bob])
+    assert not directory.mask(Condition(roles="nobody")).any()
+    assert not directory.mask(Condition(id="nobody")).any()
+
+
+def test_directory_scales():
+    principals = [Principal(id="u%d" % i, roles=["r%d" % (i % 50), "r%d" % (i % 7)]) for i in range(50000)]
+    directory = Directory(principals)
+    x = Condition.from_dict({"any": [{"roles": "r3"}, {"all": [{"roles": "r1"}, {"roles": "r10"}]}]})
+    mask = directory.mask(x, disjoint=False)
+    assert mask.sum() == sum(1 for q in principals if "r3" in q.roles or ("r1" in q.roles and "r10" in q.roles))
@@ -0,0 +1,164 @@
+from typing import List, Sequence, Union
+
+# numpy is an optional dependency (pip install sgl[vectorized]); only this module needs it.
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from .dbc import *
+from .principal import Principal
+from .rule import Rule
+from .condition import Condition
+from .compiled import CompiledCondition
+from .api import _normalize_condition
+from .properties import _is_number
+
+_NUMERIC_OPS = {"<": "__lt__", ">": "__gt__", "<=": "__le__", ">=": "__ge__"}
+
+
+def _require_numpy():
+    precondition(numpy is not None, 'sgl.vectorized requires numpy; install it with "pip install numpy".')
+
+
+class Directory:
+    """
+    A directory of principals encoded for vectorized evaluation: a boolean role matrix with one row
+    per role and one column per principal, plus an index from ids to the principals that have them.
+    Encoding costs one pass over the principals; every evaluation after that is a handful of numpy
+    operations over whole rows. Custom properties are encoded the first time a condition tests
+    them: numeric comparisons against a column of numbers, other tests one principal at a time.
+    Each principal is evaluated as a group of one, which answers questions like "which users can
+    see this?" over millions of principals in one call.
+    """
+
+    def __init__(self, principals: Sequence[Union[Principal, dict]]):
+        _require_numpy()
+        self.principals = [Principal.from_dict(x) if isinstance(x, dict) else x for x in principals]
+        precondition_nonempty_sequence_of_x(self.principals, "principals", Principal)
+        size = len(self.principals)
+        roles = sorted({role for p in self.principals if p.roles for role in p.roles})
+        self.role_rows = {role: i for i, role in enumerate(roles)}
+        self.role_matrix = numpy.zeros((len(roles), size), dtype=bool)
+        rows, columns = [], []
+        ids = {}
+        for column, p in enumerate(self.principals):
+            if p.roles:
+                for role in p.roles:
+                    rows.append(self.role_rows[role])
+                    columns.append(column)
+            if p.id:
+                ids.setdefault(p.id, []).append(column)
+        self.role_matrix[rows, columns] = True
+        self._id_columns = {id: numpy.array(columns, dtype=numpy.intp) for id, columns in ids.items()}
+        self._numbers = {}
+        self._prop_rows = {}
+
+    def __len__(self):
+        return len(self.principals)
+
+    def _false(self):
+        return numpy.zeros(len(self.principals), dtype=bool)
+
+    def _number_column(self, prop: str):
+        """
+        Return the value of a property for every principal as a float array, with the size of a
+        set-valued property in place of the set, and NaN (which compares false) where a principal
+        has no number.
+        """
+        column = self._numbers.get(prop)
+        if column is None:
+            nan = float("nan")
+
+            def number(p):
+                layout = p._layout
+                i = layout.get(prop) if layout is not None else None
+                if i is None:
+                    return nan
+                x = p._values[i]
+                if isinstance(x, frozenset):
+                    return len(x)
+                return x if _is_number(x) else nan
+            column = self._numbers[prop] = numpy.fromiter(map(number, self.principals), dtype=float,
+                                                          count=len(self.principals))
+        return column
+
+    def _prop_row(self, c: Condition):
+        row = self._prop_rows.get(c)
+        if row is None:
+            if c.op in _NUMERIC_OPS and _is_number(c.value):
+                row = getattr(self._number_column(c.prop), _NUMERIC_OPS[c.op])(c.value)
+            else:
+                row = numpy.fromiter(map(c.test(), self.principals), dtype=bool, count=len(self.principals))
+            self._prop_rows[c] = row
+        return row
+
+    def _leaf(self, c: Condition):
+        if c.prop:
+            # A single principal can't be n > 1 principals that pass the test.
+            return self._prop_row(c).copy() if c.n == 1 else self._false()
+        if c.id:
+            mask = self._false()
+            columns = self._id_columns.get(c.id)
+            if columns is not None:
+                mask[columns] = True
+            return mask
+        row = self.role_rows.get(c.roles)
+        # A single principal can't be n > 1 holders of a role.
+        if row is None or c.n > 1:
+            return self._false()
+        return self.role_matrix[row].copy()
+
+    def _count(self, masks: List, n: int):
+        counts = numpy.zeros(len(self.principals), dtype=numpy.int32)
+        for mask in masks:
+            counts += mask
+        return counts >= n
+
+    def _overlapping(self, c: Condition):
+        """
+        Vectorized equivalent of _check_satisfies(..., disjoint=False) for one-principal groups.
+        """
+        if c.id or c.roles or c.prop:
+            return self._leaf(c)
+        if c.any:
+            return self._count([self._overlapping(x) for x in c.any], c.n)
+        mask = self._overlapping(c.all[0])
+        for x in c.all[1:]:
+            mask &= self._overlapping(x)
+        return mask
+
+    def _disjoint(self, c: Condition):
+        """
+        Vectorized equivalent of the disjoint subset search for one-principal groups. An "all" of
+        two or more subconditions needs at least two distinct principals, so it never matches.
+        """
+        if c.id or c.roles or c.prop:
+            return self._leaf(c)
+        if c.any:
+            return self._count([self._disjoint(x) for x in c.any], c.n)
+        if len(c.all) == 1:
+            return self._disjoint(c.all[0])
+        return self._false()
+
+    def mask(self, condition: Union[Rule, Condition, CompiledCondition, dict], disjoint=True):
+        """
+        Return a numpy bool array telling, for each principal, whether it satisfies the condition
+        on its own -- the same answer as satisfies(principal, condition, disjoint).
+        """
+        if isinstance(condition, CompiledCondition):
+            condition = condition.condition
+        condition = _normalize_condition(condition)
+        if disjoint and condition.all:
+            return self._disjoint(condition)
+        return self._overlapping(condition)
+
+    def indices(self, condition: Union[Rule, Condition, CompiledCondition, dict], disjoint=True):
+        """
+        Return the positions of the principals that satisfy the condition on their own.
+        """
+        return numpy.flatnonzero(self.mask(condition, disjoint))
+
+    def select(self, condition: Union[Rule, Condition, CompiledCondition, dict], disjoint=True) -> List[Principal]:
+        principals = self.principals
+        return [principals[i] for i in self.indices(condition, disjoint)]